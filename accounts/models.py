@@ -62,6 +62,9 @@ class AuditLog(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='audit_log_timestamp_seek'),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.action} - {self.model_name} - {self.timestamp}"
@@ -1,14 +1,14 @@
 from django.contrib import admin
-from .models import AILog, AIConfig
+from .models import AILog, AIConfig, AIJob
 
 
 @admin.register(AILog)
 class AILogAdmin(admin.ModelAdmin):
-    list_display = ['action', 'user', 'status', 'tokens_used', 'response_time_ms', 'created_at']
-    list_filter = ['action', 'status', 'created_at']
+    list_display = ['action', 'user', 'status', 'cache_status', 'tokens_used', 'response_time_ms', 'created_at']
+    list_filter = ['action', 'status', 'cache_status', 'created_at']
     search_fields = ['user__username', 'input_summary', 'output_summary']
     readonly_fields = ['user', 'action', 'status', 'input_summary', 'output_summary', 
-                       'tokens_used', 'response_time_ms', 'error_message', 'created_at']
+                       'tokens_used', 'response_time_ms', 'error_message', 'cache_status', 'created_at']
     ordering = ['-created_at']
     date_hierarchy = 'created_at'
 
@@ -45,3 +45,14 @@ class AIConfigAdmin(admin.ModelAdmin):
     
     def has_delete_permission(self, request, obj=None):
         return False
+
+
+@admin.register(AIJob)
+class AIJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'user', 'reference', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status', 'created_at']
+    search_fields = ['user__username', 'reference', 'error']
+    readonly_fields = ['kind', 'status', 'payload', 'result', 'error', 'reference', 'attempts',
+                       'user', 'created_at', 'started_at', 'finished_at']
+    ordering = ['-created_at']
+    date_hierarchy = 'created_at'
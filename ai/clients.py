@@ -0,0 +1,76 @@
+"""
+Process-wide Gemini clients.
+
+Building a ``genai.Client`` per call meant a new HTTP connection pool, and so a
+new TLS handshake, for every AI request. Clients are now created once per API
+key and kept for the life of the process, each over a keep-alive ``httpx``
+pool that is safe to share between threads. Callers take a lightweight
+``ModelClient`` bound to one model from ``for_model()``; it holds no
+connections of its own.
+"""
+import os
+import threading
+
+import httpx
+from google import genai
+from google.genai import types
+
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 300
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _api_key():
+    return os.environ.get('GEMINI_API_KEY')
+
+
+def get_client(api_key=None):
+    """The shared ``genai.Client`` for ``api_key`` (default: ``GEMINI_API_KEY``), or None without a key."""
+    api_key = api_key or _api_key()
+    if not api_key:
+        return None
+    client = _clients.get(api_key)
+    if client is None:
+        with _lock:
+            client = _clients.get(api_key)
+            if client is None:
+                http = httpx.Client(limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ))
+                client = genai.Client(api_key=api_key, http_options=types.HttpOptions(httpx_client=http))
+                _clients[api_key] = client
+    return client
+
+
+class ModelClient:
+    """A per-request handle on the shared client for one model."""
+
+    def __init__(self, client, model):
+        self._client = client
+        self.model = model
+
+    def generate_content(self, contents, config=None):
+        return self._client.models.generate_content(model=self.model, contents=contents, config=config)
+
+    def generate_content_stream(self, contents, config=None):
+        return self._client.models.generate_content_stream(model=self.model, contents=contents, config=config)
+
+
+def for_model(model, api_key=None):
+    """A ``ModelClient`` for ``model``, or None if no API key is configured."""
+    client = get_client(api_key)
+    return ModelClient(client, model) if client else None
+
+
+def reset():
+    """Close and forget every shared client (e.g. after rotating the API key)."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
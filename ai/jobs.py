@@ -0,0 +1,126 @@
+"""
+Database-backed queue for AI jobs.
+
+A model call takes seconds, so views no longer make it inline. They gather
+what the prompt needs from the database, ``enqueue()`` an ``AIJob`` and answer
+straight away with a status URL that the page polls (``ai:job_status``). The
+``run_ai_worker`` command runs the jobs. Workers claim the oldest queued job
+with ``SELECT ... FOR UPDATE SKIP LOCKED`` followed by a conditional update,
+so any number of them can run side by side with no broker. A job left
+``running`` by a worker that died is claimed again after ``STALE_AFTER``, up
+to ``MAX_ATTEMPTS`` times, and then marked failed.
+
+Handlers are looked up by kind in ``HANDLERS``. Each takes the job's JSON
+payload and user and returns a JSON-serialisable result. Other slow work that
+must stay off the web workers, such as PDF reports, uses the same queue.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+STALE_AFTER = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+
+HANDLERS = {
+    'medical_summary': 'ai.jobs.medical_summary',
+    'referral_letter': 'ai.jobs.referral_letter',
+    'dashboard_insights': 'ai.jobs.dashboard_insights',
+    'xray_analysis': 'xray.ai_analysis.analyze_study',
+    'report_render': 'management_app.reports.render_job',
+}
+
+
+def medical_summary(payload, user):
+    from .services import ai_summarize_medical_history
+    return ai_summarize_medical_history(payload['patient_data'], user=user, use_cache=payload.get('use_cache', True))
+
+
+def referral_letter(payload, user):
+    from .services import ai_draft_referral_letter
+    return ai_draft_referral_letter(payload['patient_data'], payload['referral_data'], user=user)
+
+
+def dashboard_insights(payload, user):
+    from .services import ai_generate_dashboard_insights
+    return ai_generate_dashboard_insights(payload['clinic_data'], user=user, use_cache=payload.get('use_cache', True))
+
+
+def enqueue(kind, payload, user=None, reference=''):
+    """Queue a job, or return the unfinished one already queued for ``reference``."""
+    from .models import AIJob
+
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown AI job kind: {kind}')
+    active = active_job(kind, reference) if reference else None
+    if active:
+        return active
+    return AIJob.objects.create(kind=kind, payload=payload, user=user, reference=reference)
+
+
+def active_job(kind, reference):
+    """The queued or running job of ``kind`` for ``reference``, if any."""
+    from .models import AIJob
+
+    return AIJob.objects.filter(kind=kind, reference=reference, status__in=['queued', 'running']).first()
+
+
+def latest_job(kind, reference):
+    """The most recently queued job of ``kind`` for ``reference``, if any."""
+    from .models import AIJob
+
+    return AIJob.objects.filter(kind=kind, reference=reference).order_by('-created_at', '-pk').first()
+
+
+def _claimable(now):
+    return Q(status='queued') | Q(status='running', started_at__lt=now - STALE_AFTER, attempts__lt=MAX_ATTEMPTS)
+
+
+def fail_stale():
+    """Give up on jobs whose workers died ``MAX_ATTEMPTS`` times; returns how many."""
+    from .models import AIJob
+
+    now = timezone.now()
+    return AIJob.objects.filter(
+        status='running', started_at__lt=now - STALE_AFTER, attempts__gte=MAX_ATTEMPTS,
+    ).update(status='failed', error='The job was interrupted too many times.', finished_at=now)
+
+
+def claim_next():
+    """Mark the oldest claimable job running and return it, or None if the queue is empty."""
+    from .models import AIJob
+
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            candidates = AIJob.objects.filter(_claimable(now)).order_by('created_at')
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            pk = candidates.values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            claimed = AIJob.objects.filter(_claimable(now), pk=pk).update(
+                status='running', started_at=now, attempts=F('attempts') + 1,
+            )
+        if claimed:
+            return AIJob.objects.select_related('user').get(pk=pk)
+
+
+def run(job):
+    """Run a claimed job and store its result; returns False if the handler raised."""
+    from .models import AIJob
+
+    running = AIJob.objects.filter(pk=job.pk, status='running', started_at=job.started_at)
+    try:
+        result = import_string(HANDLERS[job.kind])(job.payload, job.user)
+    except Exception as e:
+        logger.exception('AI job %s (%s) failed', job.pk, job.kind)
+        running.update(status='failed', error=str(e), finished_at=timezone.now())
+        return False
+    running.update(status='done', result=result, error='', finished_at=timezone.now())
+    return True
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ai import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued AI jobs. Start several workers to run jobs in parallel; they never pick the same job.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty instead of waiting for jobs.')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait before polling an empty queue again.')
+        parser.add_argument('--max-jobs', type=int, default=0, help='Exit after this many jobs (default: no limit).')
+
+    def handle(self, *args, **options):
+        processed = 0
+        try:
+            while not options['max_jobs'] or processed < options['max_jobs']:
+                close_old_connections()
+                jobs.fail_stale()
+                job = jobs.claim_next()
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                ok = jobs.run(job)
+                processed += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"{job.get_kind_display()} #{job.pk} {'done' if ok else 'failed'}")
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f'{processed} AI jobs processed.')
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIResponseCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('action', models.CharField(max_length=30)),
+                ('content', models.TextField()),
+                ('tokens_used', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'AI Response Cache Entry',
+                'verbose_name_plural': 'AI Response Cache',
+            },
+        ),
+        migrations.AddField(
+            model_name='ailog',
+            name='cache_status',
+            field=models.CharField(blank=True, choices=[('', 'Not cached'), ('hit', 'Cache hit'), ('miss', 'Cache miss'), ('bypass', 'Cache bypassed')], default='', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='aiconfig',
+            name='model_name',
+            field=models.CharField(default='gemini-2.5-flash', help_text='Gemini model to use', max_length=50),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0003_ai_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aijob',
+            name='kind',
+            field=models.CharField(choices=[('medical_summary', 'Medical History Summary'), ('referral_letter', 'Referral Letter'), ('dashboard_insights', 'Dashboard Insights'), ('xray_analysis', 'X-Ray Analysis'), ('report_render', 'PDF Report')], max_length=30),
+        ),
+    ]
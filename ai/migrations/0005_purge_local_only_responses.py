@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:55
+
+from django.db import migrations
+
+LOCAL_ONLY = ['triage', 'consultation_notes', 'medical_summary', 'prescription_suggestions']
+
+
+def purge(apps, schema_editor):
+    """Delete shared cache rows for actions that now stay in the per-process cache."""
+    AIResponseCache = apps.get_model('ai', 'AIResponseCache')
+    AIResponseCache.objects.filter(action__in=LOCAL_ONLY).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0004_aijob_report_render'),
+    ]
+
+    operations = [
+        migrations.RunPython(purge, migrations.RunPython.noop),
+    ]
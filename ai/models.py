@@ -25,6 +25,13 @@ class AILog(models.Model):
         ('rate_limited', 'Rate Limited'),
     ]
     
+    CACHE_STATUS_CHOICES = [
+        ('', 'Not cached'),
+        ('hit', 'Cache hit'),
+        ('miss', 'Cache miss'),
+        ('bypass', 'Cache bypassed'),
+    ]
+    
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     action = models.CharField(max_length=30, choices=ACTION_CHOICES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='success')
@@ -33,6 +40,7 @@ class AILog(models.Model):
     tokens_used = models.IntegerField(default=0)
     response_time_ms = models.IntegerField(default=0)
     error_message = models.TextField(blank=True)
+    cache_status = models.CharField(max_length=10, choices=CACHE_STATUS_CHOICES, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -73,5 +81,65 @@ class AIConfig(models.Model):
     
     @classmethod
     def get_config(cls):
-        config, created = cls.objects.get_or_create(pk=1)
-        return config
+        from clinic_management import master_data
+        return master_data.singleton('ai_config')
+
+
+class AIResponseCache(models.Model):
+    """Database tier of the AI response cache (see ``ai.response_cache``)."""
+    key = models.CharField(max_length=64, unique=True)
+    action = models.CharField(max_length=30)
+    content = models.TextField()
+    tokens_used = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'AI Response Cache Entry'
+        verbose_name_plural = 'AI Response Cache'
+
+    def __str__(self):
+        return f"{self.action} {self.key[:12]}"
+
+
+class AIJob(models.Model):
+    """An AI request queued for a worker (see ``ai.jobs``)."""
+    KIND_CHOICES = [
+        ('medical_summary', 'Medical History Summary'),
+        ('referral_letter', 'Referral Letter'),
+        ('dashboard_insights', 'Dashboard Insights'),
+        ('xray_analysis', 'X-Ray Analysis'),
+        ('report_render', 'PDF Report'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    payload = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    reference = models.CharField(max_length=50, blank=True, db_index=True, help_text='Object the job works on, e.g. xray_study:12')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+        verbose_name = 'AI Job'
+        verbose_name_plural = 'AI Jobs'
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
+    
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
@@ -0,0 +1,117 @@
+"""
+Response cache for Gemini calls.
+
+Responses are content-addressed: the key is a SHA-256 of the model, the
+normalized messages, the temperature and the token limit, so any change to
+the prompt, the data in it or the AI configuration is a different entry and
+nothing needs invalidating. Each action has its own time to live (``TTLS``,
+overridable with ``settings.AI_CACHE_TTLS``); a TTL of 0 disables caching for
+that action, e.g. free-form chat. Only complete responses (finish reason STOP)
+that the calling feature parsed successfully are stored; see
+``AIService._confirm_cache``. Entries live in a bounded per-process LRU in
+front of the ``AIResponseCache`` table, which is shared by every worker and
+survives restarts; expired rows are purged as new entries are written.
+Actions whose prompts and answers carry patient data (``LOCAL_ONLY``) are
+kept in the per-process LRU alone and never written to the table.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+LOCAL_MAX_ENTRIES = 256
+PURGE_EVERY = 100
+
+TTLS = {
+    'triage': 24 * 60 * 60,
+    'consultation_notes': 24 * 60 * 60,
+    'medical_summary': 6 * 60 * 60,
+    'referral_letter': 0,
+    'stock_suggestion': 60 * 60,
+    'dashboard_insight': 15 * 60,
+    'assistant': 0,
+    'revenue_forecast': 60 * 60,
+    'anomaly_detection': 15 * 60,
+    'prescription_suggestions': 60 * 60,
+}
+
+LOCAL_ONLY = {'triage', 'consultation_notes', 'medical_summary', 'prescription_suggestions'}
+
+_local = OrderedDict()
+_lock = threading.Lock()
+_writes = 0
+
+
+def ttl_for(action):
+    return getattr(settings, 'AI_CACHE_TTLS', {}).get(action, TTLS.get(action, 0))
+
+
+def make_key(model, messages, temperature, max_tokens):
+    normalized = [
+        [message.get('role', ''), ' '.join(str(message.get('content', '')).split())]
+        for message in messages
+    ]
+    payload = json.dumps([model, normalized, str(temperature), max_tokens], separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get(key, action):
+    """``(content, tokens)`` cached under ``key``, or None."""
+    from .models import AIResponseCache
+
+    with _lock:
+        entry = _local.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                _local.move_to_end(key)
+                return entry[1], entry[2]
+            del _local[key]
+
+    if action in LOCAL_ONLY:
+        return None
+    row = AIResponseCache.objects.filter(key=key, expires_at__gt=timezone.now()).values_list(
+        'content', 'tokens_used', 'expires_at',
+    ).first()
+    if row is None:
+        return None
+    content, tokens, expires_at = row
+    _remember(key, expires_at.timestamp(), content, tokens)
+    return content, tokens
+
+
+def put(key, action, content, tokens, ttl):
+    from .models import AIResponseCache
+
+    global _writes
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+    _remember(key, expires_at.timestamp(), content, tokens)
+    if action in LOCAL_ONLY:
+        return
+    AIResponseCache.objects.update_or_create(
+        key=key, defaults={'action': action, 'content': content, 'tokens_used': tokens, 'expires_at': expires_at},
+    )
+    _writes += 1
+    if _writes % PURGE_EVERY == 0:
+        AIResponseCache.objects.filter(expires_at__lte=timezone.now()).delete()
+
+
+def _remember(key, expires_at, content, tokens):
+    with _lock:
+        _local[key] = (expires_at, content, tokens)
+        _local.move_to_end(key)
+        while len(_local) > LOCAL_MAX_ENTRIES:
+            _local.popitem(last=False)
+
+
+def clear():
+    """Drop every cached response, in this process and in the database."""
+    from .models import AIResponseCache
+
+    with _lock:
+        _local.clear()
+    AIResponseCache.objects.all().delete()
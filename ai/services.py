@@ -1,17 +1,20 @@
-import os
 import time
 import json
 import logging
-from typing import Optional, Dict, Any, Tuple
-from google import genai
+from typing import Optional, Dict, Any, Iterator, Tuple
 from google.genai import types
 from django.conf import settings
+from . import clients, response_cache
 
 logger = logging.getLogger(__name__)
 
 AI_DISCLAIMER = "This is an AI-generated suggestion for clinician support only and must be reviewed by a qualified healthcare professional."
 
 
+class AIServiceError(Exception):
+    """A streamed Gemini request failed (already recorded in AILog)."""
+
+
 class AIService:
     def __init__(self):
         self.client = None
@@ -21,9 +24,7 @@ class AIService:
     def _initialize(self):
         from .models import AIConfig
         self.config = AIConfig.get_config()
-        api_key = os.environ.get('GEMINI_API_KEY')
-        if api_key:
-            self.client = genai.Client(api_key=api_key)
+        self.client = clients.for_model(self.config.model_name)
     
     def is_enabled(self, feature: str = None) -> bool:
         if not self.client:
@@ -40,7 +41,8 @@ class AIService:
             return text
         return text[:max_length] + "..."
     
-    def _clean_json_response(self, text: str) -> str:
+    @staticmethod
+    def _clean_json_response(text: str) -> str:
         """Remove markdown code blocks from JSON responses."""
         import re
         text = text.strip()
@@ -53,7 +55,7 @@ class AIService:
     
     def _log_request(self, user, action: str, input_text: str, output_text: str = "", 
                      status: str = "success", tokens: int = 0, response_time: int = 0, 
-                     error: str = ""):
+                     error: str = "", cache_status: str = ""):
         from .models import AILog
         try:
             AILog.objects.create(
@@ -64,51 +66,111 @@ class AIService:
                 output_summary=self._truncate_text(output_text),
                 tokens_used=tokens,
                 response_time_ms=response_time,
-                error_message=error
+                error_message=error,
+                cache_status=cache_status,
             )
         except Exception as e:
             logger.error(f"Failed to log AI request: {e}")
     
+    def _confirm_cache(self, meta: Dict):
+        """
+        Cache the response behind ``meta`` once the caller has parsed it. Only
+        complete responses (finish reason STOP) carry a ``cache_entry``, so a
+        truncated or blocked answer is never served again from the cache.
+        """
+        entry = meta.get("cache_entry")
+        if entry:
+            response_cache.put(*entry)
+    
+    def _cache_lookup(self, messages: list, action: str, max_tokens: int, use_cache: bool):
+        """``(key, cache_status, ttl, cached)`` for a request; ``cached`` is ``(content, tokens)`` on a hit."""
+        ttl = response_cache.ttl_for(action)
+        if not ttl:
+            return None, "", ttl, None
+        if not use_cache:
+            return None, "bypass", ttl, None
+        cache_key = response_cache.make_key(self.config.model_name, messages, self.config.temperature, max_tokens)
+        cached = response_cache.get(cache_key, action)
+        return cache_key, "hit" if cached is not None else "miss", ttl, cached
+    
+    @staticmethod
+    def _input_summary(messages: list) -> str:
+        """The last user message, cut to what AILog keeps."""
+        user_messages = [msg.get('content', '') for msg in messages if msg.get('role') == 'user']
+        return user_messages[-1][:500] if user_messages else ""
+    
+    def _build_request(self, messages: list, max_tokens: int):
+        """Gemini contents and config for ``messages``, plus the input summary to log."""
+        system_instruction = None
+        contents = []
+        for msg in messages:
+            role = msg.get('role', '')
+            content_text = msg.get('content', '')
+            
+            if role == 'system':
+                system_instruction = content_text
+            elif role == 'user':
+                contents.append(types.Content(
+                    role='user',
+                    parts=[types.Part.from_text(text=content_text)]
+                ))
+            elif role == 'assistant':
+                contents.append(types.Content(
+                    role='model',
+                    parts=[types.Part.from_text(text=content_text)]
+                ))
+        
+        config = types.GenerateContentConfig(
+            max_output_tokens=max_tokens,
+            temperature=float(self.config.temperature),
+            system_instruction=system_instruction if system_instruction else None,
+        )
+        return contents, config, self._input_summary(messages)
+    
+    def _log_error(self, user, action: str, input_summary: str, error_msg: str, start_time: float, cache_status: str):
+        status = "error"
+        if "rate" in error_msg.lower() or "quota" in error_msg.lower():
+            status = "rate_limited"
+        elif "timeout" in error_msg.lower():
+            status = "timeout"
+        
+        self._log_request(
+            user=user,
+            action=action,
+            input_text=input_summary,
+            status=status,
+            response_time=int((time.time() - start_time) * 1000),
+            error=error_msg[:500],
+            cache_status=cache_status,
+        )
+    
     def _call_gemini(self, messages: list, user=None, action: str = "assistant", 
-                     max_tokens: int = None) -> Tuple[bool, str, Dict]:
+                     max_tokens: int = None, use_cache: bool = True) -> Tuple[bool, str, Dict]:
         if not self.is_enabled():
             return False, "AI features are not enabled", {}
         
         start_time = time.time()
-        system_instruction = None
         input_summary = ""
         
-        try:
-            contents = []
-            for msg in messages:
-                role = msg.get('role', '')
-                content_text = msg.get('content', '')
-                
-                if role == 'system':
-                    system_instruction = content_text
-                elif role == 'user':
-                    contents.append(types.Content(
-                        role='user',
-                        parts=[types.Part.from_text(text=content_text)]
-                    ))
-                    input_summary = content_text[:500]
-                elif role == 'assistant':
-                    contents.append(types.Content(
-                        role='model',
-                        parts=[types.Part.from_text(text=content_text)]
-                    ))
-            
-            config = types.GenerateContentConfig(
-                max_output_tokens=max_tokens or self.config.max_tokens,
-                temperature=float(self.config.temperature),
-                system_instruction=system_instruction if system_instruction else None,
+        max_tokens = max_tokens or self.config.max_tokens
+        cache_key, cache_status, ttl, cached = self._cache_lookup(messages, action, max_tokens, use_cache)
+        if cached is not None:
+            content, tokens = cached
+            response_time = int((time.time() - start_time) * 1000)
+            self._log_request(
+                user=user,
+                action=action,
+                input_text=self._input_summary(messages),
+                output_text=content[:500],
+                response_time=response_time,
+                cache_status=cache_status,
             )
+            return True, content, {"tokens": 0, "response_time": response_time, "cached": True}
+        
+        try:
+            contents, config, input_summary = self._build_request(messages, max_tokens)
             
-            response = self.client.models.generate_content(
-                model=self.config.model_name,
-                contents=contents,
-                config=config
-            )
+            response = self.client.generate_content(contents, config=config)
             
             response_time = int((time.time() - start_time) * 1000)
             
@@ -140,41 +202,131 @@ class AIService:
             if hasattr(response, 'usage_metadata') and response.usage_metadata:
                 tokens = getattr(response.usage_metadata, 'total_token_count', 0) or 0
             
+            meta = {"tokens": tokens, "response_time": response_time, "cached": False}
+            if cache_key and content and _finish_reason(response) == types.FinishReason.STOP:
+                meta["cache_entry"] = (cache_key, action, content, tokens, ttl)
+            
             self._log_request(
                 user=user,
                 action=action,
                 input_text=input_summary,
                 output_text=content[:500] if content else "",
                 tokens=tokens,
-                response_time=response_time
+                response_time=response_time,
+                cache_status=cache_status,
             )
             
-            return True, content, {"tokens": tokens, "response_time": response_time}
+            return True, content, meta
         
         except Exception as e:
-            response_time = int((time.time() - start_time) * 1000)
             error_msg = str(e)
-            
-            status = "error"
-            if "rate" in error_msg.lower() or "quota" in error_msg.lower():
-                status = "rate_limited"
-            elif "timeout" in error_msg.lower():
-                status = "timeout"
-            
+            self._log_error(user, action, input_summary, error_msg, start_time, cache_status)
+            logger.error(f"Gemini API error: {e}")
+            return False, f"AI service error: {error_msg}", {}
+    
+    def _stream_gemini(self, messages: list, user=None, action: str = "assistant",
+                       max_tokens: int = None, use_cache: bool = True, meta: dict = None) -> Iterator[str]:
+        """
+        ``_call_gemini`` for streaming: yields the response text as Gemini generates it.
+        
+        A cached response is yielded in one piece. The AILog entry, with the final
+        token count and total latency, is written when the stream ends. Failures are
+        logged the same way and raised as ``AIServiceError``. ``meta``, if given,
+        receives the ``cache_entry`` that ``_confirm_cache`` stores.
+        """
+        if not self.is_enabled():
+            raise AIServiceError("AI features are not enabled")
+        
+        start_time = time.time()
+        max_tokens = max_tokens or self.config.max_tokens
+        cache_key, cache_status, ttl, cached = self._cache_lookup(messages, action, max_tokens, use_cache)
+        contents, config, input_summary = self._build_request(messages, max_tokens)
+        if cached is not None:
+            content = cached[0]
             self._log_request(
                 user=user,
                 action=action,
                 input_text=input_summary,
-                status=status,
-                response_time=response_time,
-                error=error_msg[:500]
+                output_text=content[:500],
+                response_time=int((time.time() - start_time) * 1000),
+                cache_status=cache_status,
             )
-            
+            yield content
+            return
+        
+        chunks = []
+        tokens = 0
+        finish_reason = None
+        try:
+            for chunk in self.client.generate_content_stream(contents, config=config):
+                usage = getattr(chunk, 'usage_metadata', None)
+                if usage and usage.total_token_count:
+                    tokens = usage.total_token_count
+                finish_reason = _finish_reason(chunk) or finish_reason
+                text = chunk.text or ""
+                if text:
+                    chunks.append(text)
+                    yield text
+        except GeneratorExit:
+            self._log_error(user, action, input_summary, "Stream closed by the client", start_time, cache_status)
+            raise
+        except Exception as e:
+            self._log_error(user, action, input_summary, str(e), start_time, cache_status)
             logger.error(f"Gemini API error: {e}")
-            return False, f"AI service error: {error_msg}", {}
+            raise AIServiceError(f"AI service error: {e}") from e
+        
+        content = "".join(chunks)
+        if meta is not None and cache_key and content and finish_reason == types.FinishReason.STOP:
+            meta["cache_entry"] = (cache_key, action, content, tokens, ttl)
+        
+        self._log_request(
+            user=user,
+            action=action,
+            input_text=input_summary,
+            output_text=content[:500],
+            tokens=tokens,
+            response_time=int((time.time() - start_time) * 1000),
+            cache_status=cache_status,
+        )
+
+
+def _finish_reason(response):
+    candidates = getattr(response, 'candidates', None)
+    return getattr(candidates[0], 'finish_reason', None) if candidates else None
 
 
-def ai_suggest_triage(complaint_text: str, user=None) -> Dict[str, Any]:
+def _json_result(response: str) -> Dict[str, Any]:
+    try:
+        result = json.loads(AIService._clean_json_response(response))
+        result["success"] = True
+        result["disclaimer"] = AI_DISCLAIMER
+        return result
+    except json.JSONDecodeError:
+        return {"success": False, "error": "Failed to parse AI response", "raw_response": response, "disclaimer": AI_DISCLAIMER}
+
+
+def _stream_result(service: AIService, messages: list, user, action: str, finish, use_cache: bool = True) -> Iterator[Tuple[str, Dict]]:
+    """
+    Yield ``("delta", {"text": ...})`` for each piece of the response as Gemini
+    generates it, then ``("done", result)``, where ``result`` is ``finish()`` of
+    the whole response: the same payload the non-streaming helper returns.
+    """
+    chunks = []
+    meta = {}
+    try:
+        for text in service._stream_gemini(messages, user, action, use_cache=use_cache, meta=meta):
+            chunks.append(text)
+            yield "delta", {"text": text}
+    except AIServiceError as e:
+        yield "done", {"success": False, "error": str(e), "disclaimer": AI_DISCLAIMER}
+        return
+    result = finish("".join(chunks))
+    if result.get("success"):
+        service._confirm_cache(meta)
+    yield "done", result
+
+
+def ai_suggest_triage(complaint_text: str, user=None, use_cache: bool = True) -> Dict[str, Any]:
     service = AIService()
     if not service.is_enabled('triage'):
         return {"success": False, "error": "Triage AI is not enabled"}
@@ -199,7 +351,7 @@ Only respond with valid JSON, no additional text."""
         {"role": "user", "content": prompt}
     ]
     
-    success, response, meta = service._call_gemini(messages, user, "triage", max_tokens=500)
+    success, response, meta = service._call_gemini(messages, user, "triage", max_tokens=500, use_cache=use_cache)
     
     if not success:
         return {"success": False, "error": response, "disclaimer": AI_DISCLAIMER}
@@ -207,17 +359,14 @@ Only respond with valid JSON, no additional text."""
     try:
         result = json.loads(service._clean_json_response(response))
         result["success"] = True
+        service._confirm_cache(meta)
         result["disclaimer"] = AI_DISCLAIMER
         return result
     except json.JSONDecodeError:
         return {"success": False, "error": "Failed to parse AI response", "raw_response": response, "disclaimer": AI_DISCLAIMER}
 
 
-def ai_structure_consultation_notes(raw_notes: str, user=None) -> Dict[str, Any]:
-    service = AIService()
-    if not service.is_enabled('consultation_notes'):
-        return {"success": False, "error": "Consultation notes AI is not enabled"}
-    
+def _consultation_notes_messages(raw_notes: str) -> list:
     prompt = f"""Structure these clinical notes into a proper medical consultation format.
 Also extract any vital signs mentioned in the notes.
 
@@ -250,22 +399,38 @@ Only respond with valid JSON. The ICD-10 codes are suggestions only."""
         {"role": "system", "content": "You are a medical documentation assistant. Structure clinical notes into standard SOAP/consultation format. Extract vital signs from the notes carefully. Suggest relevant ICD-10 codes as hints only - final coding must be done by the clinician."},
         {"role": "user", "content": prompt}
     ]
+    return messages
+
+
+def ai_structure_consultation_notes(raw_notes: str, user=None, use_cache: bool = True) -> Dict[str, Any]:
+    service = AIService()
+    if not service.is_enabled('consultation_notes'):
+        return {"success": False, "error": "Consultation notes AI is not enabled"}
     
-    success, response, meta = service._call_gemini(messages, user, "consultation_notes")
+    messages = _consultation_notes_messages(raw_notes)
+    success, response, meta = service._call_gemini(messages, user, "consultation_notes", use_cache=use_cache)
     
     if not success:
         return {"success": False, "error": response, "disclaimer": AI_DISCLAIMER}
     
-    try:
-        result = json.loads(service._clean_json_response(response))
-        result["success"] = True
-        result["disclaimer"] = AI_DISCLAIMER
-        return result
-    except json.JSONDecodeError:
-        return {"success": False, "error": "Failed to parse AI response", "raw_response": response, "disclaimer": AI_DISCLAIMER}
+    result = _json_result(response)
+    if result["success"]:
+        service._confirm_cache(meta)
+    return result
+
+
+def ai_stream_consultation_notes(raw_notes: str, user=None, use_cache: bool = True) -> Iterator[Tuple[str, Dict]]:
+    """Streaming ``ai_structure_consultation_notes``; yields events as described in ``_stream_result``."""
+    service = AIService()
+    if not service.is_enabled('consultation_notes'):
+        yield "done", {"success": False, "error": "Consultation notes AI is not enabled"}
+        return
+    
+    yield from _stream_result(service, _consultation_notes_messages(raw_notes), user, "consultation_notes",
+                              _json_result, use_cache=use_cache)
 
 
-def ai_summarize_medical_history(patient_data: Dict, user=None) -> Dict[str, Any]:
+def ai_summarize_medical_history(patient_data: Dict, user=None, use_cache: bool = True) -> Dict[str, Any]:
     service = AIService()
     if not service.is_enabled('medical_summary'):
         return {"success": False, "error": "Medical summary AI is not enabled"}
@@ -299,7 +464,7 @@ Only respond with valid JSON."""
         {"role": "user", "content": prompt}
     ]
     
-    success, response, meta = service._call_gemini(messages, user, "medical_summary")
+    success, response, meta = service._call_gemini(messages, user, "medical_summary", use_cache=use_cache)
     
     if not success:
         return {"success": False, "error": response, "disclaimer": AI_DISCLAIMER}
@@ -307,17 +472,14 @@ Only respond with valid JSON."""
     try:
         result = json.loads(service._clean_json_response(response))
         result["success"] = True
+        service._confirm_cache(meta)
         result["disclaimer"] = AI_DISCLAIMER
         return result
     except json.JSONDecodeError:
         return {"success": False, "error": "Failed to parse AI response", "raw_response": response, "disclaimer": AI_DISCLAIMER}
 
 
-def ai_draft_referral_letter(patient_data: Dict, referral_data: Dict, user=None) -> Dict[str, Any]:
-    service = AIService()
-    if not service.is_enabled('referral_letter'):
-        return {"success": False, "error": "Referral letter AI is not enabled"}
-    
+def _referral_letter_messages(patient_data: Dict, referral_data: Dict) -> list:
     prompt = f"""Draft a professional medical referral letter.
 
 Patient Information:
@@ -347,22 +509,38 @@ Only respond with valid JSON."""
         {"role": "system", "content": "You are a medical letter writing assistant. Draft professional, concise referral letters that effectively communicate patient information between healthcare providers."},
         {"role": "user", "content": prompt}
     ]
+    return messages
+
+
+def ai_draft_referral_letter(patient_data: Dict, referral_data: Dict, user=None, use_cache: bool = True) -> Dict[str, Any]:
+    service = AIService()
+    if not service.is_enabled('referral_letter'):
+        return {"success": False, "error": "Referral letter AI is not enabled"}
     
-    success, response, meta = service._call_gemini(messages, user, "referral_letter")
+    messages = _referral_letter_messages(patient_data, referral_data)
+    success, response, meta = service._call_gemini(messages, user, "referral_letter", use_cache=use_cache)
     
     if not success:
         return {"success": False, "error": response, "disclaimer": AI_DISCLAIMER}
     
-    try:
-        result = json.loads(service._clean_json_response(response))
-        result["success"] = True
-        result["disclaimer"] = AI_DISCLAIMER
-        return result
-    except json.JSONDecodeError:
-        return {"success": False, "error": "Failed to parse AI response", "raw_response": response, "disclaimer": AI_DISCLAIMER}
+    result = _json_result(response)
+    if result["success"]:
+        service._confirm_cache(meta)
+    return result
+
+
+def ai_stream_referral_letter(patient_data: Dict, referral_data: Dict, user=None, use_cache: bool = True) -> Iterator[Tuple[str, Dict]]:
+    """Streaming ``ai_draft_referral_letter``; yields events as described in ``_stream_result``."""
+    service = AIService()
+    if not service.is_enabled('referral_letter'):
+        yield "done", {"success": False, "error": "Referral letter AI is not enabled"}
+        return
+    
+    yield from _stream_result(service, _referral_letter_messages(patient_data, referral_data), user, "referral_letter",
+                              _json_result, use_cache=use_cache)
 
 
-def ai_suggest_stock_order(stock_data: list, user=None) -> Dict[str, Any]:
+def ai_suggest_stock_order(stock_data: list, user=None, use_cache: bool = True) -> Dict[str, Any]:
     service = AIService()
     if not service.is_enabled('stock_suggestion'):
         return {"success": False, "error": "Stock suggestion AI is not enabled"}
@@ -398,7 +576,7 @@ Only respond with valid JSON. Focus on items below minimum level first."""
         {"role": "user", "content": prompt}
     ]
     
-    success, response, meta = service._call_gemini(messages, user, "stock_suggestion")
+    success, response, meta = service._call_gemini(messages, user, "stock_suggestion", use_cache=use_cache)
     
     if not success:
         return {"success": False, "error": response}
@@ -406,12 +584,13 @@ Only respond with valid JSON. Focus on items below minimum level first."""
     try:
         result = json.loads(service._clean_json_response(response))
         result["success"] = True
+        service._confirm_cache(meta)
         return result
     except json.JSONDecodeError:
         return {"success": False, "error": "Failed to parse AI response", "raw_response": response}
 
 
-def ai_generate_dashboard_insights(clinic_data: Dict, user=None) -> Dict[str, Any]:
+def ai_generate_dashboard_insights(clinic_data: Dict, user=None, use_cache: bool = True) -> Dict[str, Any]:
     service = AIService()
     if not service.is_enabled('dashboard_insights'):
         return {"success": False, "error": "Dashboard insights AI is not enabled"}
@@ -447,7 +626,7 @@ Provide 3-5 most relevant insights. Only respond with valid JSON."""
         {"role": "user", "content": prompt}
     ]
     
-    success, response, meta = service._call_gemini(messages, user, "dashboard_insight", max_tokens=4096)
+    success, response, meta = service._call_gemini(messages, user, "dashboard_insight", max_tokens=4096, use_cache=use_cache)
     
     if not success:
         return {"success": False, "error": response}
@@ -459,6 +638,7 @@ Provide 3-5 most relevant insights. Only respond with valid JSON."""
         cleaned = service._clean_json_response(response)
         result = json.loads(cleaned)
         result["success"] = True
+        service._confirm_cache(meta)
         return result
     except json.JSONDecodeError as e:
         logger.error(f"Failed to parse dashboard insights response: {e}")
@@ -466,11 +646,7 @@ Provide 3-5 most relevant insights. Only respond with valid JSON."""
         return {"success": False, "error": f"Failed to parse AI response: {str(e)}", "raw_response": response[:300] if response else ""}
 
 
-def ai_chat_assistant(message: str, context: str = "", user=None) -> Dict[str, Any]:
-    service = AIService()
-    if not service.is_enabled('assistant'):
-        return {"success": False, "error": "AI Assistant is not enabled"}
-    
+def _assistant_messages(message: str, context: str = "") -> list:
     system_prompt = """You are a helpful AI assistant for a clinic management system. You can:
 1. Answer questions about how to use the system
 2. Explain features and workflows
@@ -490,16 +666,40 @@ Important rules:
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": message}
     ]
+    return messages
+
+
+def _assistant_result(response: str) -> Dict[str, Any]:
+    return {"success": True, "response": response}
+
+
+def ai_chat_assistant(message: str, context: str = "", user=None, use_cache: bool = True) -> Dict[str, Any]:
+    service = AIService()
+    if not service.is_enabled('assistant'):
+        return {"success": False, "error": "AI Assistant is not enabled"}
     
-    success, response, meta = service._call_gemini(messages, user, "assistant")
+    messages = _assistant_messages(message, context)
+    success, response, meta = service._call_gemini(messages, user, "assistant", use_cache=use_cache)
     
     if not success:
         return {"success": False, "error": response}
     
-    return {"success": True, "response": response}
+    service._confirm_cache(meta)
+    return _assistant_result(response)
+
+
+def ai_stream_chat_assistant(message: str, context: str = "", user=None, use_cache: bool = True) -> Iterator[Tuple[str, Dict]]:
+    """Streaming ``ai_chat_assistant``; yields events as described in ``_stream_result``."""
+    service = AIService()
+    if not service.is_enabled('assistant'):
+        yield "done", {"success": False, "error": "AI Assistant is not enabled"}
+        return
+    
+    yield from _stream_result(service, _assistant_messages(message, context), user, "assistant",
+                              _assistant_result, use_cache=use_cache)
 
 
-def ai_forecast_revenue(historical_data: list, days: int = 7, user=None) -> Dict[str, Any]:
+def ai_forecast_revenue(historical_data: list, days: int = 7, user=None, use_cache: bool = True) -> Dict[str, Any]:
     service = AIService()
     if not service.is_enabled('revenue_forecast'):
         return {"success": False, "error": "Revenue forecast AI is not enabled"}
@@ -531,7 +731,7 @@ Only respond with valid JSON."""
         {"role": "user", "content": prompt}
     ]
     
-    success, response, meta = service._call_gemini(messages, user, "revenue_forecast")
+    success, response, meta = service._call_gemini(messages, user, "revenue_forecast", use_cache=use_cache)
     
     if not success:
         return {"success": False, "error": response}
@@ -539,12 +739,13 @@ Only respond with valid JSON."""
     try:
         result = json.loads(service._clean_json_response(response))
         result["success"] = True
+        service._confirm_cache(meta)
         return result
     except json.JSONDecodeError:
         return {"success": False, "error": "Failed to parse AI response", "raw_response": response}
 
 
-def ai_detect_anomalies(transaction_data: list, user=None) -> Dict[str, Any]:
+def ai_detect_anomalies(transaction_data: list, user=None, use_cache: bool = True) -> Dict[str, Any]:
     service = AIService()
     if not service.is_enabled('anomaly_detection'):
         return {"success": False, "error": "Anomaly detection AI is not enabled"}
@@ -578,7 +779,7 @@ Only flag genuinely unusual patterns. Respond with valid JSON only."""
         {"role": "user", "content": prompt}
     ]
     
-    success, response, meta = service._call_gemini(messages, user, "anomaly_detection")
+    success, response, meta = service._call_gemini(messages, user, "anomaly_detection", use_cache=use_cache)
     
     if not success:
         return {"success": False, "error": response}
@@ -586,12 +787,13 @@ Only flag genuinely unusual patterns. Respond with valid JSON only."""
     try:
         result = json.loads(service._clean_json_response(response))
         result["success"] = True
+        service._confirm_cache(meta)
         return result
     except json.JSONDecodeError:
         return {"success": False, "error": "Failed to parse AI response", "raw_response": response}
 
 
-def ai_suggest_prescriptions(consultation_data: Dict, available_medicines: list, user=None) -> Dict[str, Any]:
+def ai_suggest_prescriptions(consultation_data: Dict, available_medicines: list, user=None, use_cache: bool = True) -> Dict[str, Any]:
     """Suggest prescriptions based on consultation diagnosis and available medicines."""
     service = AIService()
     if not service.is_enabled('assistant'):
@@ -616,7 +818,7 @@ Medicines: {medicines_list[:500]}
         {"role": "user", "content": prompt}
     ]
     
-    success, response, meta = service._call_gemini(messages, user, "prescription_suggestions", max_tokens=2000)
+    success, response, meta = service._call_gemini(messages, user, "prescription_suggestions", max_tokens=2000, use_cache=use_cache)
     
     if not success:
         return {"success": False, "error": response}
@@ -628,6 +830,7 @@ Medicines: {medicines_list[:500]}
         cleaned_response = service._clean_json_response(response)
         result = json.loads(cleaned_response)
         result["success"] = True
+        service._confirm_cache(meta)
         result["disclaimer"] = "AI-suggested prescriptions require clinician review. Verify dosages and check for contraindications."
         return result
     except json.JSONDecodeError as e:
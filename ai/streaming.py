@@ -0,0 +1,29 @@
+"""
+Server-sent event responses for the streaming AI endpoints.
+
+A client asks for a stream by sending ``Accept: text/event-stream``. It then
+receives ``delta`` events, each carrying the next piece of generated text as
+``{"text": ...}``, followed by one ``done`` event. The ``done`` data is the
+payload the endpoint would have returned as JSON. Proxy buffering is switched
+off so that each event reaches the browser as soon as it is written.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+def wants_stream(request):
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def encode(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def sse_response(events):
+    """Stream ``(event, data)`` pairs to the client as server-sent events."""
+    response = StreamingHttpResponse((encode(event, data) for event, data in events), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,3 +1,177 @@
-from django.test import TestCase
+import json
+from datetime import date
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import jobs, response_cache
+from .models import AIJob, AILog, AIResponseCache
+from .services import ai_suggest_triage
+
+
+def echo_handler(payload, user):
+    if payload.get('fail'):
+        raise RuntimeError('model unavailable')
+    return {'success': True, 'echo': payload['value'], 'user': user.username}
+
+
+@mock.patch.dict(jobs.HANDLERS, {'medical_summary': 'ai.tests.echo_handler'})
+class AIJobQueueTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('doc', password='pw', role='doctor')
+        self.other = User.objects.create_user('nurse', password='pw', role='nurse')
+
+    def test_worker_runs_job_and_owner_polls_result(self):
+        job = jobs.enqueue('medical_summary', {'value': 42}, user=self.user)
+        url = reverse('ai:api_job_status', args=[job.pk])
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).json()['status'], 'queued')
+
+        claimed = jobs.claim_next()
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts), (job.pk, 'running', 1))
+        self.assertIsNone(jobs.claim_next())
+        self.assertTrue(jobs.run(claimed))
+
+        data = self.client.get(url).json()
+        self.assertEqual(data['status'], 'done')
+        self.assertEqual(data['result'], {'success': True, 'echo': 42, 'user': 'doc'})
+
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_failures_and_abandoned_jobs(self):
+        failing = jobs.enqueue('medical_summary', {'fail': True}, user=self.user)
+        with self.assertLogs('ai.jobs', 'ERROR'):
+            self.assertFalse(jobs.run(jobs.claim_next()))
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.error), ('failed', 'model unavailable'))
+
+        job = jobs.enqueue('medical_summary', {'value': 1}, user=self.user, reference='patient:1')
+        self.assertEqual(jobs.enqueue('medical_summary', {'value': 2}, reference='patient:1'), job)
+        jobs.claim_next()
+        stale = timezone.now() - jobs.STALE_AFTER * 2
+        AIJob.objects.filter(pk=job.pk).update(started_at=stale)
+        self.assertEqual(jobs.claim_next().attempts, 2)
+
+        AIJob.objects.filter(pk=job.pk).update(started_at=stale, attempts=jobs.MAX_ATTEMPTS)
+        self.assertIsNone(jobs.claim_next())
+        self.assertEqual(jobs.fail_stale(), 1)
+        self.assertEqual(AIJob.objects.get(pk=job.pk).status, 'failed')
+
+
+class FakeModelClient:
+    def generate_content_stream(self, contents, config=None):
+        yield SimpleNamespace(text='{"salutation": "Dear ', usage_metadata=None)
+        yield SimpleNamespace(text='Colleague", "body": "Please see.", "closing": "Thanks"}',
+                              usage_metadata=SimpleNamespace(total_token_count=57))
+
+
+@mock.patch('ai.services.clients.for_model', return_value=FakeModelClient())
+class AIStreamingTests(TestCase):
+    def setUp(self):
+        from patients.models import Patient
+        self.user = get_user_model().objects.create_user('doc', password='pw', role='doctor')
+        self.patient = Patient.objects.create(
+            patient_id='P0001', first_name='Pat', last_name='One', date_of_birth=date(1990, 1, 1),
+            gender='M', phone='0100000000', address='-',
+        )
+        self.client.force_login(self.user)
+
+    def test_referral_letter_streams_deltas_then_result(self, for_model):
+        response = self.client.post(
+            reverse('ai:api_referral_letter'), {'patient_id': self.patient.pk, 'reason': 'Review'},
+            content_type='application/json', HTTP_ACCEPT='text/event-stream',
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = [
+            (block.split('\n')[0][len('event: '):], json.loads(block.split('\n')[1][len('data: '):]))
+            for block in b''.join(response.streaming_content).decode().strip().split('\n\n')
+        ]
+        self.assertEqual([event for event, _data in events], ['delta', 'delta', 'done'])
+        self.assertEqual(events[0][1], {'text': '{"salutation": "Dear '})
+        self.assertEqual(events[-1][1]['salutation'], 'Dear Colleague')
+        self.assertTrue(events[-1][1]['success'])
+
+        log = AILog.objects.get(action='referral_letter')
+        self.assertEqual((log.status, log.tokens_used, log.user), ('success', 57, self.user))
+        self.assertFalse(AIJob.objects.exists())
+
+
+class FakeTriageClient:
+    def __init__(self, text, finish_reason='STOP'):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.calls = 0
+
+    def generate_content(self, contents, config=None):
+        self.calls += 1
+        return SimpleNamespace(
+            text=self.text, usage_metadata=SimpleNamespace(total_token_count=12),
+            candidates=[SimpleNamespace(finish_reason=self.finish_reason)],
+        )
+
+
+class ResponseCacheTests(TestCase):
+    TRIAGE = '{"urgency": "low", "suggested_department": "General Practice"}'
+
+    def setUp(self):
+        response_cache.clear()
+
+    def triage_twice(self, client):
+        with mock.patch('ai.services.clients.for_model', return_value=client):
+            return ai_suggest_triage('Mild cough'), ai_suggest_triage('Mild cough')
+
+    def test_make_key_normalises_whitespace_only(self):
+        key = response_cache.make_key('gemini', [{'role': 'user', 'content': 'Mild  cough\n today'}], 0.7, 500)
+        self.assertEqual(key, response_cache.make_key('gemini', [{'role': 'user', 'content': ' Mild cough today '}], 0.7, 500))
+        for other in (
+            response_cache.make_key('gemini', [{'role': 'system', 'content': 'Mild cough today'}], 0.7, 500),
+            response_cache.make_key('gemini', [{'role': 'user', 'content': 'mild cough today'}], 0.7, 500),
+            response_cache.make_key('gemini', [{'role': 'user', 'content': 'Mild cough today'}], 0.2, 500),
+            response_cache.make_key('gemini-pro', [{'role': 'user', 'content': 'Mild cough today'}], 0.7, 500),
+        ):
+            self.assertNotEqual(key, other)
+
+    def test_complete_parsed_response_is_served_from_cache(self):
+        client = FakeTriageClient(self.TRIAGE)
+        first, second = self.triage_twice(client)
+        self.assertEqual((first['urgency'], second['urgency'], client.calls), ('low', 'low', 1))
+        self.assertEqual(AILog.objects.filter(cache_status='hit').count(), 1)
+
+    @override_settings(AI_CACHE_TTLS={'triage': 0})
+    def test_zero_ttl_bypasses_the_cache(self):
+        client = FakeTriageClient(self.TRIAGE)
+        self.triage_twice(client)
+        self.assertEqual(client.calls, 2)
+        self.assertFalse(AIResponseCache.objects.exists())
+
+    def test_truncated_or_unparseable_responses_are_not_cached(self):
+        for client in (FakeTriageClient(self.TRIAGE, finish_reason='MAX_TOKENS'), FakeTriageClient('{"urgency": "lo')):
+            self.triage_twice(client)
+            self.assertEqual(client.calls, 2)
+        self.assertFalse(AIResponseCache.objects.exists())
+
+    @mock.patch.object(response_cache, 'LOCAL_MAX_ENTRIES', 2)
+    def test_local_tier_evicts_least_recently_used(self):
+        for key in ('a', 'b'):
+            response_cache.put(key, 'stock_suggestion', key.upper(), 1, 60)
+        self.assertEqual(response_cache.get('a', 'stock_suggestion'), ('A', 1))
+        response_cache.put('c', 'stock_suggestion', 'C', 1, 60)
+        self.assertEqual(list(response_cache._local), ['a', 'c'])
+        with self.assertNumQueries(1):
+            self.assertEqual(response_cache.get('b', 'stock_suggestion'), ('B', 1))
+
+    def test_patient_data_stays_out_of_the_shared_table(self):
+        client = FakeTriageClient(self.TRIAGE)
+        self.triage_twice(client)
+        self.assertEqual(client.calls, 1)
+        self.assertFalse(AIResponseCache.objects.exists())
+
+        response_cache._local.clear()
+        self.triage_twice(client)
+        self.assertEqual(client.calls, 2)
@@ -16,5 +16,6 @@ urlpatterns = [
     path('api/assistant/', views.api_assistant, name='api_assistant'),
     path('api/revenue-forecast/', views.api_revenue_forecast, name='api_revenue_forecast'),
     path('api/anomaly-detection/', views.api_anomaly_detection, name='api_anomaly_detection'),
+    path('api/jobs/<int:job_id>/', views.api_job_status, name='api_job_status'),
     path('api/prescription-suggestions/<int:consultation_id>/', views.api_prescription_suggestions, name='api_prescription_suggestions'),
 ]
@@ -2,23 +2,27 @@ import json
 from datetime import datetime, timedelta
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
-from django.db.models import Sum, Count, F
+from django.db.models import Sum, Count
 from django.utils import timezone
 
 from accounts.decorators import admin_required
-from .models import AILog, AIConfig
+from clinic_management import master_data
+from setup_app import inventory, medicine_resolver
+from . import jobs, streaming
+from .models import AILog, AIConfig, AIJob
 from .forms import AIConfigForm
 from .services import (
     ai_suggest_triage,
     ai_structure_consultation_notes,
-    ai_summarize_medical_history,
-    ai_draft_referral_letter,
     ai_suggest_stock_order,
-    ai_generate_dashboard_insights,
     ai_chat_assistant,
+    ai_stream_chat_assistant,
+    ai_stream_consultation_notes,
+    ai_stream_referral_letter,
     ai_forecast_revenue,
     ai_detect_anomalies,
     ai_suggest_prescriptions,
@@ -133,6 +137,9 @@ def api_structure_notes(request):
         if not raw_notes:
             return JsonResponse({'success': False, 'error': 'Raw notes are required'}, status=400)
         
+        if streaming.wants_stream(request):
+            return streaming.sse_response(ai_stream_consultation_notes(raw_notes, user=request.user))
+        
         result = ai_structure_consultation_notes(raw_notes, user=request.user)
         return JsonResponse(result)
     except json.JSONDecodeError:
@@ -141,6 +148,16 @@ def api_structure_notes(request):
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 
+def _queued(job):
+    """202 response for a queued AI job; the page polls ``status_url`` for the result."""
+    return JsonResponse({
+        'success': True,
+        'job_id': job.pk,
+        'status': job.status,
+        'status_url': reverse('ai:api_job_status', args=[job.pk]),
+    }, status=202)
+
+
 @login_required
 @require_http_methods(['GET', 'POST'])
 def api_medical_summary(request, patient_id):
@@ -192,8 +209,11 @@ def api_medical_summary(request, patient_id):
             'lab_results': labs_str,
         }
         
-        result = ai_summarize_medical_history(patient_data, user=request.user)
-        return JsonResponse(result)
+        job = jobs.enqueue('medical_summary', {
+            'patient_data': patient_data,
+            'use_cache': 'refresh' not in request.GET,
+        }, user=request.user)
+        return _queued(job)
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
@@ -232,8 +252,14 @@ def api_referral_letter(request):
             'treatment': data.get('treatment', ''),
         }
         
-        result = ai_draft_referral_letter(patient_data, referral_data, user=request.user)
-        return JsonResponse(result)
+        if streaming.wants_stream(request):
+            return streaming.sse_response(ai_stream_referral_letter(patient_data, referral_data, user=request.user))
+        
+        job = jobs.enqueue('referral_letter', {
+            'patient_data': patient_data,
+            'referral_data': referral_data,
+        }, user=request.user)
+        return _queued(job)
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
     except Exception as e:
@@ -246,19 +272,15 @@ def api_stock_suggestions(request):
     try:
         from setup_app.models import Medicine
         
-        medicines = Medicine.objects.all()
-        stock_data = []
+        medicines = inventory.low_stock_medicines()
+        if not medicines.exists():
+            medicines = Medicine.objects.filter(is_active=True).order_by('stock_quantity', 'pk')
+        stock_data = [
+            {'name': name, 'current': current, 'min_level': min_level}
+            for name, current, min_level in medicines.values_list('name', 'stock_quantity', 'minimum_stock')[:20]
+        ]
         
-        for med in medicines:
-            stock_data.append({
-                'name': med.name,
-                'current': med.stock_quantity,
-                'min_level': med.minimum_stock,
-            })
-        
-        low_stock = [item for item in stock_data if item['current'] <= item['min_level']]
-        
-        result = ai_suggest_stock_order(low_stock if low_stock else stock_data[:20], user=request.user)
+        result = ai_suggest_stock_order(stock_data, user=request.user)
         return JsonResponse(result)
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -275,28 +297,24 @@ def api_dashboard_insights(request):
         today = timezone.now().date()
         week_ago = today - timedelta(days=7)
         
-        today_visits = Visit.objects.filter(visit_date=today).count()
+        from management_app import rollups
+        days = rollups.daily_totals(week_ago, today)
         
-        week_visits = Visit.objects.filter(visit_date__gte=week_ago, visit_date__lte=today).count()
+        today_visits = days[-1]['visits']
+        
+        week_visits = sum(day['visits'] for day in days)
         avg_7day_visits = round(week_visits / 7, 1)
         
-        today_revenue = Payment.objects.filter(
-            payment_date__date=today
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        today_revenue = days[-1]['revenue']
         
-        week_revenue = Payment.objects.filter(
-            payment_date__date__gte=week_ago,
-            payment_date__date__lte=today
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        week_revenue = sum(day['revenue'] for day in days)
         avg_7day_revenue = round(float(week_revenue) / 7, 2)
         
         top_conditions = list(Consultation.objects.filter(
             visit__visit_date__gte=week_ago
         ).exclude(diagnosis='').values_list('diagnosis', flat=True)[:5])
         
-        low_stock_count = Medicine.objects.filter(
-            stock_quantity__lte=F('minimum_stock')
-        ).count()
+        low_stock_count = inventory.low_stock_medicines().count()
         
         from patients.models import Appointment
         pending_appointments = Appointment.objects.filter(
@@ -315,8 +333,11 @@ def api_dashboard_insights(request):
             'low_stock_count': low_stock_count,
         }
         
-        result = ai_generate_dashboard_insights(clinic_data, user=request.user)
-        return JsonResponse(result)
+        job = jobs.enqueue('dashboard_insights', {
+            'clinic_data': clinic_data,
+            'use_cache': 'refresh' not in request.GET,
+        }, user=request.user)
+        return _queued(job)
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
@@ -336,7 +357,13 @@ def api_assistant(request):
         
         data_response = _handle_data_query(message_lower, request.user)
         if data_response:
-            return JsonResponse({'success': True, 'response': data_response})
+            result = {'success': True, 'response': data_response}
+            if streaming.wants_stream(request):
+                return streaming.sse_response([('delta', {'text': data_response}), ('done', result)])
+            return JsonResponse(result)
+        
+        if streaming.wants_stream(request):
+            return streaming.sse_response(ai_stream_chat_assistant(message, context, user=request.user))
         
         result = ai_chat_assistant(message, context, user=request.user)
         return JsonResponse(result)
@@ -397,11 +424,7 @@ def _handle_data_query(message: str, user) -> str:
         return "\n".join(lines)
     
     if any(kw in message for kw in ['low stock', 'stock alert', 'reorder']):
-        from django.db.models import F
-        low_stock = Medicine.objects.filter(
-            stock_quantity__lte=F('minimum_stock'),
-            is_active=True
-        ).order_by('stock_quantity')[:10]
+        low_stock = inventory.low_stock_medicines()[:10]
         
         if not low_stock:
             return "No low stock items at the moment."
@@ -465,27 +488,19 @@ def _handle_data_query(message: str, user) -> str:
 @require_http_methods(['GET', 'POST'])
 def api_revenue_forecast(request):
     try:
-        from finance.models import Payment
-        from patients.models import Visit
+        from management_app import rollups
         
         today = timezone.now().date()
         start_date = today - timedelta(days=30)
         
-        historical_data = []
-        current_date = start_date
-        
-        while current_date <= today:
-            day_visits = Visit.objects.filter(visit_date=current_date).count()
-            day_revenue = Payment.objects.filter(
-                payment_date__date=current_date
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            historical_data.append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'visits': day_visits,
-                'revenue': float(day_revenue),
-            })
-            current_date += timedelta(days=1)
+        historical_data = [
+            {
+                'date': day['date'].strftime('%Y-%m-%d'),
+                'visits': day['visits'],
+                'revenue': float(day['revenue']),
+            }
+            for day in rollups.daily_totals(start_date, today)
+        ]
         
         days = int(request.GET.get('days', 7))
         result = ai_forecast_revenue(historical_data, days, user=request.user)
@@ -546,25 +561,26 @@ def api_prescription_suggestions(request, consultation_id):
             'pulse': consultation.vitals_pulse or '-',
         }
         
-        available_medicines = list(Medicine.objects.filter(is_active=True).values(
-            'id', 'name', 'generic_name', 'strength', 'form', 'selling_price'
-        ))
+        available_medicines = [
+            {'id': m.id, 'name': m.name, 'generic_name': m.generic_name, 'strength': m.strength,
+             'form': m.form, 'selling_price': m.selling_price}
+            for m in master_data.get('medicines')
+        ]
         
         result = ai_suggest_prescriptions(consultation_data, available_medicines, user=request.user)
         
         if result.get('success') and result.get('prescriptions'):
-            for rx in result['prescriptions']:
-                medicine_name = rx.get('medicine_name', '').strip()
-                if not medicine_name:
-                    continue
-                    
-                med = Medicine.objects.filter(name__iexact=medicine_name).first()
-                if not med:
-                    med = Medicine.objects.filter(name__icontains=medicine_name).first()
+            suggestions = [rx for rx in result['prescriptions'] if rx.get('medicine_name', '').strip()]
+            matches = medicine_resolver.resolve_many([rx['medicine_name'] for rx in suggestions])
+            added = {}
+            for rx, match in zip(suggestions, matches):
+                medicine_name = rx['medicine_name'].strip()
+                if not match and medicine_name.lower() in added:
+                    match = added[medicine_name.lower()]
                 
-                if med:
-                    rx['medicine_id'] = med.id
-                    rx['medicine_name'] = med.name
+                if match:
+                    rx['medicine_id'] = match.medicine_id
+                    rx['medicine_name'] = match.name
                     rx['is_new_medicine'] = False
                 else:
                     sku = f"AI-{uuid.uuid4().hex[:8].upper()}"
@@ -580,10 +596,11 @@ def api_prescription_suggestions(request, consultation_id):
                         sku=sku,
                         selling_price=0,
                         cost_price=0,
-                        stock_quantity=100,
                         minimum_stock=10,
                         is_active=True,
                     )
+                    inventory.adjust_stock(new_med, 100, request.user, 'Opening stock')
+                    added[medicine_name.lower()] = medicine_resolver.Match(new_med.id, new_med.name, 1.0)
                     rx['medicine_id'] = new_med.id
                     rx['is_new_medicine'] = True
                     rx['auto_added'] = True
@@ -593,3 +610,18 @@ def api_prescription_suggestions(request, consultation_id):
         import traceback
         traceback.print_exc()
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@login_required
+@require_http_methods(['GET'])
+def api_job_status(request, job_id):
+    job = get_object_or_404(AIJob, pk=job_id)
+    if job.user_id != request.user.pk and not request.user.is_admin_user:
+        return JsonResponse({'success': False, 'error': 'Job not found'}, status=404)
+    
+    data = {'success': True, 'job_id': job.pk, 'kind': job.kind, 'status': job.status}
+    if job.status == 'done':
+        data['result'] = job.result
+    elif job.status == 'failed':
+        data['error'] = job.error or 'The AI request failed.'
+    return JsonResponse(data)
@@ -0,0 +1,229 @@
+"""
+Master-data cache for small reference lists (doctors, panels, fees, lab tests,
+allergies, active medicines) and singleton configuration rows (AI, e-invoice
+and clinic settings) that nearly every page reads and few requests change.
+
+Reads go through two tiers: a per-process LRU and the Django cache
+(``CACHES['default']``). Keys embed a version token per source model, kept in
+that cache, so invalidation is a version bump rather than a delete:
+``post_save`` and ``post_delete`` on a source model bump its version once the
+transaction commits, and the next read misses both tiers and reloads. Tokens
+are random, so a version key the cache evicted comes back as a new token and
+can never match an older payload. Each worker re-reads the versions at most
+once per ``VERSION_CHECK_INTERVAL`` seconds, so hot reads cost no cache round
+trip (a SQL query under the database cache) and another worker's change is
+seen within that interval; the worker that made the change sees it at once.
+Datasets registered with ``shared=False`` (the AI and e-invoice settings,
+which hold API credentials) skip the shared tier and are only kept in process
+memory. Saves that touch only ``IGNORED_FIELDS`` (e.g. ``last_login`` on every
+sign-in) do not bump. Stock levels are not master data: stock movements
+(``setup_app.inventory``) change them with ``QuerySet.update()`` without a
+bump, so pages that show stock read it live. ``preload()`` fills both tiers
+when a worker boots.
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.functional import SimpleLazyObject
+
+LOCAL_MAX_ENTRIES = 64
+SHARED_TIMEOUT = 60 * 60
+VERSION_CHECK_INTERVAL = 5.0
+
+_datasets = {}
+_local = OrderedDict()
+_local_lock = threading.Lock()
+# model label -> (version token, monotonic time it was read)
+_seen = {}
+
+# Saves that update only these fields cannot change any dataset.
+IGNORED_FIELDS = {
+    'accounts.user': {'last_login'},
+}
+
+
+def register(name, *models, shared=True):
+    """
+    Register a loader for dataset ``name``, reloaded when any of ``models``
+    (app labels) changes. ``shared=False`` keeps the value out of the shared
+    cache.
+    """
+    def decorator(loader):
+        _datasets[name] = (loader, models, shared)
+        return loader
+    return decorator
+
+
+def _version_key(label):
+    return f'master_data:version:{label.lower()}'
+
+
+def _new_token():
+    return uuid.uuid4().hex
+
+
+def _versions(labels):
+    labels = [label.lower() for label in labels]
+    now = time.monotonic()
+    with _local_lock:
+        tokens = {label: _seen[label][0] for label in labels
+                  if label in _seen and now - _seen[label][1] < VERSION_CHECK_INTERVAL}
+    stale = [label for label in labels if label not in tokens]
+    if stale:
+        found = cache.get_many([_version_key(label) for label in stale])
+        for label in stale:
+            key = _version_key(label)
+            if key not in found:
+                cache.add(key, _new_token(), None)
+                found[key] = cache.get(key) or _new_token()
+            tokens[label] = found[key]
+        with _local_lock:
+            for label in stale:
+                _seen[label] = (tokens[label], now)
+    return '-'.join(tokens[label] for label in labels)
+
+
+def bump(model):
+    """Invalidate every dataset built from ``model``."""
+    label = model._meta.label.lower()
+    token = _new_token()
+    cache.set(_version_key(label), token, None)
+    with _local_lock:
+        _seen[label] = (token, time.monotonic())
+
+
+def clear_local():
+    """Drop this process's tiers, as in a freshly started worker."""
+    with _local_lock:
+        _local.clear()
+        _seen.clear()
+
+
+def get(name):
+    loader, models, shared = _datasets[name]
+    key = f'master_data:{name}:{_versions(models)}'
+    with _local_lock:
+        if key in _local:
+            _local.move_to_end(key)
+            return _local[key]
+
+    if shared:
+        wrapped = cache.get(key)
+        if wrapped is None:
+            wrapped = (loader(),)
+            cache.set(key, wrapped, SHARED_TIMEOUT)
+        value = wrapped[0]
+    else:
+        value = loader()
+
+    with _local_lock:
+        _local[key] = value
+        _local.move_to_end(key)
+        while len(_local) > LOCAL_MAX_ENTRIES:
+            _local.popitem(last=False)
+    return value
+
+
+def singleton(name):
+    """
+    A private copy of singleton dataset ``name``, so callers (e.g. a settings
+    form bound to it) can change it without touching the cached instance.
+    """
+    value = get(name)
+    return copy.copy(value) if value is not None else None
+
+
+def lazy(name):
+    """Dataset ``name``, loaded only if something (typically a template) uses it."""
+    return SimpleLazyObject(lambda: get(name))
+
+
+def preload():
+    for name in _datasets:
+        get(name)
+
+
+def set_choices(field, name):
+    """Render a model choice field's options from dataset ``name`` instead of querying on render."""
+    choices = [] if field.empty_label is None else [('', field.empty_label)]
+    field.choices = choices + [(obj.pk, field.label_from_instance(obj)) for obj in get(name)]
+
+
+def _source_changed(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= IGNORED_FIELDS.get(sender._meta.label_lower, set()):
+        return
+    transaction.on_commit(lambda: bump(sender))
+
+
+def connect_signals():
+    for label in {label for _loader, models, _shared in _datasets.values() for label in models}:
+        model = apps.get_model(label)
+        post_save.connect(_source_changed, sender=model, dispatch_uid=f'master_data_save_{label}')
+        post_delete.connect(_source_changed, sender=model, dispatch_uid=f'master_data_delete_{label}')
+
+
+@register('doctors', 'accounts.User')
+def _doctors():
+    from accounts.models import User
+    return list(User.objects.filter(role='doctor', is_active=True))
+
+
+@register('panels', 'setup_app.Panel')
+def _panels():
+    from setup_app.models import Panel
+    return list(Panel.objects.filter(is_active=True))
+
+
+@register('consultation_fee', 'setup_app.Fee')
+def _consultation_fee():
+    from setup_app.models import Fee
+    return Fee.objects.filter(name__icontains='consultation').first()
+
+
+@register('fees', 'setup_app.Fee')
+def _fees():
+    from setup_app.models import Fee
+    return list(Fee.objects.filter(is_active=True))
+
+
+@register('medicines', 'setup_app.Medicine')
+def _medicines():
+    from setup_app.models import Medicine
+    return list(Medicine.objects.filter(is_active=True).order_by('name'))
+
+
+@register('lab_tests', 'setup_app.LabTest')
+def _lab_tests():
+    from setup_app.models import LabTest
+    return list(LabTest.objects.filter(is_active=True))
+
+
+@register('allergies', 'setup_app.Allergy')
+def _allergies():
+    from setup_app.models import Allergy
+    return list(Allergy.objects.filter(is_active=True))
+
+
+@register('ai_config', 'ai.AIConfig', shared=False)
+def _ai_config():
+    from ai.models import AIConfig
+    return AIConfig.objects.get_or_create(pk=1)[0]
+
+
+@register('einvoice_config', 'einvoice.EInvoiceConfig', shared=False)
+def _einvoice_config():
+    from einvoice.models import EInvoiceConfig
+    return EInvoiceConfig.objects.get_or_create(pk=1)[0]
+
+
+@register('clinic_settings', 'management_app.ClinicSettings')
+def _clinic_settings():
+    from management_app.models import ClinicSettings
+    return ClinicSettings.objects.filter(pk=1).first()
@@ -0,0 +1,244 @@
+"""
+Keyset (seek) pagination for the list views.
+
+Pages are addressed by an opaque cursor holding the ordering values of the
+last (or first) row shown, instead of an OFFSET. The next page is fetched with
+``WHERE (ordering fields, pk) > cursor ORDER BY ... LIMIT n``, which an index on
+the ordering fields answers directly, so page cost stays flat however deep the
+user pages or however large the table grows. The primary key is always appended
+to the ordering as a tie-breaker so the seek is stable.
+
+``paginate()`` serves the HTML list pages (``?after=`` / ``?before=`` cursors)
+and ``datatables_response()`` serves the DataTables server-side protocol
+(``?format=datatables``) from the same queryset.
+"""
+import base64
+import datetime
+import decimal
+import json
+import uuid
+
+from django.db.models import Q
+from django.http import JsonResponse
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 100
+
+
+def _split(field):
+    if field.startswith('-'):
+        return field[1:], True
+    return field, False
+
+
+def _to_json(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def _get_value(obj, field):
+    for attr in field.split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, attr)
+    return obj
+
+
+def encode_cursor(ordering, values):
+    payload = json.dumps({'o': ordering, 'v': [_to_json(v) for v in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    """Return the values stored in ``cursor``, or None if it is invalid or for another ordering."""
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('o') != ordering:
+        return None
+    values = payload.get('v')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        return None
+    return values
+
+
+class KeysetPage:
+    def __init__(self, items, ordering, has_next, has_previous):
+        self.object_list = items
+        self.ordering = ordering
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_query = ''
+        self.previous_query = ''
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def _cursor_for(self, obj):
+        return encode_cursor(self.ordering, [_get_value(obj, _split(f)[0]) for f in self.ordering])
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.object_list:
+            return None
+        return self._cursor_for(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous or not self.object_list:
+            return None
+        return self._cursor_for(self.object_list[0])
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` by ``ordering`` (Django ``order_by`` syntax).
+
+    Ordering fields must be non-null; ``pk`` is added as the final tie-breaker
+    when it is not already present.
+    """
+
+    def __init__(self, queryset, ordering, per_page=DEFAULT_PER_PAGE):
+        ordering = list(ordering)
+        if _split(ordering[-1])[0] not in ('pk', 'id'):
+            ordering.append('-pk' if _split(ordering[0])[1] else 'pk')
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = max(1, min(per_page, MAX_PER_PAGE))
+
+    def _seek(self, values, backwards):
+        """Filter for rows strictly after ``values`` (before, if ``backwards``)."""
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            name, descending = _split(field)
+            lookup = 'lt' if descending != backwards else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            for prior_field, prior_value in zip(self.ordering[:i], values[:i]):
+                step &= Q(**{_split(prior_field)[0]: prior_value})
+            condition |= step
+        # Bound the leading column as well so the planner can use a range scan on its index.
+        name, descending = _split(self.ordering[0])
+        bound = Q(**{f"{name}__{'lte' if descending != backwards else 'gte'}": values[0]})
+        return bound & condition
+
+    def _reversed(self):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def page(self, after=None, before=None):
+        after_values = decode_cursor(after, self.ordering)
+        before_values = None if after_values else decode_cursor(before, self.ordering)
+
+        if before_values is not None:
+            qs = self.queryset.filter(self._seek(before_values, backwards=True)).order_by(*self._reversed())
+            rows = list(qs[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            items = rows[:self.per_page][::-1]
+            return KeysetPage(items, self.ordering, has_next=True, has_previous=has_previous)
+
+        qs = self.queryset
+        if after_values is not None:
+            qs = qs.filter(self._seek(after_values, backwards=False))
+        rows = list(qs.order_by(*self.ordering)[:self.per_page + 1])
+        return KeysetPage(
+            rows[:self.per_page], self.ordering,
+            has_next=len(rows) > self.per_page,
+            has_previous=after_values is not None,
+        )
+
+
+def _per_page(request, default=DEFAULT_PER_PAGE, param='per_page'):
+    try:
+        return int(request.GET.get(param, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def paginate(request, queryset, ordering, per_page=DEFAULT_PER_PAGE):
+    """Return the keyset page for ``request`` (``?after=`` / ``?before=`` cursors)."""
+    paginator = KeysetPaginator(queryset, ordering, _per_page(request, per_page))
+    page = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+
+    def query_with(key, cursor):
+        params = request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[key] = cursor
+        return params.urlencode()
+
+    if page.next_cursor:
+        page.next_query = query_with('after', page.next_cursor)
+    if page.previous_cursor:
+        page.previous_query = query_with('before', page.previous_cursor)
+    return page
+
+
+def wants_datatables(request):
+    return request.GET.get('format') == 'datatables'
+
+
+def datatables_response(request, queryset, columns, ordering, search=None):
+    """
+    Answer a DataTables server-side request from ``queryset``.
+
+    ``columns`` is a list of ``(name, sort_field, value)`` tuples, where
+    ``sort_field`` is None for unsortable columns and ``value`` is called with
+    each row. ``search`` filters the queryset by the global search box.
+
+    DataTables only knows offsets, so the response also carries
+    ``next_cursor``; the client sends it back as ``cursor`` when moving to the
+    following page and the server seeks instead of offsetting. No COUNT query
+    is run: the reported totals only reveal whether another page exists, which
+    is what the "simple" pager needs.
+    """
+    try:
+        draw = int(request.GET.get('draw', 0))
+        start = max(0, int(request.GET.get('start', 0)))
+    except ValueError:
+        draw, start = 0, 0
+    length = _per_page(request, DEFAULT_PER_PAGE, param='length')
+
+    term = request.GET.get('search[value]', '').strip()
+    if term and search:
+        queryset = search(queryset, term)
+
+    try:
+        sort_column = columns[int(request.GET.get('order[0][column]', ''))]
+    except (ValueError, IndexError):
+        sort_column = None
+    if sort_column and sort_column[1]:
+        prefix = '-' if request.GET.get('order[0][dir]') == 'desc' else ''
+        ordering = [prefix + sort_column[1]]
+
+    paginator = KeysetPaginator(queryset, ordering, length)
+    cursor = request.GET.get('cursor')
+    if start and decode_cursor(cursor, paginator.ordering) is None:
+        # No usable cursor (e.g. a bookmarked offset): fall back to OFFSET once.
+        rows = list(queryset.order_by(*paginator.ordering)[start:start + paginator.per_page + 1])
+        page = KeysetPage(rows[:paginator.per_page], paginator.ordering, len(rows) > paginator.per_page, True)
+    else:
+        page = paginator.page(after=cursor if start else None)
+
+    total = start + len(page) + (1 if page.has_next else 0)
+    return JsonResponse({
+        'draw': draw,
+        'recordsTotal': total,
+        'recordsFiltered': total,
+        'data': [{name: value(obj) for name, _, value in columns} for obj in page],
+        'next_cursor': page.next_cursor,
+    })
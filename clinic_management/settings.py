@@ -59,6 +59,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'management_app.context_processors.clinic_settings',
             ],
         },
     },
@@ -117,6 +118,31 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache: queue state, dashboard stats, master data versions and AI responses
+# live here, and gunicorn runs several workers, so the backend must be shared
+# between processes. Redis when REDIS_URL is set (needs the redis package),
+# otherwise a table in the main database (created by `manage.py
+# createcachetable`), which is slower but still shared.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'clinic',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'clinic_cache',
+            'KEY_PREFIX': 'clinic',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
 AUTH_USER_MODEL = 'accounts.User'
 
 LOGIN_URL = 'accounts:login'
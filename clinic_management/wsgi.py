@@ -10,7 +10,16 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinic_management.settings')
 
 application = get_wsgi_application()
+
+# Warm the master-data cache so the first requests of a new worker don't pay for it.
+from clinic_management import master_data  # noqa: E402
+
+try:
+    master_data.preload()
+except DatabaseError:
+    pass
@@ -35,8 +35,8 @@ class EInvoiceConfig(models.Model):
 
     @classmethod
     def get_config(cls):
-        config, _ = cls.objects.get_or_create(pk=1)
-        return config
+        from clinic_management import master_data
+        return master_data.singleton('einvoice_config')
 
 
 class EInvoiceToken(models.Model):
@@ -0,0 +1,126 @@
+"""
+Batch invoicing for visits awaiting payment.
+
+``bill_visits`` invoices any number of visits in a fixed number of queries:
+consultations, prescriptions and medicines are prefetched, the consultation
+fee comes from the master-data cache, invoice numbers are reserved as one
+block, and invoices and their items are written with ``bulk_create`` inside a
+single transaction. Each visit gets a ``BillingResult`` so the caller can
+report what happened per visit.
+"""
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import Prefetch
+
+from clinic_management import master_data
+from management_app import numbering
+from . import ledger
+
+CREATED = 'created'
+EXISTING = 'existing'
+
+
+@dataclass
+class BillingResult:
+    visit: object
+    status: str
+    invoice: object = None
+    items: list = field(default_factory=list)
+
+    @property
+    def message(self):
+        if self.status == EXISTING:
+            return 'Invoice already exists for this visit.'
+        if not self.items:
+            return 'Invoice created with no billable items.'
+        return f'Invoice created with {len(self.items)} item(s).'
+
+
+def _visit_items(visit, consultation_fee):
+    from patients.models import Consultation
+    from .models import InvoiceItem
+
+    try:
+        consultation = visit.consultation
+    except Consultation.DoesNotExist:
+        return []
+    items = []
+    if consultation_fee:
+        items.append(InvoiceItem(
+            item_type='consultation',
+            description=f'Consultation - {consultation_fee.name}',
+            quantity=1,
+            unit_price=consultation_fee.amount,
+        ))
+    for rx in consultation.prescriptions.all():
+        if rx.medicine:
+            items.append(InvoiceItem(
+                item_type='medicine',
+                description=f'{rx.medicine.name} x{rx.quantity}',
+                quantity=rx.quantity,
+                unit_price=rx.medicine.selling_price,
+            ))
+    return items
+
+
+def bill_visits(visits, user):
+    """Create an invoice for each visit in ``visits`` that has none; returns one ``BillingResult`` per visit."""
+    from patients.models import Prescription
+    from .models import Invoice, InvoiceItem
+
+    consultation_fee = master_data.get('consultation_fee')
+    with transaction.atomic():
+        visits = list(
+            visits.select_for_update(of=('self',))
+            .select_related('patient', 'consultation')
+            .prefetch_related(Prefetch(
+                'consultation__prescriptions',
+                queryset=Prescription.objects.select_related('medicine'),
+            ))
+            .order_by('visit_date', 'pk')
+        )
+        existing = dict(
+            Invoice.objects.filter(visit__in=visits).order_by('invoice_date').values_list('visit_id', 'pk')
+        )
+        existing_invoices = Invoice.objects.in_bulk(existing.values())
+
+        results = []
+        to_bill = []
+        for visit in visits:
+            if visit.pk in existing:
+                results.append(BillingResult(visit, EXISTING, existing_invoices[existing[visit.pk]]))
+            else:
+                result = BillingResult(visit, CREATED, items=_visit_items(visit, consultation_fee))
+                results.append(result)
+                to_bill.append(result)
+
+        numbers = numbering.reserve_document_numbers(numbering.INVOICE, len(to_bill))
+        for result, number in zip(to_bill, numbers):
+            subtotal = ledger.ZERO
+            for item in result.items:
+                item.total = item.compute_total()
+                subtotal += item.total
+            result.invoice = Invoice(
+                invoice_number=number,
+                patient=result.visit.patient,
+                visit=result.visit,
+                panel_id=result.visit.patient.panel_id,
+                subtotal=subtotal,
+                total_amount=subtotal,
+                outstanding_balance=subtotal,
+                created_by=user,
+            )
+        Invoice.objects.bulk_create([result.invoice for result in to_bill])
+
+        items = []
+        for result in to_bill:
+            for item in result.items:
+                item.invoice = result.invoice
+                items.append(item)
+        InvoiceItem.objects.bulk_create(items, batch_size=1000)
+
+        if to_bill:
+            from management_app.dashboard_stats import invalidate_dashboard_stats
+            transaction.on_commit(invalidate_dashboard_stats)
+    return results
@@ -1,14 +1,16 @@
 from django import forms
 from .models import Invoice, InvoiceItem, Payment, Supplier, StockOrder, StockOrderItem, PanelClaim
+from patients.autocomplete import PatientChoiceField, VisitChoiceField
 
 
 class InvoiceForm(forms.ModelForm):
+    patient = PatientChoiceField()
+    visit = VisitChoiceField(required=False)
+
     class Meta:
         model = Invoice
         fields = ['patient', 'visit', 'panel', 'discount', 'notes', 'due_date']
         widgets = {
-            'patient': forms.Select(attrs={'class': 'form-select'}),
-            'visit': forms.Select(attrs={'class': 'form-select'}),
             'panel': forms.Select(attrs={'class': 'form-select'}),
             'discount': forms.NumberInput(attrs={'class': 'form-control'}),
             'notes': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
@@ -74,12 +76,14 @@ class StockOrderForm(forms.ModelForm):
 class StockOrderItemForm(forms.ModelForm):
     class Meta:
         model = StockOrderItem
-        fields = ['medicine', 'disposable', 'quantity', 'unit_price']
+        fields = ['medicine', 'disposable', 'quantity', 'unit_price', 'batch_number', 'expiry_date']
         widgets = {
             'medicine': forms.Select(attrs={'class': 'form-select'}),
             'disposable': forms.Select(attrs={'class': 'form-select'}),
             'quantity': forms.NumberInput(attrs={'class': 'form-control'}),
             'unit_price': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
+            'batch_number': forms.TextInput(attrs={'class': 'form-control'}),
+            'expiry_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
         }
 
 
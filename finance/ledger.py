@@ -0,0 +1,127 @@
+"""
+Invoice totals.
+
+Stored totals (``subtotal``, ``total_amount``, ``amount_paid``,
+``outstanding_balance``) and the payment status are maintained with atomic
+``F()`` deltas: adding or removing items and posting payments each issue one
+``UPDATE`` that also recomputes the derived columns from the new values, so
+concurrent cashiers never overwrite each other's totals and nothing is re-summed
+in Python. Editing an invoice's tax or discount re-derives its total the same
+way (``retotal``). ``recalculate`` re-derives an invoice from ``Sum`` aggregates under
+``SELECT ... FOR UPDATE``; the ``reconcile_invoices`` command uses
+``mismatched_invoices`` to check every stored total in bulk.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, CharField, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan, LessThanOrEqual
+
+ZERO = Decimal('0.00')
+_MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _status(outstanding, paid):
+    """Status for the given outstanding/paid expressions; cancelled invoices keep theirs."""
+    return Case(
+        When(status='cancelled', then=F('status')),
+        When(LessThanOrEqual(paid, 0), then=Value('pending')),
+        When(LessThanOrEqual(outstanding, 0), then=Value('paid')),
+        When(GreaterThan(paid, 0), then=Value('partial')),
+        default=F('status'),
+        output_field=CharField(),
+    )
+
+
+def apply_delta(invoice_id, items=ZERO, paid=ZERO):
+    """Add ``items`` to the item subtotal and ``paid`` to the amount paid, in one UPDATE."""
+    from .models import Invoice
+
+    items, paid = Decimal(items), Decimal(paid)
+    if not items and not paid:
+        return
+    subtotal = F('subtotal') + Value(items, output_field=_MONEY)
+    total = subtotal + F('tax_amount') - F('discount')
+    amount_paid = F('amount_paid') + Value(paid, output_field=_MONEY)
+    outstanding = total - amount_paid
+    Invoice.objects.filter(pk=invoice_id).update(
+        subtotal=subtotal,
+        total_amount=total,
+        amount_paid=amount_paid,
+        outstanding_balance=outstanding,
+        status=_status(outstanding, amount_paid),
+    )
+    from management_app.dashboard_stats import invalidate_dashboard_stats
+    transaction.on_commit(invalidate_dashboard_stats)
+
+
+def retotal(invoice):
+    """Re-derive ``invoice``'s total, balance and status from its stored columns, in one UPDATE."""
+    from .models import Invoice
+
+    total = F('subtotal') + F('tax_amount') - F('discount')
+    outstanding = total - F('amount_paid')
+    Invoice.objects.filter(pk=invoice.pk).update(
+        total_amount=total,
+        outstanding_balance=outstanding,
+        status=_status(outstanding, F('amount_paid')),
+    )
+    invoice.refresh_from_db(fields=[*Invoice.LEDGER_FIELDS, 'status'])
+    from management_app.dashboard_stats import invalidate_dashboard_stats
+    transaction.on_commit(invalidate_dashboard_stats)
+
+
+def add_items(invoice, items):
+    """Bulk-insert unsaved ``InvoiceItem`` objects and add their totals to ``invoice``."""
+    with transaction.atomic():
+        for item in items:
+            item.invoice = invoice
+            item.total = item.compute_total()
+        created = type(items[0]).objects.bulk_create(items) if items else []
+        apply_delta(invoice.pk, items=sum((item.total for item in created), ZERO))
+    return created
+
+
+def recalculate(invoice_id):
+    """Re-derive an invoice's totals from its items and payments under a row lock."""
+    from .models import Invoice, InvoiceItem, Payment
+
+    with transaction.atomic():
+        invoice = Invoice.objects.select_for_update().get(pk=invoice_id)
+        subtotal = InvoiceItem.objects.filter(invoice=invoice).aggregate(total=Sum('total'))['total'] or ZERO
+        paid = Payment.objects.filter(invoice=invoice).aggregate(total=Sum('amount'))['total'] or ZERO
+        total = Value(subtotal, output_field=_MONEY) + F('tax_amount') - F('discount')
+        amount_paid = Value(paid, output_field=_MONEY)
+        outstanding = total - amount_paid
+        Invoice.objects.filter(pk=invoice.pk).update(
+            subtotal=subtotal,
+            total_amount=total,
+            amount_paid=paid,
+            outstanding_balance=outstanding,
+            status=_status(outstanding, amount_paid),
+        )
+        invoice.refresh_from_db()
+    return invoice
+
+
+def mismatched_invoices(queryset=None):
+    """Invoices whose stored totals disagree with their items and payments (one query)."""
+    from .models import Invoice, InvoiceItem, Payment
+
+    items = InvoiceItem.objects.filter(invoice=OuterRef('pk')).order_by().values('invoice').annotate(
+        total=Sum('total'),
+    ).values('total')
+    payments = Payment.objects.filter(invoice=OuterRef('pk')).order_by().values('invoice').annotate(
+        total=Sum('amount'),
+    ).values('total')
+    queryset = Invoice.objects.all() if queryset is None else queryset
+    return queryset.annotate(
+        items_sum=Coalesce(Subquery(items, output_field=_MONEY), Value(ZERO, output_field=_MONEY)),
+        paid_sum=Coalesce(Subquery(payments, output_field=_MONEY), Value(ZERO, output_field=_MONEY)),
+    ).exclude(
+        Q(subtotal=F('items_sum'))
+        & Q(amount_paid=F('paid_sum'))
+        & Q(total_amount=F('items_sum') + F('tax_amount') - F('discount'))
+        & Q(outstanding_balance=F('items_sum') + F('tax_amount') - F('discount') - F('paid_sum'))
+    ).order_by('pk')
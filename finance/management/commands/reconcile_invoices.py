@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from finance.ledger import mismatched_invoices, recalculate
+
+
+class Command(BaseCommand):
+    help = "Check every invoice's stored totals against its items and payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Recalculate the invoices that disagree.')
+
+    def handle(self, *args, **options):
+        mismatched = mismatched_invoices().only(
+            'id', 'invoice_number', 'subtotal', 'amount_paid', 'total_amount', 'outstanding_balance',
+        )
+        count = 0
+        for invoice in mismatched.iterator():
+            count += 1
+            self.stdout.write(
+                f'{invoice.invoice_number}: subtotal {invoice.subtotal} (items {invoice.items_sum}), '
+                f'paid {invoice.amount_paid} (payments {invoice.paid_sum})'
+            )
+            if options['fix']:
+                recalculate(invoice.pk)
+        if not count:
+            self.stdout.write(self.style.SUCCESS('All invoice totals reconcile.'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'{count} invoices recalculated.'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{count} invoices disagree; rerun with --fix to recalculate them.'))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0002_widen_invoice_number'),
+        ('patients', '0006_keyset_indexes'),
+        ('setup_app', '0002_panel_brn_panel_tin'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['invoice_date', 'id'], name='invoice_date_seek'),
+        ),
+        migrations.AddIndex(
+            model_name='panelclaim',
+            index=models.Index(fields=['created_at', 'id'], name='panel_claim_created_seek'),
+        ),
+        migrations.AddIndex(
+            model_name='stockorder',
+            index=models.Index(fields=['order_date', 'id'], name='stock_order_date_seek'),
+        ),
+    ]
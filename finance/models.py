@@ -1,4 +1,6 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
 from django.conf import settings
 from patients.models import Patient, Visit
 from setup_app.models import Panel, Medicine, Disposable
@@ -12,7 +14,7 @@ class Invoice(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
-    invoice_number = models.CharField(max_length=20, unique=True)
+    invoice_number = models.CharField(max_length=30, unique=True)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='invoices')
     visit = models.ForeignKey(Visit, on_delete=models.SET_NULL, null=True, blank=True)
     panel = models.ForeignKey(Panel, on_delete=models.SET_NULL, null=True, blank=True)
@@ -30,17 +32,34 @@ class Invoice(models.Model):
 
     class Meta:
         ordering = ['-invoice_date']
+        indexes = [
+            models.Index(fields=['invoice_date', 'id'], name='invoice_date_seek'),
+        ]
 
     def __str__(self):
         return f"{self.invoice_number} - {self.patient.full_name}"
 
-    def update_balance(self):
-        self.outstanding_balance = self.total_amount - self.amount_paid
-        if self.outstanding_balance <= 0:
-            self.status = 'paid'
-        elif self.amount_paid > 0:
-            self.status = 'partial'
-        self.save()
+    # Maintained by ``finance.ledger`` with F() deltas, so an edit never writes
+    # back the values this instance happened to load.
+    LEDGER_FIELDS = ('subtotal', 'total_amount', 'amount_paid', 'outstanding_balance')
+
+    def save(self, *args, **kwargs):
+        from . import ledger
+        if self._state.adding:
+            self.total_amount = self.subtotal + self.tax_amount - self.discount
+            self.outstanding_balance = self.total_amount - self.amount_paid
+            super().save(*args, **kwargs)
+            return
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.LEDGER_FIELDS
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_fields is None or {'tax_amount', 'discount'} & set(update_fields):
+                ledger.retotal(self)
 
 
 class InvoiceItem(models.Model):
@@ -61,11 +80,27 @@ class InvoiceItem(models.Model):
     tax_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     total = models.DecimalField(max_digits=10, decimal_places=2)
 
-    def save(self, *args, **kwargs):
+    def compute_total(self):
         subtotal = self.unit_price * self.quantity
-        tax = subtotal * (self.tax_rate / 100)
-        self.total = subtotal + tax - self.discount
-        super().save(*args, **kwargs)
+        tax = subtotal * (Decimal(self.tax_rate) / 100)
+        return subtotal + tax - self.discount
+
+    def save(self, *args, **kwargs):
+        from . import ledger
+        self.total = self.compute_total()
+        with transaction.atomic():
+            previous = ledger.ZERO
+            if self.pk:
+                previous = InvoiceItem.objects.filter(pk=self.pk).values_list('total', flat=True).first() or ledger.ZERO
+            super().save(*args, **kwargs)
+            ledger.apply_delta(self.invoice_id, items=self.total - previous)
+
+    def delete(self, *args, **kwargs):
+        from . import ledger
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            ledger.apply_delta(self.invoice_id, items=-self.total)
+        return result
 
     def __str__(self):
         return f"{self.description} x {self.quantity}"
@@ -93,9 +128,20 @@ class Payment(models.Model):
         return f"Payment ${self.amount} for {self.invoice.invoice_number}"
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.invoice.amount_paid = sum(p.amount for p in self.invoice.payments.all())
-        self.invoice.update_balance()
+        from . import ledger
+        with transaction.atomic():
+            previous = ledger.ZERO
+            if self.pk:
+                previous = Payment.objects.filter(pk=self.pk).values_list('amount', flat=True).first() or ledger.ZERO
+            super().save(*args, **kwargs)
+            ledger.apply_delta(self.invoice_id, paid=self.amount - previous)
+
+    def delete(self, *args, **kwargs):
+        from . import ledger
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            ledger.apply_delta(self.invoice_id, paid=-self.amount)
+        return result
 
 
 class Supplier(models.Model):
@@ -133,6 +179,11 @@ class StockOrder(models.Model):
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_date', 'id'], name='stock_order_date_seek'),
+        ]
+
     def __str__(self):
         return f"{self.order_number} - {self.supplier.name}"
 
@@ -144,6 +195,8 @@ class StockOrderItem(models.Model):
     quantity = models.IntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     total = models.DecimalField(max_digits=10, decimal_places=2)
+    batch_number = models.CharField(max_length=50, blank=True)
+    expiry_date = models.DateField(null=True, blank=True)
 
     def save(self, *args, **kwargs):
         self.total = self.quantity * self.unit_price
@@ -172,6 +225,11 @@ class PanelClaim(models.Model):
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='panel_claim_created_seek'),
+        ]
+
     def __str__(self):
         return f"{self.claim_number} - {self.panel.company_name}"
 
@@ -1,3 +1,130 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User
+from clinic_management import master_data
+from management_app.models import DailySequence
+from patients.models import Consultation, Patient, Prescription, Visit
+from setup_app.models import Fee, Medicine
+from . import billing, ledger
+from .models import Invoice, InvoiceItem, Payment
+
+
+class InvoiceLedgerTests(TestCase):
+    def setUp(self):
+        patient = Patient.objects.create(
+            patient_id='P0001', first_name='Pat', last_name='One', date_of_birth=date(1990, 1, 1),
+            gender='M', phone='0100000000', address='-',
+        )
+        self.invoice = Invoice.objects.create(invoice_number='INV-1', patient=patient, discount=Decimal('5'))
+
+    def assertTotals(self, subtotal, outstanding, status):
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.subtotal, Decimal(subtotal))
+        self.assertEqual(self.invoice.total_amount, Decimal(subtotal) - Decimal('5'))
+        self.assertEqual(self.invoice.outstanding_balance, Decimal(outstanding))
+        self.assertEqual(self.invoice.status, status)
+
+    def test_items_and_payments_apply_deltas(self):
+        item = InvoiceItem.objects.create(
+            invoice=self.invoice, item_type='other', description='A', quantity=2, unit_price=Decimal('50'),
+        )
+        ledger.add_items(self.invoice, [
+            InvoiceItem(item_type='other', description='B', quantity=1, unit_price=Decimal('10'), tax_rate=Decimal('10')),
+        ])
+        self.assertTotals('111', '106', 'pending')
+        Payment.objects.create(invoice=self.invoice, amount=Decimal('50'), payment_method='cash')
+        self.assertTotals('111', '56', 'partial')
+        Payment.objects.create(invoice=self.invoice, amount=Decimal('56'), payment_method='cash')
+        self.assertTotals('111', '0', 'paid')
+        item.delete()
+        self.assertTotals('11', '-100', 'paid')
+        self.assertFalse(ledger.mismatched_invoices().exists())
+
+    def test_recalculate_repairs_drifted_totals(self):
+        InvoiceItem.objects.create(invoice=self.invoice, item_type='other', description='A', quantity=1, unit_price=Decimal('20'))
+        Invoice.objects.filter(pk=self.invoice.pk).update(subtotal=0, outstanding_balance=0)
+        self.assertEqual(list(ledger.mismatched_invoices()), [self.invoice])
+        ledger.recalculate(self.invoice.pk)
+        self.assertTotals('20', '15', 'pending')
+        self.assertFalse(ledger.mismatched_invoices().exists())
+
+    def test_editing_discount_or_tax_updates_the_balance(self):
+        stale = Invoice.objects.get(pk=self.invoice.pk)
+        InvoiceItem.objects.create(invoice=self.invoice, item_type='other', description='A', quantity=1, unit_price=Decimal('100'))
+        Payment.objects.create(invoice=self.invoice, amount=Decimal('40'), payment_method='cash')
+        # An edit from a form loaded before the item and payment must not write back its old totals.
+        stale.discount = Decimal('10')
+        stale.tax_amount = Decimal('6')
+        stale.save()
+        self.invoice.refresh_from_db()
+        self.assertEqual(
+            (self.invoice.subtotal, self.invoice.total_amount, self.invoice.amount_paid, self.invoice.outstanding_balance),
+            (Decimal('100'), Decimal('96'), Decimal('40'), Decimal('56')),
+        )
+        self.assertEqual((stale.total_amount, stale.status), (Decimal('96'), 'partial'))
+        self.assertFalse(ledger.mismatched_invoices().exists())
+
+    def test_removing_every_payment_reopens_the_invoice(self):
+        InvoiceItem.objects.create(invoice=self.invoice, item_type='other', description='A', quantity=1, unit_price=Decimal('20'))
+        payment = Payment.objects.create(invoice=self.invoice, amount=Decimal('15'), payment_method='cash')
+        self.assertTotals('20', '0', 'paid')
+        payment.delete()
+        self.assertTotals('20', '15', 'pending')
+
+
+class BillVisitsTests(TransactionTestCase):
+    # Invoice numbers are reserved on their own connection, outside TestCase's transaction.
+
+    def setUp(self):
+        master_data.clear_local()
+        self.cashier = User.objects.create_user('cashier', password='pw', role='finance')
+        Fee.objects.create(name='Consultation', fee_type='consultation', amount=Decimal('30'))
+        medicine = Medicine.objects.create(name='Paracetamol', sku='PCM', selling_price=Decimal('0.50'), cost_price=Decimal('0.20'))
+        self.visits = []
+        for i in range(1, 4):
+            patient = Patient.objects.create(
+                patient_id=f'P{i:04d}', first_name='Pat', last_name=str(i), date_of_birth=date(1990, 1, 1),
+                gender='M', phone=f'01{i:08d}', address='-',
+            )
+            visit = Visit.objects.create(patient=patient, visit_number=f'V{i}', visit_date=timezone.now(), status='ready_for_payment')
+            consultation = Consultation.objects.create(visit=visit, chief_complaint='-', diagnosis='-')
+            for _ in range(i):
+                Prescription.objects.create(
+                    consultation=consultation, medicine=medicine, dosage='1', frequency='tds', duration='3 days', quantity=10,
+                )
+            self.visits.append(visit)
+        master_data.get('consultation_fee')
+        master_data.get('clinic_settings')
+
+    def test_batch_is_numbered_totalled_and_billed_once(self):
+        visits = Visit.objects.filter(pk__in=[v.pk for v in self.visits])
+        with CaptureQueriesContext(connection) as queries:
+            results = billing.bill_visits(visits, self.cashier)
+        # Visits, prescriptions, existing invoices, then one INSERT each for
+        # invoices and items, whatever the batch size. The number block is a
+        # single increment (on its own connection outside SQLite).
+        statements = [q['sql'] for q in queries if q['sql'].startswith(('SELECT', 'INSERT', 'UPDATE'))]
+        self.assertEqual(len([sql for sql in statements if 'clinic_cache' not in sql and 'dailysequence' not in sql]), 5)
+        self.assertEqual(DailySequence.objects.get(name='doc:invoice').value, 3)
+
+        self.assertEqual([r.status for r in results], [billing.CREATED] * 3)
+        numbers = [r.invoice.invoice_number for r in results]
+        self.assertEqual([n[-4:] for n in numbers], ['0001', '0002', '0003'])
+        invoices = Invoice.objects.in_bulk([r.invoice.pk for r in results])
+        self.assertEqual(
+            [(invoices[r.invoice.pk].total_amount, invoices[r.invoice.pk].outstanding_balance) for r in results],
+            [(Decimal('35.00'), Decimal('35.00')), (Decimal('40.00'), Decimal('40.00')), (Decimal('45.00'), Decimal('45.00'))],
+        )
+        self.assertEqual([len(r.items) for r in results], [2, 3, 4])
+        self.assertFalse(ledger.mismatched_invoices().exists())
+
+        again = billing.bill_visits(visits, self.cashier)
+        self.assertEqual([r.status for r in again], [billing.EXISTING] * 3)
+        self.assertEqual([r.invoice.invoice_number for r in again], numbers)
+        self.assertEqual(Invoice.objects.count(), 3)
@@ -5,6 +5,7 @@ app_name = 'finance'
 
 urlpatterns = [
     path('billing/', views.billing_dashboard, name='billing_dashboard'),
+    path('billing/batch/', views.billing_batch, name='billing_batch'),
     path('billing/quick-invoice/<int:visit_id>/', views.quick_invoice_create, name='quick_invoice_create'),
     path('billing/complete/<int:visit_id>/', views.complete_billing, name='complete_billing'),
     
@@ -13,6 +14,7 @@ urlpatterns = [
     path('invoices/create/<int:visit_id>/', views.invoice_create, name='invoice_create_for_visit'),
     path('invoices/<int:pk>/', views.invoice_detail, name='invoice_detail'),
     path('invoices/<int:pk>/items/', views.invoice_items, name='invoice_items'),
+    path('invoices/<int:pk>/items/<int:item_id>/delete/', views.invoice_item_delete, name='invoice_item_delete'),
     path('invoices/<int:pk>/finalize/', views.invoice_finalize, name='invoice_finalize'),
     
     path('payments/create/<int:invoice_id>/', views.payment_create, name='payment_create'),
@@ -24,6 +26,7 @@ urlpatterns = [
     
     path('stock-orders/', views.stock_order_list, name='stock_order_list'),
     path('stock-orders/create/', views.stock_order_create, name='stock_order_create'),
+    path('stock-orders/reorder/', views.reorder_queue, name='reorder_queue'),
     path('stock-orders/<int:pk>/items/', views.stock_order_items, name='stock_order_items'),
     path('stock-orders/<int:pk>/status/<str:status>/', views.stock_order_status, name='stock_order_status'),
     
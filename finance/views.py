@@ -1,39 +1,85 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Count, Q
+from django.db import transaction
+from django.db.models import Sum, Count, Q, Prefetch
 from django.utils import timezone
 from django.http import HttpResponse
+from django.urls import reverse
 from datetime import datetime, timedelta
 import uuid
 from .models import Invoice, InvoiceItem, Payment, Supplier, StockOrder, StockOrderItem, PanelClaim, EODReport
 from .forms import InvoiceForm, InvoiceItemForm, PaymentForm, SupplierForm, StockOrderForm, StockOrderItemForm, PanelClaimForm
 from patients.models import Visit, Consultation, Prescription
 from setup_app.models import Panel, Fee
+from setup_app import inventory
+from . import billing, ledger
 from accounts.decorators import finance_access_required, admin_or_hq_required
 from einvoice.models import EInvoiceDocument
+from management_app import numbering, rollups
+from management_app.numbering import next_document_number
+from clinic_management import master_data
+from clinic_management.pagination import paginate, wants_datatables, datatables_response
 
 
 def generate_invoice_number():
-    return f"INV{timezone.now().strftime('%Y%m%d%H%M%S')}"
+    return next_document_number(numbering.INVOICE)
 
 
 def generate_order_number():
-    return f"PO{timezone.now().strftime('%Y%m%d%H%M%S')}"
+    return next_document_number(numbering.STOCK_ORDER)
 
 
 def generate_claim_number():
-    return f"CLM{timezone.now().strftime('%Y%m%d%H%M%S')}"
+    return next_document_number(numbering.PANEL_CLAIM)
+
+
+INVOICE_COLUMNS = [
+    ('invoice_number', 'invoice_number', lambda i: i.invoice_number),
+    ('patient', None, lambda i: i.patient.full_name),
+    ('invoice_date', 'invoice_date', lambda i: i.invoice_date.isoformat()),
+    ('total_amount', 'total_amount', lambda i: str(i.total_amount)),
+    ('amount_paid', None, lambda i: str(i.amount_paid)),
+    ('outstanding_balance', 'outstanding_balance', lambda i: str(i.outstanding_balance)),
+    ('status', 'status', lambda i: i.get_status_display()),
+    ('url', None, lambda i: reverse('finance:invoice_detail', args=[i.pk])),
+]
+
+
+def search_invoices(invoices, term):
+    return invoices.filter(
+        Q(invoice_number__icontains=term) | Q(patient__search_name__contains=term.lower()) | Q(patient__patient_id__iexact=term)
+    )
+
+
+def search_suppliers(suppliers, term):
+    return suppliers.filter(Q(name__icontains=term) | Q(contact_person__icontains=term))
+
+
+def search_stock_orders(orders, term):
+    return orders.filter(Q(order_number__icontains=term) | Q(supplier__name__icontains=term))
+
+
+def search_panel_claims(claims, term):
+    return claims.filter(
+        Q(claim_number__icontains=term) | Q(panel__company_name__icontains=term) | Q(invoice__invoice_number__icontains=term)
+    )
 
 
 @login_required
 @finance_access_required
 def invoice_list(request):
     status_filter = request.GET.get('status', '')
-    invoices = Invoice.objects.all()
+    query = request.GET.get('q', '').strip()
+    invoices = Invoice.objects.select_related('patient')
     if status_filter:
         invoices = invoices.filter(status=status_filter)
-    return render(request, 'finance/invoice_list.html', {'invoices': invoices, 'status_filter': status_filter})
+    if query:
+        invoices = search_invoices(invoices, query)
+    if wants_datatables(request):
+        return datatables_response(request, invoices, INVOICE_COLUMNS, ['-invoice_date'], search=search_invoices)
+    invoices = paginate(request, invoices, ['-invoice_date'])
+    return render(request, 'finance/invoice_list.html', {'invoices': invoices, 'status_filter': status_filter, 'query': query})
 
 
 @login_required
@@ -81,10 +127,6 @@ def invoice_items(request, pk):
             item = form.save(commit=False)
             item.invoice = invoice
             item.save()
-            invoice.subtotal = sum(i.total for i in invoice.items.all())
-            invoice.total_amount = invoice.subtotal + invoice.tax_amount - invoice.discount
-            invoice.outstanding_balance = invoice.total_amount - invoice.amount_paid
-            invoice.save()
             messages.success(request, 'Item added to invoice.')
             return redirect('finance:invoice_items', pk=pk)
     else:
@@ -93,14 +135,21 @@ def invoice_items(request, pk):
     return render(request, 'finance/invoice_items.html', {'invoice': invoice, 'items': items, 'form': form})
 
 
+@login_required
+@finance_access_required
+def invoice_item_delete(request, pk, item_id):
+    item = get_object_or_404(InvoiceItem, pk=item_id, invoice_id=pk)
+    if request.method == 'POST':
+        item.delete()
+        messages.success(request, 'Item removed from invoice.')
+    return redirect('finance:invoice_items', pk=pk)
+
+
 @login_required
 @finance_access_required
 def invoice_finalize(request, pk):
     invoice = get_object_or_404(Invoice, pk=pk)
-    invoice.subtotal = sum(i.total for i in invoice.items.all())
-    invoice.total_amount = invoice.subtotal + invoice.tax_amount - invoice.discount
-    invoice.outstanding_balance = invoice.total_amount - invoice.amount_paid
-    invoice.save()
+    ledger.recalculate(invoice.pk)
     messages.success(request, 'Invoice finalized.')
     return redirect('finance:invoice_detail', pk=pk)
 
@@ -126,8 +175,20 @@ def payment_create(request, invoice_id):
 @login_required
 @finance_access_required
 def supplier_list(request):
+    query = request.GET.get('q', '').strip()
     suppliers = Supplier.objects.filter(is_active=True)
-    return render(request, 'finance/supplier_list.html', {'suppliers': suppliers})
+    if query:
+        suppliers = search_suppliers(suppliers, query)
+    if wants_datatables(request):
+        return datatables_response(request, suppliers, [
+            ('name', 'name', lambda s: s.name),
+            ('contact_person', None, lambda s: s.contact_person),
+            ('phone', None, lambda s: s.phone),
+            ('email', None, lambda s: s.email),
+            ('url', None, lambda s: reverse('finance:supplier_edit', args=[s.pk])),
+        ], ['name'], search=search_suppliers)
+    suppliers = paginate(request, suppliers, ['name'])
+    return render(request, 'finance/supplier_list.html', {'suppliers': suppliers, 'query': query})
 
 
 @login_required
@@ -162,8 +223,22 @@ def supplier_edit(request, pk):
 @login_required
 @finance_access_required
 def stock_order_list(request):
-    orders = StockOrder.objects.all().order_by('-order_date')
-    return render(request, 'finance/stock_order_list.html', {'orders': orders})
+    query = request.GET.get('q', '').strip()
+    orders = StockOrder.objects.select_related('supplier')
+    if query:
+        orders = search_stock_orders(orders, query)
+    if wants_datatables(request):
+        return datatables_response(request, orders, [
+            ('order_number', 'order_number', lambda o: o.order_number),
+            ('supplier', None, lambda o: o.supplier.name),
+            ('order_date', 'order_date', lambda o: o.order_date.isoformat()),
+            ('expected_delivery', None, lambda o: o.expected_delivery.isoformat() if o.expected_delivery else None),
+            ('total_amount', 'total_amount', lambda o: str(o.total_amount)),
+            ('status', 'status', lambda o: o.get_status_display()),
+            ('url', None, lambda o: reverse('finance:stock_order_items', args=[o.pk])),
+        ], ['-order_date'], search=search_stock_orders)
+    orders = paginate(request, orders, ['-order_date'])
+    return render(request, 'finance/stock_order_list.html', {'orders': orders, 'query': query})
 
 
 @login_required
@@ -183,6 +258,35 @@ def stock_order_create(request):
     return render(request, 'finance/stock_order_form.html', {'form': form, 'title': 'Create Stock Order'})
 
 
+@login_required
+@finance_access_required
+def reorder_queue(request):
+    groups = inventory.reorder_queue()
+    if request.method == 'POST':
+        supplier = get_object_or_404(Supplier, pk=request.POST.get('supplier'))
+        group = next((g for g in groups if g['supplier'] == supplier), None)
+        if group is None:
+            messages.info(request, f'Nothing to reorder from {supplier.name}.')
+            return redirect('finance:reorder_queue')
+        with transaction.atomic():
+            order = StockOrder.objects.create(
+                order_number=generate_order_number(),
+                supplier=supplier,
+                order_date=timezone.now().date(),
+                total_amount=group['total_cost'],
+                notes='Generated from the reorder queue.',
+                created_by=request.user,
+            )
+            for item in group['items']:
+                StockOrderItem(
+                    order=order, medicine=item['medicine'],
+                    quantity=item['quantity'], unit_price=item['medicine'].cost_price,
+                ).save()
+        messages.success(request, f'Order {order.order_number} created with {len(group["items"])} item(s).')
+        return redirect('finance:stock_order_items', pk=order.pk)
+    return render(request, 'finance/reorder_queue.html', {'groups': groups})
+
+
 @login_required
 @finance_access_required
 def stock_order_items(request, pk):
@@ -206,19 +310,26 @@ def stock_order_items(request, pk):
 @login_required
 @finance_access_required
 def stock_order_status(request, pk, status):
-    order = get_object_or_404(StockOrder, pk=pk)
     if status in ['ordered', 'shipped', 'delivered', 'cancelled']:
-        order.status = status
-        if status == 'delivered':
-            order.actual_delivery = timezone.now().date()
-            for item in order.items.all():
-                if item.medicine:
-                    item.medicine.stock_quantity += item.quantity
-                    item.medicine.save()
-                elif item.disposable:
-                    item.disposable.stock_quantity += item.quantity
-                    item.disposable.save()
-        order.save()
+        with transaction.atomic():
+            order = get_object_or_404(StockOrder.objects.select_for_update(), pk=pk)
+            if order.status == 'delivered':
+                messages.error(request, 'This order has already been delivered.')
+                return redirect('finance:stock_order_list')
+            order.status = status
+            if status == 'delivered':
+                order.actual_delivery = timezone.now().date()
+                inventory.receive_stock(
+                    [
+                        (item.medicine, item.quantity, item.batch_number, item.expiry_date) if item.medicine
+                        else (item.disposable, item.quantity)
+                        for item in order.items.select_related('medicine', 'disposable')
+                        if item.medicine or item.disposable
+                    ],
+                    reference=order.order_number,
+                    user=request.user,
+                )
+            order.save()
         messages.success(request, f'Order marked as {status}.')
     return redirect('finance:stock_order_list')
 
@@ -226,8 +337,21 @@ def stock_order_status(request, pk, status):
 @login_required
 @finance_access_required
 def panel_claim_list(request):
-    claims = PanelClaim.objects.all().order_by('-created_at')
-    return render(request, 'finance/panel_claim_list.html', {'claims': claims})
+    query = request.GET.get('q', '').strip()
+    claims = PanelClaim.objects.select_related('panel', 'invoice')
+    if query:
+        claims = search_panel_claims(claims, query)
+    if wants_datatables(request):
+        return datatables_response(request, claims, [
+            ('claim_number', 'claim_number', lambda c: c.claim_number),
+            ('panel', None, lambda c: c.panel.company_name),
+            ('invoice', None, lambda c: c.invoice.invoice_number),
+            ('claim_amount', 'claim_amount', lambda c: str(c.claim_amount)),
+            ('status', 'status', lambda c: c.get_status_display()),
+            ('submission_date', None, lambda c: c.submission_date.isoformat() if c.submission_date else None),
+        ], ['-created_at'], search=search_panel_claims)
+    claims = paginate(request, claims, ['-created_at'])
+    return render(request, 'finance/panel_claim_list.html', {'claims': claims, 'query': query})
 
 
 @login_required
@@ -247,6 +371,19 @@ def panel_claim_create(request):
     return render(request, 'finance/panel_claim_form.html', {'form': form, 'title': 'Create Panel Claim'})
 
 
+def _eod_totals(report_date):
+    totals = rollups.range_totals(report_date, report_date)
+    eod = {
+        'total_patients': totals['visits'],
+        'total_cash': totals['cash'],
+        'total_card': totals['card'],
+        'total_ewallet': totals['ewallet'],
+        'total_credit': totals['credit'],
+    }
+    eod['total_revenue'] = eod['total_cash'] + eod['total_card'] + eod['total_ewallet'] + eod['total_credit']
+    return eod
+
+
 @login_required
 @finance_access_required
 def eod_report(request):
@@ -255,16 +392,7 @@ def eod_report(request):
     try:
         report = EODReport.objects.get(report_date=report_date)
     except EODReport.DoesNotExist:
-        payments = Payment.objects.filter(payment_date__date=report_date)
-        report = EODReport(
-            report_date=report_date,
-            total_patients=Visit.objects.filter(visit_date__date=report_date).count(),
-            total_cash=payments.filter(payment_method='cash').aggregate(Sum('amount'))['amount__sum'] or 0,
-            total_card=payments.filter(payment_method='card').aggregate(Sum('amount'))['amount__sum'] or 0,
-            total_ewallet=payments.filter(payment_method='ewallet').aggregate(Sum('amount'))['amount__sum'] or 0,
-            total_credit=payments.filter(payment_method='credit').aggregate(Sum('amount'))['amount__sum'] or 0,
-        )
-        report.total_revenue = report.total_cash + report.total_card + report.total_ewallet + report.total_credit
+        report = EODReport(report_date=report_date, **_eod_totals(report_date))
     
     einvoice_stats = EInvoiceDocument.objects.filter(
         created_at__date=report_date
@@ -290,21 +418,10 @@ def eod_report(request):
 @finance_access_required
 def eod_generate(request):
     report_date = request.POST.get('date', timezone.now().date().isoformat())
-    payments = Payment.objects.filter(payment_date__date=report_date)
-    
     report, created = EODReport.objects.update_or_create(
         report_date=report_date,
-        defaults={
-            'total_patients': Visit.objects.filter(visit_date__date=report_date).count(),
-            'total_cash': payments.filter(payment_method='cash').aggregate(Sum('amount'))['amount__sum'] or 0,
-            'total_card': payments.filter(payment_method='card').aggregate(Sum('amount'))['amount__sum'] or 0,
-            'total_ewallet': payments.filter(payment_method='ewallet').aggregate(Sum('amount'))['amount__sum'] or 0,
-            'total_credit': payments.filter(payment_method='credit').aggregate(Sum('amount'))['amount__sum'] or 0,
-            'generated_by': request.user,
-        }
+        defaults={**_eod_totals(report_date), 'generated_by': request.user},
     )
-    report.total_revenue = report.total_cash + report.total_card + report.total_ewallet + report.total_credit
-    report.save()
     
     messages.success(request, f'EOD Report generated for {report_date}.')
     return redirect('finance:eod_report')
@@ -313,14 +430,22 @@ def eod_generate(request):
 @login_required
 @finance_access_required
 def credit_payment_list(request):
-    invoices = Invoice.objects.filter(status__in=['pending', 'partial']).order_by('-invoice_date')
-    return render(request, 'finance/credit_payment_list.html', {'invoices': invoices})
+    query = request.GET.get('q', '').strip()
+    invoices = Invoice.objects.filter(status__in=['pending', 'partial']).select_related('patient')
+    if query:
+        invoices = search_invoices(invoices, query)
+    if wants_datatables(request):
+        return datatables_response(request, invoices, INVOICE_COLUMNS, ['-invoice_date'], search=search_invoices)
+    invoices = paginate(request, invoices, ['-invoice_date'])
+    return render(request, 'finance/credit_payment_list.html', {'invoices': invoices, 'query': query})
 
 
 @login_required
 @finance_access_required
 def billing_dashboard(request):
-    visits_ready = Visit.objects.filter(status='ready_for_payment').select_related('patient').order_by('visit_date')
+    visits_ready = Visit.objects.filter(status='ready_for_payment').select_related('patient').prefetch_related(
+        Prefetch('invoice_set', queryset=Invoice.objects.order_by('invoice_date'), to_attr='invoices'),
+    ).order_by('visit_date')
     today = timezone.now().date()
     today_invoices = Invoice.objects.filter(invoice_date__date=today)
     today_payments = Payment.objects.filter(payment_date__date=today)
@@ -338,59 +463,38 @@ def billing_dashboard(request):
     })
 
 
+@login_required
+@finance_access_required
+def billing_batch(request):
+    if request.method != 'POST':
+        return redirect('finance:billing_dashboard')
+    visits = Visit.objects.filter(status='ready_for_payment')
+    visit_ids = request.POST.getlist('visit_ids')
+    if visit_ids:
+        visits = visits.filter(pk__in=visit_ids)
+    else:
+        visits = visits.filter(invoice__isnull=True)
+    results = billing.bill_visits(visits, request.user)
+    created = [r for r in results if r.status == billing.CREATED]
+    messages.success(request, f'{len(created)} invoice(s) created.')
+    return render(request, 'finance/billing_batch_result.html', {
+        'results': results,
+        'created_count': len(created),
+        'created_total': sum((r.invoice.total_amount for r in created), ledger.ZERO),
+    })
+
+
 @login_required
 @finance_access_required
 def quick_invoice_create(request, visit_id):
     visit = get_object_or_404(Visit, pk=visit_id)
+    result, = billing.bill_visits(Visit.objects.filter(pk=visit.pk), request.user)
+    if result.status == billing.EXISTING:
+        messages.info(request, result.message)
+        return redirect('finance:invoice_detail', pk=result.invoice.pk)
     
-    existing_invoice = Invoice.objects.filter(visit=visit).first()
-    if existing_invoice:
-        messages.info(request, 'Invoice already exists for this visit.')
-        return redirect('finance:invoice_detail', pk=existing_invoice.pk)
-    
-    invoice = Invoice.objects.create(
-        invoice_number=generate_invoice_number(),
-        patient=visit.patient,
-        visit=visit,
-        panel=visit.patient.panel if visit.patient.panel else None,
-        created_by=request.user,
-    )
-    
-    try:
-        consultation = visit.consultation
-        consultation_fee = Fee.objects.filter(name__icontains='consultation').first()
-        if consultation_fee:
-            InvoiceItem.objects.create(
-                invoice=invoice,
-                item_type='consultation',
-                description=f'Consultation - {consultation_fee.name}',
-                quantity=1,
-                unit_price=consultation_fee.amount,
-                total=consultation_fee.amount,
-            )
-        
-        prescriptions = Prescription.objects.filter(consultation=consultation)
-        for rx in prescriptions:
-            if rx.medicine:
-                item_total = rx.medicine.selling_price * rx.quantity
-                InvoiceItem.objects.create(
-                    invoice=invoice,
-                    item_type='medicine',
-                    description=f'{rx.medicine.name} x{rx.quantity}',
-                    quantity=rx.quantity,
-                    unit_price=rx.medicine.selling_price,
-                    total=item_total,
-                )
-    except Exception:
-        pass
-    
-    invoice.subtotal = sum(i.total for i in invoice.items.all())
-    invoice.total_amount = invoice.subtotal + invoice.tax_amount - invoice.discount
-    invoice.outstanding_balance = invoice.total_amount - invoice.amount_paid
-    invoice.save()
-    
-    messages.success(request, f'Invoice {invoice.invoice_number} created with items from visit.')
-    return redirect('finance:invoice_items', pk=invoice.pk)
+    messages.success(request, f'Invoice {result.invoice.invoice_number} created with items from visit.')
+    return redirect('finance:invoice_items', pk=result.invoice.pk)
 
 
 @login_required
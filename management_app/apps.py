@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ManagementAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'management_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from clinic_management import master_data
+        master_data.connect_signals()
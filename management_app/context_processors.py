@@ -0,0 +1,8 @@
+from django.utils.functional import SimpleLazyObject
+
+from clinic_management import master_data
+
+
+def clinic_settings(request):
+    """Expose the cached ClinicSettings row as ``clinic_settings`` (loaded only if a template uses it)."""
+    return {'clinic_settings': SimpleLazyObject(lambda: master_data.get('clinic_settings'))}
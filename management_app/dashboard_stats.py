@@ -0,0 +1,79 @@
+"""
+Dashboard tile statistics.
+
+Visit tiles are read from the per-day queue projection
+(``patients.queue_state``), which costs one version lookup while current. The
+remaining tiles are computed with one conditional aggregate per model and
+memoized in the cache for ``STATS_TIMEOUT`` seconds; saves and deletes of the
+underlying models drop the memo (see ``management_app.signals``).
+"""
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from patients.queue_state import get_queue_state, WAITING_STATUSES
+
+STATS_TIMEOUT = 60
+
+
+def _management_key(day):
+    return f"dashboard_stats:management:{day.isoformat()}"
+
+
+def invalidate_dashboard_stats(day=None):
+    cache.delete(_management_key(day or timezone.localdate()))
+
+
+def reception_stats(day=None):
+    queue_state = get_queue_state(day)
+    return {
+        'waiting_count': queue_state.count(*WAITING_STATUSES),
+        'in_progress_count': queue_state.count('in_consultation'),
+        'completed_count': queue_state.count('completed'),
+    }
+
+
+def nurse_stats(day=None):
+    return {'waiting_triage_count': get_queue_state(day).count('waiting_triage')}
+
+
+def doctor_stats(day=None, doctor=None, include_unassigned=False):
+    queue_state = get_queue_state(day)
+    return {
+        'waiting_count': queue_state.count('waiting_doctor', doctor=doctor, include_unassigned=include_unassigned),
+        'in_consultation_count': queue_state.count('in_consultation', doctor=doctor, include_unassigned=include_unassigned),
+    }
+
+
+def _compute_management_stats(day):
+    from finance.models import Invoice, Payment
+    from patients.models import Appointment
+    from setup_app.inventory import low_stock_medicines
+
+    appointments = Appointment.objects.filter(appointment_date=day).aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status='scheduled')),
+    )
+    return {
+        'total_appointments_today': appointments['total'],
+        'pending_appointments': appointments['pending'],
+        'revenue_today': Payment.objects.filter(payment_date__date=day).aggregate(total=Sum('amount'))['total'] or 0,
+        'pending_invoices': Invoice.objects.filter(status__in=['pending', 'partial']).count(),
+        'low_stock_medicines': low_stock_medicines().count(),
+    }
+
+
+def management_stats(day=None):
+    day = day or timezone.localdate()
+    key = _management_key(day)
+    stats = cache.get(key)
+    if stats is None:
+        stats = _compute_management_stats(day)
+        cache.set(key, stats, STATS_TIMEOUT)
+
+    queue_state = get_queue_state(day)
+    return {
+        **stats,
+        'total_patients_today': queue_state.count(*queue_state.counts),
+        'completed_visits': queue_state.count('completed'),
+    }
@@ -0,0 +1,101 @@
+"""
+Report exports (visits, payments, invoices, prescriptions) over a date range.
+
+Each export is a queryset that already carries every column it writes, so
+``clinic_management.csv_export`` can stream it without per-row queries.
+"""
+from django.db.models import DecimalField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def _local(moment):
+    return timezone.localtime(moment).strftime('%Y-%m-%d %H:%M')
+
+
+def _doctor_name(user):
+    return user.get_full_name() if user else 'N/A'
+
+
+def visits(start, end):
+    from finance.models import Invoice
+    from patients.models import Visit
+
+    latest_invoice_total = Invoice.objects.filter(visit=OuterRef('pk')).order_by('-invoice_date').values('total_amount')[:1]
+    queryset = Visit.objects.filter(
+        visit_date__date__gte=start, visit_date__date__lte=end,
+    ).select_related('patient', 'doctor').annotate(
+        invoice_total=Coalesce(Subquery(latest_invoice_total), Value(0), output_field=DecimalField()),
+    ).order_by('visit_date', 'pk')
+    return queryset, [
+        ('Date', lambda v: v.visit_date.date()),
+        ('Patient', lambda v: v.patient.full_name),
+        ('Visit Type', lambda v: v.get_visit_type_display()),
+        ('Doctor', lambda v: _doctor_name(v.doctor)),
+        ('Amount', lambda v: v.invoice_total),
+    ]
+
+
+def payments(start, end):
+    from finance.models import Payment
+
+    queryset = Payment.objects.filter(
+        payment_date__date__gte=start, payment_date__date__lte=end,
+    ).select_related('invoice__patient', 'received_by').order_by('payment_date', 'pk')
+    return queryset, [
+        ('Date', lambda p: _local(p.payment_date)),
+        ('Invoice', lambda p: p.invoice.invoice_number),
+        ('Patient', lambda p: p.invoice.patient.full_name),
+        ('Method', lambda p: p.get_payment_method_display()),
+        ('Reference', lambda p: p.reference_number),
+        ('Amount', lambda p: p.amount),
+        ('Received By', lambda p: p.received_by.get_full_name() if p.received_by else ''),
+    ]
+
+
+def invoices(start, end):
+    from finance.models import Invoice
+
+    queryset = Invoice.objects.filter(
+        invoice_date__date__gte=start, invoice_date__date__lte=end,
+    ).select_related('patient', 'panel').order_by('invoice_date', 'pk')
+    return queryset, [
+        ('Date', lambda i: _local(i.invoice_date)),
+        ('Invoice', lambda i: i.invoice_number),
+        ('Patient', lambda i: i.patient.full_name),
+        ('Panel', lambda i: i.panel.company_name if i.panel else ''),
+        ('Total', lambda i: i.total_amount),
+        ('Paid', lambda i: i.amount_paid),
+        ('Outstanding', lambda i: i.outstanding_balance),
+        ('Status', lambda i: i.get_status_display()),
+    ]
+
+
+def prescriptions(start, end):
+    from patients.models import Prescription
+
+    queryset = Prescription.objects.filter(
+        consultation__visit__visit_date__date__gte=start, consultation__visit__visit_date__date__lte=end,
+    ).select_related(
+        'medicine', 'consultation__doctor', 'consultation__visit__patient',
+    ).order_by('consultation__visit__visit_date', 'pk')
+    return queryset, [
+        ('Date', lambda rx: rx.consultation.visit.visit_date.date()),
+        ('Visit', lambda rx: rx.consultation.visit.visit_number),
+        ('Patient', lambda rx: rx.consultation.visit.patient.full_name),
+        ('Doctor', lambda rx: _doctor_name(rx.consultation.doctor)),
+        ('Medicine', lambda rx: rx.medicine.name if rx.medicine else ''),
+        ('Dosage', lambda rx: rx.dosage),
+        ('Frequency', lambda rx: rx.frequency),
+        ('Duration', lambda rx: rx.duration),
+        ('Quantity', lambda rx: rx.quantity),
+        ('Dispensed', lambda rx: 'Yes' if rx.is_dispensed else 'No'),
+    ]
+
+
+EXPORTS = {
+    'visits': visits,
+    'payments': payments,
+    'invoices': invoices,
+    'prescriptions': prescriptions,
+}
@@ -0,0 +1,41 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from finance.models import Payment
+from management_app.rollups import rebuild
+from patients.models import Visit
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily clinic rollups from visits and payments (default: all history).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD, default: today).')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Days rebuilt per transaction.')
+
+    def handle(self, *args, **options):
+        try:
+            end = date.fromisoformat(options['end']) if options['end'] else timezone.localdate()
+            start = date.fromisoformat(options['start']) if options['start'] else self._first_day()
+        except ValueError:
+            raise CommandError('--start and --end must be YYYY-MM-DD.')
+        if start is None:
+            self.stdout.write('No visits or payments to roll up.')
+            return
+        while start <= end:
+            chunk_end = min(start + timedelta(days=options['chunk_days'] - 1), end)
+            count = rebuild(start, chunk_end)
+            self.stdout.write(f'{start} to {chunk_end}: {count} rows written.')
+            start = chunk_end + timedelta(days=1)
+
+    def _first_day(self):
+        firsts = [
+            Visit.objects.aggregate(first=Min('visit_date'))['first'],
+            Payment.objects.aggregate(first=Min('payment_date'))['first'],
+        ]
+        firsts = [timezone.localdate(first) for first in firsts if first]
+        return min(firsts) if firsts else None
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from management_app.models import ReportArtifact
+from management_app.reports import claimable, render
+
+
+class Command(BaseCommand):
+    help = 'Render queued PDF reports (and reports whose renderer stopped responding).'
+
+    def handle(self, *args, **options):
+        queued = ReportArtifact.objects.filter(claimable(timezone.now())).order_by(
+            'created_at',
+        ).values_list('pk', flat=True)
+        rendered = sum(1 for pk in queued if render(pk))
+        self.stdout.write(f'{rendered} reports rendered.')
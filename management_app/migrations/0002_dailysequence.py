@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:23
+
+from django.db import migrations, models
+from django.db.models import Max
+from django.utils import timezone
+
+
+def seed_todays_counters(apps, schema_editor):
+    DailySequence = apps.get_model('management_app', 'DailySequence')
+    Visit = apps.get_model('patients', 'Visit')
+    QueueTicket = apps.get_model('management_app', 'QueueTicket')
+    today = timezone.now().date()
+    last_visit = Visit.objects.filter(visit_date__date=today).aggregate(n=Max('queue_number'))['n']
+    last_ticket = QueueTicket.objects.filter(date=today).aggregate(n=Max('ticket_number'))['n']
+    if last_visit:
+        DailySequence.objects.create(name='visit_queue', date=today, value=last_visit)
+    if last_ticket:
+        DailySequence.objects.create(name='queue_ticket', date=today, value=last_ticket)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management_app', '0001_initial'),
+        ('patients', '0005_patient_search_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('date', models.DateField()),
+                ('value', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('name', 'date')},
+            },
+        ),
+        migrations.RunPython(seed_todays_counters, migrations.RunPython.noop),
+    ]
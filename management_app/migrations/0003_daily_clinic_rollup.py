@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:53
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management_app', '0002_dailysequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyClinicRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payer_type', models.CharField(blank=True, max_length=20)),
+                ('visits', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('cash', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('card', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('ewallet', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('bank_transfer', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('insurance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(models.F('date'), django.db.models.functions.comparison.Coalesce('doctor', models.Value(0)), models.F('payer_type'), name='daily_rollup_unique_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:10
+
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+METHODS = ['cash', 'card', 'ewallet', 'bank_transfer', 'credit', 'insurance']
+
+
+def backfill(apps, schema_editor):
+    """Roll up all existing visits and payments (same aggregates as ``rollups.rebuild``)."""
+    DailyClinicRollup = apps.get_model('management_app', 'DailyClinicRollup')
+    Visit = apps.get_model('patients', 'Visit')
+    Payment = apps.get_model('finance', 'Payment')
+
+    rows = {}
+
+    def row(day, doctor_id, payer_type):
+        return rows.setdefault((day, doctor_id, payer_type or ''), {'visits': 0, 'revenue': 0, **{m: 0 for m in METHODS}})
+
+    visits = Visit.objects.annotate(day=TruncDate('visit_date')).values(
+        'day', 'doctor_id', 'payer_type',
+    ).annotate(count=Count('id')).order_by()
+    for visit in visits.iterator():
+        row(visit['day'], visit['doctor_id'], visit['payer_type'])['visits'] += visit['count']
+
+    payments = Payment.objects.annotate(day=TruncDate('payment_date')).values(
+        'day', 'invoice__visit__doctor_id', 'invoice__visit__payer_type', 'payment_method',
+    ).annotate(total=Sum('amount')).order_by()
+    for payment in payments.iterator():
+        totals = row(payment['day'], payment['invoice__visit__doctor_id'], payment['invoice__visit__payer_type'])
+        totals['revenue'] += payment['total']
+        if payment['payment_method'] in METHODS:
+            totals[payment['payment_method']] += payment['total']
+
+    DailyClinicRollup.objects.all().delete()
+    DailyClinicRollup.objects.bulk_create([
+        DailyClinicRollup(date=day, doctor_id=doctor_id, payer_type=payer_type, **totals)
+        for (day, doctor_id, payer_type), totals in rows.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management_app', '0004_report_artifacts'),
+        ('patients', '0006_keyset_indexes'),
+        ('finance', '0004_stock_order_item_lot'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
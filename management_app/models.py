@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.db.models.functions import Coalesce
 
 
 class ClinicSettings(models.Model):
@@ -24,6 +25,12 @@ class ClinicSettings(models.Model):
     def __str__(self):
         return self.clinic_name
 
+    @classmethod
+    def get_settings(cls):
+        """The clinic's settings row, or ``None`` before it has been set up."""
+        from clinic_management import master_data
+        return master_data.singleton('clinic_settings')
+
 
 class Attendance(models.Model):
     staff = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='attendance_records')
@@ -81,6 +88,71 @@ class QueueTicket(models.Model):
         return f"#{self.ticket_number} - {self.patient_name}"
 
 
+class DailySequence(models.Model):
+    name = models.CharField(max_length=50)
+    date = models.DateField()
+    value = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['name', 'date']
+
+    def __str__(self):
+        return f"{self.name} {self.date}: {self.value}"
+
+
+class DailyClinicRollup(models.Model):
+    """Per-day visit and payment totals by doctor and payer type (see ``management_app.rollups``)."""
+    date = models.DateField()
+    doctor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    payer_type = models.CharField(max_length=20, blank=True)
+    visits = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    cash = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    card = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    ewallet = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    bank_transfer = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    insurance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                'date', Coalesce('doctor', models.Value(0)), 'payer_type', name='daily_rollup_unique_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.doctor_id or '-'} {self.payer_type or '-'}"
+
+
+class ReportArtifact(models.Model):
+    """A rendered PDF report for one (report type, date range, data version); see ``management_app.reports``."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('rendering', 'Rendering'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
+    report_type = models.CharField(max_length=30)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    data_version = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(upload_to='reports/', blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['report_type', 'start_date', 'end_date', 'data_version']
+
+    def __str__(self):
+        return f"{self.report_type} {self.start_date} to {self.end_date} ({self.status})"
+
+
 class PromotionalProduct(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
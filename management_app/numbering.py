@@ -0,0 +1,69 @@
+"""
+Human-readable document numbers (visits, invoices, purchase orders, claims).
+
+Numbers look like ``INV20251207-0042``: a prefix, the issue date and a
+per-day sequence taken from ``DailySequence``. Interactive saves allocate one
+number per atomic increment of the shared counter, so numbers are issued in
+order across all workers and a rollback releases the number with the rest of
+the transaction. Batch paths call ``reserve`` instead, which takes a block of
+consecutive numbers with one committed increment, so a long billing
+transaction never holds the counter; a failed batch leaves a gap.
+"""
+from django.utils import timezone
+
+from .sequences import next_daily_value, reserve_daily_block
+
+VISIT = 'visit'
+INVOICE = 'invoice'
+STOCK_ORDER = 'stock_order'
+PANEL_CLAIM = 'panel_claim'
+
+DEFAULT_PREFIXES = {
+    VISIT: 'V',
+    INVOICE: 'INV',
+    STOCK_ORDER: 'PO',
+    PANEL_CLAIM: 'CLM',
+}
+
+
+def get_prefix(doc_type):
+    if doc_type == INVOICE:
+        from .models import ClinicSettings
+        clinic = ClinicSettings.get_settings()
+        if clinic and clinic.invoice_prefix:
+            return clinic.invoice_prefix
+    return DEFAULT_PREFIXES[doc_type]
+
+
+def format_number(prefix, day, value):
+    return f"{prefix}{day.strftime('%Y%m%d')}-{value:04d}"
+
+
+class DocumentNumberGenerator:
+    def _sequence_name(self, doc_type):
+        return f"doc:{doc_type}"
+
+    def next_number(self, doc_type):
+        day = timezone.now().date()
+        value = next_daily_value(self._sequence_name(doc_type), day)
+        return format_number(get_prefix(doc_type), day, value)
+
+    def reserve(self, doc_type, count):
+        """Allocate a block of ``count`` consecutive numbers outside the caller's transaction."""
+        if count <= 0:
+            return []
+        day = timezone.now().date()
+        last = reserve_daily_block(self._sequence_name(doc_type), count, day)
+        prefix = get_prefix(doc_type)
+        return [format_number(prefix, day, value) for value in range(last - count + 1, last + 1)]
+
+
+document_numbers = DocumentNumberGenerator()
+
+
+def next_document_number(doc_type):
+    return document_numbers.next_number(doc_type)
+
+
+def reserve_document_numbers(doc_type, count):
+    return document_numbers.reserve(doc_type, count)
@@ -0,0 +1,272 @@
+"""
+PDF report engine.
+
+A report is identified by its type, date range and a *data version*: a digest
+of one aggregate query over the rows the report reads, so any visit or payment
+change in the range yields a new version. ``request_report`` looks up the
+``ReportArtifact`` for the current version. If none exists, it creates a
+pending one and queues a ``report_render`` job on the ``ai.jobs`` queue, so
+PDFs are built by the ``run_ai_worker`` processes rather than inside the web
+workers. An artifact left ``rendering`` by a process that died is claimed
+again by the next request for it after ``STALE_AFTER``; the
+``render_reports`` command renders whatever is still waiting. Finished PDFs live in default storage under
+``reports/`` and are served as-is until the data changes; older versions are
+deleted when a newer one is rendered.
+
+Documents are built with reportlab platypus: a summary, a daily bar chart, and
+detail tables fed from the streamed querysets in ``management_app.exports``,
+split into chunks that repeat their header row on every page.
+"""
+import hashlib
+import logging
+import tempfile
+from datetime import timedelta
+
+from django.core.files import File
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.shapes import Drawing
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from . import exports, rollups
+
+logger = logging.getLogger(__name__)
+
+TABLE_CHUNK_ROWS = 250
+STALE_AFTER = timedelta(minutes=15)
+PAGE_SIZE = landscape(A4)
+
+
+def _version(*values):
+    return hashlib.sha256(repr(values).encode()).hexdigest()
+
+
+def _money(value):
+    return f'{value or 0:,.2f}'
+
+
+def _cell(value, width=40):
+    text = '' if value is None else str(value)
+    return text if len(text) <= width else text[:width - 1] + '…'
+
+
+def _table(header, rows, widths=None):
+    """Yield ``Table`` flowables of at most ``TABLE_CHUNK_ROWS`` rows, each repeating ``header``."""
+    style = TableStyle([
+        ('FONT', (0, 0), (-1, -1), 'Helvetica', 8),
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 8),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e9ecef')),
+        ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.HexColor('#dee2e6')),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
+    ])
+    chunk = []
+    for row in rows:
+        chunk.append([_cell(value) for value in row])
+        if len(chunk) == TABLE_CHUNK_ROWS:
+            yield Table([header] + chunk, colWidths=widths, repeatRows=1, style=style)
+            chunk = []
+    if chunk:
+        yield Table([header] + chunk, colWidths=widths, repeatRows=1, style=style)
+
+
+def _export_table(export, start, end):
+    queryset, columns = export(start, end)
+    rows = ([value(obj) for _header, value in columns] for obj in queryset.iterator(chunk_size=2000))
+    return _table([header for header, _value in columns], rows)
+
+
+def _bar_chart(days, key, title):
+    drawing = Drawing(PAGE_SIZE[0] - 40 * mm, 60 * mm)
+    chart = VerticalBarChart()
+    chart.x, chart.y = 15 * mm, 10 * mm
+    chart.width, chart.height = drawing.width - 25 * mm, drawing.height - 20 * mm
+    chart.data = [[float(day[key]) for day in days]]
+    step = max(1, len(days) // 15)
+    chart.categoryAxis.categoryNames = [
+        day['date'].strftime('%d %b') if i % step == 0 else '' for i, day in enumerate(days)
+    ]
+    chart.categoryAxis.labels.fontSize = 7
+    chart.valueAxis.labels.fontSize = 7
+    chart.valueAxis.valueMin = 0
+    chart.bars[0].fillColor = colors.HexColor('#0d6efd')
+    drawing.add(chart)
+    return [Paragraph(title, getSampleStyleSheet()['Heading3']), drawing]
+
+
+class VisitsReport:
+    title = 'Visit Report'
+    financial = False
+
+    def version(self, start, end):
+        from patients.models import Visit
+
+        stats = Visit.objects.filter(visit_date__date__gte=start, visit_date__date__lte=end).aggregate(
+            count=Count('id'), changed=Max('updated_at'), invoiced=Sum('invoice__total_amount'),
+        )
+        return _version(sorted(stats.items()))
+
+    def story(self, start, end, styles):
+        from patients.models import Visit
+
+        days = rollups.daily_totals(start, end)
+        by_type = Visit.objects.filter(visit_date__date__gte=start, visit_date__date__lte=end).values(
+            'visit_type',
+        ).annotate(count=Count('id')).order_by('-count')
+        labels = dict(Visit.VISIT_TYPE_CHOICES)
+        yield Paragraph(f"Total visits: {sum(day['visits'] for day in days)}", styles['Normal'])
+        yield Spacer(0, 4 * mm)
+        yield from _table(['Visit Type', 'Visits'], ([labels.get(row['visit_type'], row['visit_type']), row['count']] for row in by_type))
+        yield Spacer(0, 6 * mm)
+        yield from _bar_chart(days, 'visits', 'Visits per day')
+        yield Paragraph('Visits', styles['Heading3'])
+        yield from _export_table(exports.visits, start, end)
+
+
+class RevenueReport:
+    title = 'Revenue Report'
+    financial = True
+
+    def version(self, start, end):
+        from finance.models import Payment
+
+        stats = Payment.objects.filter(payment_date__date__gte=start, payment_date__date__lte=end).aggregate(
+            count=Count('id'), last=Max('id'), total=Sum('amount'),
+        )
+        rows = rollups.range_totals(start, end)
+        return _version(sorted(stats.items()), sorted(rows.items()))
+
+    def story(self, start, end, styles):
+        days = rollups.daily_totals(start, end)
+        totals = rollups.range_totals(start, end)
+        yield Paragraph(
+            f"Total revenue: RM {_money(totals['revenue'])} from {totals['visits']} visits", styles['Normal'],
+        )
+        yield Spacer(0, 4 * mm)
+        yield from _table(
+            ['Method', 'Amount (RM)'],
+            ([method.replace('_', ' ').title(), _money(totals[method])] for method in rollups.METHODS),
+        )
+        yield Spacer(0, 6 * mm)
+        yield from _bar_chart(days, 'revenue', 'Revenue per day (RM)')
+        yield Paragraph('Daily totals', styles['Heading3'])
+        yield from _table(
+            ['Date', 'Visits', 'Revenue'] + [method.replace('_', ' ').title() for method in rollups.METHODS],
+            (
+                [day['date'], day['visits'], _money(day['revenue'])] + [_money(day[method]) for method in rollups.METHODS]
+                for day in days
+            ),
+        )
+        yield Paragraph('Payments', styles['Heading3'])
+        yield from _export_table(exports.payments, start, end)
+
+
+REPORTS = {
+    'visits': VisitsReport(),
+    'revenue': RevenueReport(),
+}
+
+
+def _page_footer(canvas, doc):
+    canvas.saveState()
+    canvas.setFont('Helvetica', 7)
+    canvas.drawString(doc.leftMargin, 8 * mm, doc.footer_text)
+    canvas.drawRightString(PAGE_SIZE[0] - doc.rightMargin, 8 * mm, f'Page {doc.page}')
+    canvas.restoreState()
+
+
+def _build(artifact, output):
+    from .models import ClinicSettings
+
+    report = REPORTS[artifact.report_type]
+    clinic = ClinicSettings.get_settings()
+    clinic_name = clinic.clinic_name if clinic else 'Clinic'
+    styles = getSampleStyleSheet()
+    doc = SimpleDocTemplate(
+        output, pagesize=PAGE_SIZE, title=report.title,
+        leftMargin=15 * mm, rightMargin=15 * mm, topMargin=15 * mm, bottomMargin=15 * mm,
+    )
+    doc.footer_text = f"{clinic_name} - {report.title} - generated {timezone.localtime():%Y-%m-%d %H:%M}"
+    story = [
+        Paragraph(f'{clinic_name}: {report.title}', styles['Title']),
+        Paragraph(f'Period: {artifact.start_date} to {artifact.end_date}', styles['Normal']),
+        Spacer(0, 6 * mm),
+    ]
+    story.extend(report.story(artifact.start_date, artifact.end_date, styles))
+    doc.build(story, onFirstPage=_page_footer, onLaterPages=_page_footer)
+
+
+def claimable(now):
+    """Artifacts waiting to render, or whose renderer has not finished within ``STALE_AFTER``."""
+    return Q(status='pending') | Q(status='rendering', started_at__lt=now - STALE_AFTER)
+
+
+def render(artifact_id):
+    """Render a pending (or stale) artifact; returns False if another worker already has it."""
+    from .models import ReportArtifact
+
+    now = timezone.now()
+    if not ReportArtifact.objects.filter(claimable(now), pk=artifact_id).update(status='rendering', started_at=now):
+        return False
+    artifact = ReportArtifact.objects.get(pk=artifact_id)
+    try:
+        with tempfile.TemporaryFile() as output:
+            _build(artifact, output)
+            output.seek(0)
+            name = f'{artifact.report_type}_{artifact.start_date}_{artifact.end_date}_{artifact.data_version[:12]}.pdf'
+            if artifact.file:
+                artifact.file.delete(save=False)
+            artifact.file.save(name, File(output), save=False)
+    except Exception as e:
+        logger.exception('Rendering report %s failed', artifact_id)
+        ReportArtifact.objects.filter(pk=artifact_id).update(status='failed', error=str(e))
+        return True
+    artifact.status = 'ready'
+    artifact.error = ''
+    artifact.completed_at = timezone.now()
+    artifact.save(update_fields=['file', 'status', 'error', 'completed_at'])
+
+    # Only older versions: one requested since may already reflect newer data.
+    superseded = ReportArtifact.objects.filter(
+        report_type=artifact.report_type, start_date=artifact.start_date, end_date=artifact.end_date,
+        created_at__lt=artifact.created_at,
+    ).exclude(status='rendering')
+    for old in superseded:
+        if old.file:
+            old.file.delete(save=False)
+        old.delete()
+    return True
+
+
+def render_job(payload, user):
+    """``ai.jobs`` handler for ``report_render`` jobs."""
+    return {'rendered': render(payload['artifact_id'])}
+
+
+def _schedule(artifact_id, user=None):
+    from ai import jobs
+
+    jobs.enqueue('report_render', {'artifact_id': artifact_id}, user=user, reference=f'report_artifact:{artifact_id}')
+
+
+def request_report(report_type, start, end, user=None, retry=False):
+    """The artifact for the current data version of a report, queued for rendering if new, stale, or failed and ``retry``."""
+    from .models import ReportArtifact
+
+    version = REPORTS[report_type].version(start, end)
+    artifact, created = ReportArtifact.objects.get_or_create(
+        report_type=report_type, start_date=start, end_date=end, data_version=version,
+        defaults={'requested_by': user},
+    )
+    missing_file = artifact.status == 'ready' and not artifact.file.storage.exists(artifact.file.name)
+    if (retry and artifact.status == 'failed') or missing_file:
+        ReportArtifact.objects.filter(pk=artifact.pk).update(status='pending', error='')
+        artifact.refresh_from_db()
+    stale = artifact.status == 'rendering' and artifact.started_at < timezone.now() - STALE_AFTER
+    if created or artifact.status == 'pending' or stale:
+        _schedule(artifact.pk, user)
+    return artifact
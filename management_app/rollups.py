@@ -0,0 +1,173 @@
+"""
+Daily clinic rollups.
+
+``DailyClinicRollup`` holds one row per (day, doctor, payer type) with the
+visit count and payment totals per payment method. Rows are maintained as
+``F()`` deltas from the ``Visit`` and ``Payment`` signals in
+``management_app.signals``, inside the writer's transaction; edits that move a
+visit or payment to another key (including re-pointing a payment's invoice at
+another visit) recompute the affected days, old and new, from source.
+``rebuild`` (and the ``backfill_rollups`` command) recomputes any date range
+under a lock on the range's rows, so a concurrent delta either lands before
+the recount (and is counted from source) or waits for it.
+
+History before the table existed is filled in by the
+``0005_backfill_daily_clinic_rollup`` migration. Until that migration is
+recorded as applied, ``daily_totals`` and ``range_totals`` compute from the
+visits and payments instead of reading a partly filled table; afterwards
+reports, charts and AI features read ranges with one indexed query each.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+METHODS = ['cash', 'card', 'ewallet', 'bank_transfer', 'credit', 'insurance']
+TOTALS = ['visits', 'revenue'] + METHODS
+
+BACKFILL_MIGRATION = ('management_app', '0005_backfill_daily_clinic_rollup')
+
+_backfilled = False
+
+
+def _empty():
+    return {'visits': 0, 'revenue': Decimal('0.00'), **{method: Decimal('0.00') for method in METHODS}}
+
+
+def add(day, doctor_id, payer_type, **deltas):
+    """Add ``deltas`` (visits, revenue, per-method amounts) to one rollup row, creating it if needed."""
+    from .models import DailyClinicRollup
+
+    rows = DailyClinicRollup.objects.filter(date=day, doctor_id=doctor_id, payer_type=payer_type or '')
+    changes = {name: F(name) + value for name, value in deltas.items()}
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyClinicRollup.objects.create(date=day, doctor_id=doctor_id, payer_type=payer_type or '', **deltas)
+    except IntegrityError:
+        rows.update(**changes)
+
+
+def visit_key(visit):
+    return (timezone.localdate(visit.visit_date), visit.doctor_id, visit.payer_type or '')
+
+
+def payment_key(payment):
+    from patients.models import Visit
+
+    visit = Visit.objects.filter(invoice=payment.invoice_id).values_list('doctor_id', 'payer_type').first()
+    doctor_id, payer_type = visit or (None, '')
+    return (timezone.localdate(payment.payment_date), doctor_id, payer_type or '')
+
+
+def add_payment(payment, sign=1):
+    amount = payment.amount * sign
+    add(*payment_key(payment), revenue=amount, **{payment.payment_method: amount})
+
+
+def source_totals(start, end):
+    """``{(day, doctor_id, payer_type): totals}`` for ``start``..``end``, aggregated from visits and payments."""
+    from finance.models import Payment
+    from patients.models import Visit
+
+    rows = {}
+
+    def row(day, doctor_id, payer_type):
+        return rows.setdefault((day, doctor_id, payer_type or ''), _empty())
+
+    visits = Visit.objects.filter(visit_date__date__range=(start, end)).annotate(
+        day=TruncDate('visit_date'),
+    ).values('day', 'doctor_id', 'payer_type').annotate(count=Count('id')).order_by()
+    for visit in visits:
+        row(visit['day'], visit['doctor_id'], visit['payer_type'])['visits'] += visit['count']
+
+    payments = Payment.objects.filter(payment_date__date__range=(start, end)).annotate(
+        day=TruncDate('payment_date'),
+    ).values(
+        'day', 'invoice__visit__doctor_id', 'invoice__visit__payer_type', 'payment_method',
+    ).annotate(total=Sum('amount')).order_by()
+    for payment in payments:
+        totals = row(payment['day'], payment['invoice__visit__doctor_id'], payment['invoice__visit__payer_type'])
+        totals['revenue'] += payment['total']
+        if payment['payment_method'] in METHODS:
+            totals[payment['payment_method']] += payment['total']
+    return rows
+
+
+def rebuild(start, end):
+    """Recompute every rollup row dated ``start``..``end`` from visits and payments."""
+    from .models import DailyClinicRollup
+
+    with transaction.atomic():
+        # Wait for writers holding these rows, then count with their changes committed.
+        list(DailyClinicRollup.objects.select_for_update().filter(date__range=(start, end)).values_list('pk'))
+        rows = source_totals(start, end)
+        DailyClinicRollup.objects.filter(date__range=(start, end)).delete()
+        DailyClinicRollup.objects.bulk_create([
+            DailyClinicRollup(date=day, doctor_id=doctor_id, payer_type=payer_type, **totals)
+            for (day, doctor_id, payer_type), totals in rows.items()
+        ], batch_size=1000)
+    return len(rows)
+
+
+def rebuild_days(*days):
+    for day in sorted(set(days)):
+        rebuild(day, day)
+
+
+def is_backfilled():
+    """Whether the history backfill migration has run (checked until it has)."""
+    global _backfilled
+    if not _backfilled:
+        app, name = BACKFILL_MIGRATION
+        _backfilled = MigrationRecorder(connection).migration_qs.filter(app=app, name=name).exists()
+    return _backfilled
+
+
+def _sum_rows(rows):
+    totals = _empty()
+    for row in rows:
+        for name in TOTALS:
+            totals[name] += row[name]
+    return totals
+
+
+def daily_totals(start, end):
+    """One dict per day from ``start`` to ``end`` (inclusive), with zeros for quiet days."""
+    from .models import DailyClinicRollup
+
+    if is_backfilled():
+        found = {
+            row['date']: row
+            for row in DailyClinicRollup.objects.filter(date__range=(start, end)).values('date').annotate(
+                **{name: Sum(name) for name in TOTALS}
+            ).order_by()
+        }
+    else:
+        by_day = {}
+        for (day, _doctor_id, _payer_type), totals in source_totals(start, end).items():
+            by_day.setdefault(day, []).append(totals)
+        found = {day: {'date': day, **_sum_rows(rows)} for day, rows in by_day.items()}
+    days = []
+    day = start
+    while day <= end:
+        days.append(found.get(day) or {'date': day, **_empty()})
+        day += timedelta(days=1)
+    return days
+
+
+def range_totals(start, end):
+    """Totals over ``start``..``end`` (inclusive)."""
+    from .models import DailyClinicRollup
+
+    if not is_backfilled():
+        return _sum_rows(source_totals(start, end).values())
+    totals = DailyClinicRollup.objects.filter(date__range=(start, end)).aggregate(
+        **{name: Sum(name) for name in TOTALS}
+    )
+    return {name: value if value is not None else _empty()[name] for name, value in totals.items()}
@@ -0,0 +1,65 @@
+"""
+Daily counters shared by every app that hands out per-day numbers.
+
+Each call to ``next_daily_value`` is a single ``INSERT ... ON CONFLICT DO
+UPDATE ... RETURNING`` statement, so concurrent callers always get distinct
+values without reading the day's rows first. When the caller's transaction
+rolls back the increment rolls back with it, so numbers stay gap-free.
+
+``reserve_daily_block`` is for batch callers: it takes a whole block of values
+in its own short transaction so the counter's row lock is not held while the
+batch is written. A batch that later rolls back leaves a gap instead.
+"""
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils import timezone
+
+from .models import DailySequence
+
+VISIT_QUEUE = 'visit_queue'
+QUEUE_TICKET = 'queue_ticket'
+
+
+def _increment(conn, name, day, step):
+    qn = conn.ops.quote_name
+    table = qn(DailySequence._meta.db_table)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({qn('name')}, {qn('date')}, {qn('value')}) VALUES (%s, %s, %s) "
+            f"ON CONFLICT ({qn('name')}, {qn('date')}) "
+            f"DO UPDATE SET {qn('value')} = {table}.{qn('value')} + EXCLUDED.{qn('value')} "
+            f"RETURNING {qn('value')}",
+            [name, day, step],
+        )
+        return cursor.fetchone()[0]
+
+
+def next_daily_value(name, day=None, step=1):
+    """Atomically add ``step`` to the (name, day) counter and return the new value."""
+    return _increment(connection, name, day or timezone.now().date(), step)
+
+
+def reserve_daily_block(name, count, day=None):
+    """
+    Take ``count`` values at once and return the last one.
+
+    Inside a transaction the increment is committed straight away on a
+    separate connection, so other workers are not queued behind the caller's
+    transaction. SQLite allows a single writer, so there (and outside a
+    transaction) this is a plain ``next_daily_value``.
+    """
+    day = day or timezone.now().date()
+    if not connection.in_atomic_block or connection.vendor == 'sqlite':
+        return _increment(connection, name, day, count)
+    side = connections.create_connection(DEFAULT_DB_ALIAS)
+    try:
+        return _increment(side, name, day, count)
+    finally:
+        side.close()
+
+
+def next_queue_number(day=None):
+    return next_daily_value(VISIT_QUEUE, day)
+
+
+def next_ticket_number(day=None):
+    return next_daily_value(QUEUE_TICKET, day)
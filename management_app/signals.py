@@ -0,0 +1,111 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from finance.models import Invoice, Payment
+from patients.models import Appointment, Visit
+from setup_app.models import Medicine
+from . import rollups
+from .dashboard_stats import invalidate_dashboard_stats
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+def dashboard_source_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_dashboard_stats)
+
+
+# Receivers that move rollup rows need the key a row had before the save.
+# ``pre_save`` reads it with one primary-key lookup, and only for updates that
+# can change it, instead of recording it for every loaded instance.
+
+VISIT_KEY_FIELDS = ('visit_date', 'doctor', 'doctor_id', 'payer_type')
+
+
+def _payment_days(**lookup):
+    return [
+        timezone.localdate(paid_at)
+        for paid_at in Payment.objects.filter(**lookup).values_list('payment_date', flat=True)
+    ]
+
+
+def _stored(instance, update_fields, watched, *fields):
+    """The stored values of ``fields``, or ``None`` if this save cannot change ``watched`` fields."""
+    if instance._state.adding or instance.pk is None:
+        return None
+    if update_fields is not None and not set(update_fields) & set(watched):
+        return None
+    return type(instance)._base_manager.filter(pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(pre_save, sender=Visit)
+def remember_visit_key(sender, instance, update_fields=None, **kwargs):
+    stored = _stored(instance, update_fields, VISIT_KEY_FIELDS, 'visit_date', 'doctor_id', 'payer_type')
+    instance._rollup_key = None
+    if stored:
+        visit_date, doctor_id, payer_type = stored
+        instance._rollup_key = (timezone.localdate(visit_date), doctor_id, payer_type or '')
+
+
+@receiver(post_save, sender=Visit)
+def visit_rollup(sender, instance, created, **kwargs):
+    key = rollups.visit_key(instance)
+    previous = instance.__dict__.pop('_rollup_key', None)
+    if created:
+        rollups.add(*key, visits=1)
+    elif previous is not None and previous != key:
+        rollups.rebuild_days(key[0], previous[0], *_payment_days(invoice__visit=instance))
+
+
+@receiver(pre_delete, sender=Visit)
+def visit_rollup_days(sender, instance, **kwargs):
+    instance._rollup_days = [rollups.visit_key(instance)[0]] + _payment_days(invoice__visit=instance)
+
+
+@receiver(post_delete, sender=Visit)
+def visit_deleted_rollup(sender, instance, **kwargs):
+    rollups.rebuild_days(*getattr(instance, '_rollup_days', [rollups.visit_key(instance)[0]]))
+
+
+@receiver(pre_save, sender=Invoice)
+def remember_invoice_visit(sender, instance, update_fields=None, **kwargs):
+    stored = _stored(instance, update_fields, ('visit', 'visit_id'), 'visit_id')
+    instance._rollup_visit_id = stored[0] if stored else instance.visit_id
+
+
+@receiver(post_save, sender=Invoice)
+def invoice_rollup(sender, instance, created, **kwargs):
+    # Payments are keyed by their invoice's visit, so re-pointing the invoice moves them.
+    previous = instance.__dict__.pop('_rollup_visit_id', instance.visit_id)
+    if not created and previous != instance.visit_id:
+        rollups.rebuild_days(*_payment_days(invoice=instance))
+
+
+PAYMENT_ROLLUP_FIELDS = ('payment_date', 'amount', 'payment_method', 'invoice', 'invoice_id')
+
+
+@receiver(pre_save, sender=Payment)
+def remember_payment_day(sender, instance, update_fields=None, **kwargs):
+    stored = _stored(instance, update_fields, PAYMENT_ROLLUP_FIELDS, 'payment_date')
+    instance._rollup_day = timezone.localdate(stored[0]) if stored else None
+
+
+@receiver(post_save, sender=Payment)
+def payment_rollup(sender, instance, created, **kwargs):
+    previous = instance.__dict__.pop('_rollup_day', None)
+    if created:
+        rollups.add_payment(instance)
+    elif previous is not None:
+        rollups.rebuild_days(timezone.localdate(instance.payment_date), previous)
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted_rollup(sender, instance, **kwargs):
+    rollups.add_payment(instance, sign=-1)
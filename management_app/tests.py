@@ -1,3 +1,465 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from ai import jobs
+from ai.models import AIJob
+from clinic_management import master_data
+from finance.models import Invoice, Payment
+from patients.models import Appointment, Consultation, Patient, Visit
+from patients import queue_state
+from . import reports, rollups
+from .dashboard_stats import management_stats
+from .models import ClinicSettings, DailyClinicRollup, DailySequence, ReportArtifact
+from .numbering import DocumentNumberGenerator, INVOICE, VISIT
+from .sequences import next_daily_value, next_queue_number, next_ticket_number
+
+
+class DailySequenceTests(TestCase):
+    def test_values_increment_per_name_and_day(self):
+        today = date(2025, 1, 1)
+        self.assertEqual(next_queue_number(today), 1)
+        self.assertEqual(next_queue_number(today), 2)
+        self.assertEqual(next_ticket_number(today), 1)
+        self.assertEqual(next_queue_number(today + timedelta(days=1)), 1)
+        self.assertEqual(DailySequence.objects.get(name='visit_queue', date=today).value, 2)
+
+    def test_step_reserves_a_block(self):
+        today = date(2025, 1, 1)
+        self.assertEqual(next_daily_value('block', today, step=100), 100)
+        self.assertEqual(next_daily_value('block', today, step=100), 200)
+
+
+class DocumentNumberGeneratorTests(TestCase):
+    def test_numbers_use_clinic_invoice_prefix(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ClinicSettings.objects.create(pk=1, clinic_name='Clinic', address='', phone='', invoice_prefix='KL')
+        number = DocumentNumberGenerator().next_number(INVOICE)
+        self.assertRegex(number, r'^KL\d{8}-0001$')
+
+    def test_workers_issue_numbers_in_order(self):
+        first_worker = DocumentNumberGenerator()
+        second_worker = DocumentNumberGenerator()
+        numbers = []
+        for _ in range(6):
+            numbers.append(first_worker.next_number(VISIT))
+            numbers.append(second_worker.next_number(VISIT))
+        self.assertEqual([int(n[-4:]) for n in numbers], list(range(1, 13)))
+
+
+class DocumentNumberBlockTests(TransactionTestCase):
+    # Blocks are committed on their own connection, so these cannot run
+    # inside TestCase's wrapping transaction.
+
+    def test_reserve_returns_consecutive_numbers(self):
+        numbers = DocumentNumberGenerator().reserve(VISIT, 3)
+        self.assertEqual([n[-4:] for n in numbers], ['0001', '0002', '0003'])
+
+    def test_block_takes_one_increment(self):
+        generator = DocumentNumberGenerator()
+        with transaction.atomic():
+            numbers = generator.reserve(INVOICE, 500)
+        self.assertEqual(len(numbers), 500)
+        self.assertEqual(DailySequence.objects.get(name='doc:invoice').value, 500)
+        self.assertTrue(generator.next_number(INVOICE).endswith('-0501'))
+
+    def test_open_batch_does_not_block_other_workers(self):
+        if connection.vendor == 'sqlite':
+            self.skipTest('SQLite allows a single writer')
+        reserved = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def batch():
+            try:
+                with transaction.atomic():
+                    DocumentNumberGenerator().reserve(INVOICE, 50)
+                    reserved.set()
+                    release.wait(10)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                reserved.set()
+                connection.close()
+
+        thread = threading.Thread(target=batch)
+        thread.start()
+        try:
+            reserved.wait(10)
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = '2s'")
+                number = DocumentNumberGenerator().next_number(INVOICE)
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(number.endswith('-0051'))
+
+
+class DailySequenceConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+    CALLS_PER_THREAD = 25
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('in-memory SQLite cannot be shared between threads')
+
+    def test_concurrent_allocations_are_unique_and_gap_free(self):
+        today = date(2025, 1, 1)
+        results = []
+        errors = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(self.CALLS_PER_THREAD):
+                    results.append(next_queue_number(today))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        total = self.THREADS * self.CALLS_PER_THREAD
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(results), list(range(1, total + 1)))
+
+
+class DashboardQueryBudgetTests(TestCase):
+    """
+    Pin each dashboard to a fixed number of queries, independent of row counts.
+
+    These run on the configured cache. Application queries are pinned on
+    every backend; under the database cache the warm request's cache reads
+    are SQL too, and their number is pinned separately.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user('doc', password='pw', role='doctor')
+        cls.admin = User.objects.create_user('boss', password='pw', role='admin')
+        now = timezone.now()
+        for i in range(5):
+            patient = Patient.objects.create(
+                patient_id=f'P{i:04d}', first_name='Pat', last_name=str(i), date_of_birth=date(1990, 1, 1),
+                gender='M', phone=f'01{i:08d}', address='-',
+            )
+            for status in ['waiting_triage', 'waiting_doctor', 'in_consultation', 'completed']:
+                visit = Visit.objects.create(
+                    patient=patient, doctor=cls.doctor, visit_number=f'V{i}{status}', visit_date=now,
+                    status=status, queue_number=i,
+                )
+                if status == 'in_consultation':
+                    Consultation.objects.create(visit=visit, doctor=cls.doctor, chief_complaint='-', diagnosis='-')
+            Appointment.objects.create(patient=patient, doctor=cls.doctor, appointment_date=now.date(), appointment_time='09:00')
+
+    def setUp(self):
+        cache.clear()
+        master_data.clear_local()
+        queue_state.clear()
+        rollups.is_backfilled()  # checked once per worker
+
+    def request(self, url):
+        """(application queries, cache queries) issued by one GET."""
+        config = settings.CACHES['default']
+        cache_table = config['LOCATION'] if config['BACKEND'].endswith('.DatabaseCache') else None
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        cached = [q for q in queries if cache_table and (cache_table in q['sql'] or 'SAVEPOINT' in q['sql'])]
+        return len(queries) - len(cached), len(cached) if cache_table else None
+
+    def assertQueryBudget(self, user, url, cold, warm, warm_cache):
+        self.client.force_login(user)
+        self.assertEqual(self.request(url)[0], cold)
+        app_queries, cache_queries = self.request(url)
+        self.assertEqual(app_queries, warm)
+        if cache_queries is not None:
+            self.assertEqual(cache_queries, warm_cache)
+
+    def test_reception_dashboard(self):
+        self.assertQueryBudget(self.admin, reverse('patients:reception_dashboard'), cold=7, warm=5, warm_cache=0)
+
+    def test_doctor_dashboard(self):
+        self.assertQueryBudget(self.doctor, reverse('patients:doctor_dashboard'), cold=8, warm=5, warm_cache=0)
+
+    def test_management_dashboard(self):
+        self.assertQueryBudget(self.admin, reverse('management_app:dashboard'), cold=12, warm=6, warm_cache=1)
+
+    def test_stats_are_invalidated_on_change(self):
+        self.assertEqual(management_stats()['total_appointments_today'], 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                patient=Patient.objects.first(), appointment_date=timezone.localdate(), appointment_time='10:00',
+            )
+        self.assertEqual(management_stats()['total_appointments_today'], 6)
+
+
+class DailyClinicRollupTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create_user('doc', password='pw', role='doctor')
+        self.patient = Patient.objects.create(
+            patient_id='P0001', first_name='Pat', last_name='One', date_of_birth=date(1990, 1, 1),
+            gender='M', phone='0100000000', address='-',
+        )
+        self.today = timezone.localdate()
+
+    def visit(self, number, doctor=None):
+        return Visit.objects.create(patient=self.patient, doctor=doctor, visit_number=number, visit_date=timezone.now())
+
+    def pay(self, visit, amount, method):
+        number = f'INV-{Invoice.objects.count() + 1}'
+        invoice = Invoice.objects.create(invoice_number=number, patient=self.patient, visit=visit)
+        return Payment.objects.create(invoice=invoice, amount=Decimal(amount), payment_method=method)
+
+    def snapshot(self):
+        return sorted(DailyClinicRollup.objects.values_list('date', 'doctor_id', 'payer_type', 'visits', 'revenue', 'cash', 'card'))
+
+    def test_incremental_rows_match_a_rebuild(self):
+        first = self.visit('V1', doctor=self.doctor)
+        second = self.visit('V2')
+        self.pay(first, '30', 'cash')
+        self.pay(second, '20', 'card').delete()
+        self.pay(second, '15', 'card')
+        second.doctor = self.doctor
+        second.save()
+
+        totals = rollups.range_totals(self.today, self.today)
+        self.assertEqual(totals['visits'], 2)
+        self.assertEqual(totals['revenue'], Decimal('45'))
+        self.assertEqual(totals['card'], Decimal('15'))
+        incremental = self.snapshot()
+        rollups.rebuild(self.today, self.today)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_moving_a_payment_to_another_day_rebuilds_both_days(self):
+        payment = self.pay(self.visit('V1'), '30', 'cash')
+        payment = Payment.objects.get(pk=payment.pk)
+        payment.payment_date = timezone.now() - timedelta(days=1)
+        payment.save()
+
+        yesterday = self.today - timedelta(days=1)
+        self.assertEqual(rollups.range_totals(self.today, self.today)['revenue'], Decimal('0'))
+        self.assertEqual(rollups.range_totals(yesterday, yesterday)['revenue'], Decimal('30'))
+        incremental = self.snapshot()
+        rollups.rebuild(yesterday, self.today)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_totals_read_from_source_until_the_backfill_has_run(self):
+        self.pay(self.visit('V1', doctor=self.doctor), '30', 'cash')
+        DailyClinicRollup.objects.all().delete()
+
+        with mock.patch.object(rollups, 'is_backfilled', return_value=False):
+            totals = rollups.range_totals(self.today, self.today)
+        self.assertEqual(totals['visits'], 1)
+        self.assertEqual(totals['cash'], Decimal('30'))
+        self.assertEqual(rollups.range_totals(self.today, self.today)['visits'], 0)
+
+    def test_saving_unrelated_fields_does_not_recount(self):
+        payment = self.pay(self.visit('V1'), '30', 'cash')
+        with mock.patch.object(rollups, 'rebuild_days') as rebuild_days:
+            payment.notes = 'checked'
+            payment.save(update_fields=['notes'])
+        rebuild_days.assert_not_called()
+
+    def test_repointing_an_invoice_moves_its_payments(self):
+        locum = User.objects.create_user('locum', password='pw', role='doctor')
+        self.pay(self.visit('V1', doctor=locum), '30', 'cash')
+        other = self.visit('V2', doctor=self.doctor)
+        invoice = Invoice.objects.get()
+        invoice.visit = other
+        invoice.save()
+
+        revenue = dict(DailyClinicRollup.objects.filter(date=self.today).values_list('doctor', 'revenue'))
+        self.assertEqual(revenue, {locum.pk: Decimal('0'), self.doctor.pk: Decimal('30')})
+        incremental = self.snapshot()
+        rollups.rebuild(self.today, self.today)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_daily_totals_fill_quiet_days(self):
+        self.visit('V1')
+        days = rollups.daily_totals(self.today - timedelta(days=2), self.today)
+        self.assertEqual([day['visits'] for day in days], [0, 0, 1])
+
+
+class MasterDataTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        master_data.clear_local()
+        ClinicSettings.objects.create(pk=1, clinic_name='Before', address='', phone='')
+
+    def test_second_process_reads_the_shared_copy(self):
+        master_data.get('clinic_settings')
+        master_data.clear_local()  # a fresh worker: empty local tier, same shared cache
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(ClinicSettings.get_settings().clinic_name, 'Before')
+        self.assertFalse([q for q in queries if 'management_app_clinicsettings' in q['sql']])
+
+    def test_warm_reads_skip_the_shared_cache(self):
+        master_data.get('clinic_settings')
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                ClinicSettings.get_settings()
+
+    def test_change_made_by_another_process_is_picked_up(self):
+        self.assertEqual(ClinicSettings.get_settings().clinic_name, 'Before')
+        # Another worker saves the row and bumps the shared version.
+        ClinicSettings.objects.filter(pk=1).update(clinic_name='After')
+        cache.set(master_data._version_key('management_app.ClinicSettings'), 'other-worker', None)
+        self.assertEqual(ClinicSettings.get_settings().clinic_name, 'Before')
+        with mock.patch('clinic_management.master_data.time.monotonic', return_value=time.monotonic() + master_data.VERSION_CHECK_INTERVAL):
+            self.assertEqual(ClinicSettings.get_settings().clinic_name, 'After')
+
+    def test_save_bumps_the_version_after_commit(self):
+        row = ClinicSettings.objects.get(pk=1)
+        self.assertEqual(ClinicSettings.get_settings().clinic_name, 'Before')
+        row.clinic_name = 'After'
+        with self.captureOnCommitCallbacks(execute=True):
+            row.save()
+        self.assertEqual(ClinicSettings.get_settings().clinic_name, 'After')
+
+    def test_login_does_not_reload_the_doctor_list(self):
+        doctor = User.objects.create_user('doc', password='pw', role='doctor')
+        master_data.clear_local()
+        self.assertEqual(master_data.get('doctors'), [doctor])
+        with mock.patch.object(master_data, 'bump') as bump, self.captureOnCommitCallbacks(execute=True):
+            self.client.login(username='doc', password='pw')
+        bump.assert_not_called()
+
+    def test_credentials_stay_out_of_the_shared_cache(self):
+        from ai.models import AIConfig
+        from einvoice.models import EInvoiceConfig
+        AIConfig.get_config()
+        EInvoiceConfig.get_config()
+        keys = [f'master_data:{name}:{master_data._versions(models)}'
+                for name, (_loader, models, _shared) in master_data._datasets.items()
+                if name in ('ai_config', 'einvoice_config')]
+        self.assertEqual(len(keys), 2)
+        self.assertEqual(cache.get_many(keys), {})
+
+    def test_evicted_version_never_revives_an_old_payload(self):
+        self.assertEqual(ClinicSettings.get_settings().clinic_name, 'Before')
+        ClinicSettings.objects.filter(pk=1).update(clinic_name='After')
+        master_data.bump(ClinicSettings)
+        self.assertEqual(ClinicSettings.get_settings().clinic_name, 'After')
+        cache.delete(master_data._version_key('management_app.ClinicSettings'))
+        master_data.clear_local()
+        self.assertEqual(ClinicSettings.get_settings().clinic_name, 'After')
+
+
+class ExportCsvTests(TestCase):
+    def setUp(self):
+        self.nurse = User.objects.create_user('nurse', password='pw', role='nurse')
+        self.finance = User.objects.create_user('cashier', password='pw', role='finance')
+
+    def export(self, user, kind, **params):
+        self.client.force_login(user)
+        return self.client.get(reverse('management_app:export_csv', args=[kind]), params)
+
+    def test_financial_exports_need_finance_access(self):
+        for kind in ('payments', 'invoices', 'prescriptions'):
+            self.assertRedirects(self.export(self.nurse, kind), reverse('management_app:dashboard'), fetch_redirect_response=False)
+            self.assertEqual(self.export(self.finance, kind).status_code, 200)
+        self.assertEqual(self.export(self.nurse, 'visits').status_code, 200)
+
+    def test_bad_dates_are_rejected_before_streaming(self):
+        response = self.export(self.finance, 'payments', start='bad')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.streaming)
+
+
+class ReportArtifactTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(self.settings(MEDIA_ROOT=media))
+        self.patient = Patient.objects.create(
+            patient_id='P0001', first_name='Pat', last_name='One', date_of_birth=date(1990, 1, 1),
+            gender='M', phone='0100000000', address='-',
+        )
+        self.today = timezone.localdate()
+
+    def artifact(self, version, **fields):
+        return ReportArtifact.objects.create(
+            report_type='visits', start_date=self.today, end_date=self.today, data_version=version, **fields,
+        )
+
+    def test_version_follows_the_data_in_range(self):
+        visits, revenue = reports.REPORTS['visits'], reports.REPORTS['revenue']
+        before = visits.version(self.today, self.today), revenue.version(self.today, self.today)
+        Visit.objects.create(patient=self.patient, visit_number='V0', visit_date=timezone.now() - timedelta(days=3))
+        self.assertEqual((visits.version(self.today, self.today), revenue.version(self.today, self.today)), before)
+
+        visit = Visit.objects.create(patient=self.patient, visit_number='V1', visit_date=timezone.now())
+        self.assertNotEqual(visits.version(self.today, self.today), before[0])
+        invoice = Invoice.objects.create(invoice_number='INV-1', patient=self.patient, visit=visit)
+        Payment.objects.create(invoice=invoice, amount=Decimal('25'), payment_method='cash')
+        self.assertNotEqual(revenue.version(self.today, self.today), before[1])
+
+    def test_render_claims_an_artifact_once(self):
+        artifact = self.artifact(reports.REPORTS['visits'].version(self.today, self.today))
+        self.assertTrue(reports.render(artifact.pk))
+        self.assertFalse(reports.render(artifact.pk))
+        artifact.refresh_from_db()
+        self.assertEqual(artifact.status, 'ready')
+
+    def test_stale_render_is_claimed_again_on_request(self):
+        version = reports.REPORTS['visits'].version(self.today, self.today)
+        artifact = self.artifact(version, status='rendering', started_at=timezone.now())
+        with mock.patch.object(reports, '_schedule') as schedule:
+            reports.request_report('visits', self.today, self.today)
+        schedule.assert_not_called()
+        self.assertFalse(reports.render(artifact.pk))
+
+        ReportArtifact.objects.filter(pk=artifact.pk).update(started_at=timezone.now() - reports.STALE_AFTER * 2)
+        with mock.patch.object(reports, '_schedule') as schedule:
+            reports.request_report('visits', self.today, self.today)
+        schedule.assert_called_once_with(artifact.pk, None)
+        self.assertTrue(reports.render(artifact.pk))
+
+    def test_new_reports_are_rendered_by_the_job_worker(self):
+        artifact = reports.request_report('visits', self.today, self.today)
+        reports.request_report('visits', self.today, self.today)
+        job = AIJob.objects.get()
+        self.assertEqual((job.kind, job.reference), ('report_render', f'report_artifact:{artifact.pk}'))
+
+        self.assertTrue(jobs.run(jobs.claim_next()))
+        artifact.refresh_from_db()
+        self.assertEqual(artifact.status, 'ready')
+
+    def test_revenue_report_needs_finance_access(self):
+        nurse = User.objects.create_user('nurse', password='pw', role='nurse')
+        finance = User.objects.create_user('finance', password='pw', role='finance')
+        url = reverse('management_app:export_report_pdf')
+        self.client.force_login(nurse)
+        self.assertRedirects(self.client.get(url, {'type': 'revenue'}), reverse('management_app:dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(url, {'type': 'visits'}).status_code, 200)
+        self.client.force_login(finance)
+        self.assertEqual(self.client.get(url, {'type': 'revenue'}).status_code, 200)
+
+    def test_rendering_an_old_version_keeps_newer_ones(self):
+        older = self.artifact('old')
+        newer = self.artifact('new')
+        reports.render(older.pk)
+        self.assertTrue(ReportArtifact.objects.filter(pk=newer.pk).exists())
+        reports.render(newer.pk)
+        self.assertEqual(list(ReportArtifact.objects.values_list('pk', flat=True)), [newer.pk])
@@ -19,6 +19,7 @@ urlpatterns = [
     
     path('reports/', views.reporting, name='reporting'),
     path('reports/export/csv/', views.export_report_csv, name='export_report_csv'),
+    path('reports/export/<str:kind>/csv/', views.export_csv, name='export_csv'),
     path('reports/export/pdf/', views.export_report_pdf, name='export_report_pdf'),
     
     path('promotions/', views.promotional_list, name='promotional_list'),
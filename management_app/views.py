@@ -1,20 +1,23 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Sum, Count, Q
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse
-from datetime import datetime, timedelta
-import csv
-from io import BytesIO
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+from datetime import date, datetime, timedelta
 from .models import ClinicSettings, Attendance, QueueTicket, PromotionalProduct, MembershipReward
 from .forms import ClinicSettingsForm, AttendanceForm, QueueTicketForm, PromotionalProductForm
+from .sequences import next_ticket_number
+from . import exports, reports, rollups
+from .dashboard_stats import management_stats
 from patients.models import Patient, Visit, Appointment
 from finance.models import Invoice, Payment
 from setup_app.models import Medicine
 from accounts.models import User
+from accounts.decorators import finance_access_required
+from clinic_management import master_data
+from clinic_management.csv_export import stream_csv
 
 
 @login_required
@@ -22,19 +25,13 @@ def dashboard(request):
     today = timezone.now().date()
     
     context = {
-        'total_patients_today': Visit.objects.filter(visit_date__date=today).count(),
-        'total_appointments_today': Appointment.objects.filter(appointment_date=today).count(),
-        'pending_appointments': Appointment.objects.filter(appointment_date=today, status='scheduled').count(),
-        'completed_visits': Visit.objects.filter(visit_date__date=today, status='completed').count(),
-        'revenue_today': Payment.objects.filter(payment_date__date=today).aggregate(Sum('amount'))['amount__sum'] or 0,
-        'pending_invoices': Invoice.objects.filter(status__in=['pending', 'partial']).count(),
-        'low_stock_medicines': Medicine.objects.filter(stock_quantity__lte=models.F('minimum_stock')).count(),
-        'recent_visits': Visit.objects.all()[:5],
+        **management_stats(today),
+        'recent_visits': Visit.objects.select_related('patient')[:5],
         'recent_patients': Patient.objects.all()[:5],
         'upcoming_appointments': Appointment.objects.filter(
             appointment_date__gte=today,
             status='scheduled'
-        ).order_by('appointment_date', 'appointment_time')[:5],
+        ).select_related('patient', 'doctor').order_by('appointment_date', 'appointment_time')[:5],
     }
     return render(request, 'management/dashboard.html', context)
 
@@ -124,14 +121,15 @@ def queue_ticket_create(request):
         if form.is_valid():
             ticket = form.save(commit=False)
             ticket.date = today
-            last_ticket = QueueTicket.objects.filter(date=today).order_by('-ticket_number').first()
-            ticket.ticket_number = (last_ticket.ticket_number + 1) if last_ticket else 1
-            ticket.save()
+            with transaction.atomic():
+                ticket.ticket_number = next_ticket_number(today)
+                ticket.save()
             messages.success(request, f'Queue ticket #{ticket.ticket_number} created.')
             return redirect('management_app:queue_display')
     else:
         form = QueueTicketForm()
         form.fields['doctor'].queryset = User.objects.filter(role='doctor', is_active=True)
+        master_data.set_choices(form.fields['doctor'], 'doctors')
     return render(request, 'management/queue_ticket_form.html', {'form': form})
 
 
@@ -161,15 +159,17 @@ def reporting(request):
     end_date = request.GET.get('end', timezone.now().date().isoformat())
     
     visits = Visit.objects.filter(visit_date__date__gte=start_date, visit_date__date__lte=end_date)
-    payments = Payment.objects.filter(payment_date__date__gte=start_date, payment_date__date__lte=end_date)
+    totals = rollups.range_totals(start_date, end_date)
     
     context = {
         'report_type': report_type,
         'start_date': start_date,
         'end_date': end_date,
-        'total_visits': visits.count(),
-        'total_revenue': payments.aggregate(Sum('amount'))['amount__sum'] or 0,
-        'revenue_by_method': payments.values('payment_method').annotate(total=Sum('amount')),
+        'total_visits': totals['visits'],
+        'total_revenue': totals['revenue'],
+        'revenue_by_method': [
+            {'payment_method': method, 'total': totals[method]} for method in rollups.METHODS if totals[method]
+        ],
         'visits_by_type': visits.values('visit_type').annotate(count=Count('id')),
         'top_medicines': Medicine.objects.filter(
             prescription__consultation__visit__visit_date__date__gte=start_date
@@ -180,59 +180,74 @@ def reporting(request):
     return render(request, 'management/reporting.html', context)
 
 
-@login_required
-def export_report_csv(request):
+def _report_range(request):
     start_date = request.GET.get('start', (timezone.now() - timedelta(days=30)).date().isoformat())
     end_date = request.GET.get('end', timezone.now().date().isoformat())
-    
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="report_{start_date}_to_{end_date}.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Date', 'Patient', 'Visit Type', 'Doctor', 'Amount'])
-    
-    visits = Visit.objects.filter(visit_date__date__gte=start_date, visit_date__date__lte=end_date)
-    for visit in visits:
-        invoice = Invoice.objects.filter(visit=visit).first()
-        writer.writerow([
-            visit.visit_date.date(),
-            visit.patient.full_name,
-            visit.get_visit_type_display(),
-            visit.doctor.get_full_name() if visit.doctor else 'N/A',
-            invoice.total_amount if invoice else 0
-        ])
-    
-    return response
+    return start_date, end_date
+
+
+@login_required
+def export_report_csv(request):
+    return export_csv(request, 'visits')
+
+
+@login_required
+def export_csv(request, kind):
+    if kind not in exports.EXPORTS:
+        raise Http404('Unknown export.')
+    if kind == 'visits':
+        return _stream_export(request, kind)
+    return finance_access_required(_stream_export)(request, kind)
+
+
+def _stream_export(request, kind):
+    start_date, end_date = _report_range(request)
+    try:
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    except ValueError:
+        # Checked up front: once streaming starts, an error can only truncate the file.
+        return HttpResponseBadRequest('Dates must be YYYY-MM-DD.')
+    queryset, columns = exports.EXPORTS[kind](start, end)
+    filename = f'report_{start_date}_to_{end_date}.csv' if kind == 'visits' else f'{kind}_{start_date}_to_{end_date}.csv'
+    return stream_csv(filename, queryset, columns)
 
 
 @login_required
 def export_report_pdf(request):
-    start_date = request.GET.get('start', (timezone.now() - timedelta(days=30)).date().isoformat())
-    end_date = request.GET.get('end', timezone.now().date().isoformat())
-    
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(100, 750, "Clinic Report")
-    p.setFont("Helvetica", 12)
-    p.drawString(100, 730, f"Period: {start_date} to {end_date}")
-    
-    visits = Visit.objects.filter(visit_date__date__gte=start_date, visit_date__date__lte=end_date)
-    payments = Payment.objects.filter(payment_date__date__gte=start_date, payment_date__date__lte=end_date)
-    
-    y = 700
-    p.drawString(100, y, f"Total Visits: {visits.count()}")
-    y -= 20
-    p.drawString(100, y, f"Total Revenue: ${payments.aggregate(Sum('amount'))['amount__sum'] or 0:.2f}")
+    report_type = request.GET.get('type', 'revenue')
+    if report_type not in reports.REPORTS:
+        raise Http404('Unknown report.')
+    if reports.REPORTS[report_type].financial:
+        return finance_access_required(_report_pdf)(request, report_type)
+    return _report_pdf(request, report_type)
+
+
+def _report_pdf(request, report_type):
+    start_date, end_date = _report_range(request)
+    try:
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    except ValueError:
+        return HttpResponseBadRequest('Dates must be YYYY-MM-DD.')
     
-    p.showPage()
-    p.save()
+    if 'retry' in request.GET:
+        reports.request_report(report_type, start, end, request.user, retry=True)
+        params = request.GET.copy()
+        del params['retry']
+        return redirect(f'{request.path}?{params.urlencode()}')
     
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="report_{start_date}_to_{end_date}.pdf"'
-    return response
+    artifact = reports.request_report(report_type, start, end, request.user)
+    if artifact.status == 'ready':
+        return FileResponse(
+            artifact.file.open('rb'), as_attachment=True,
+            filename=f'{report_type}_report_{start_date}_to_{end_date}.pdf',
+        )
+    retry = request.GET.copy()
+    retry['retry'] = '1'
+    return render(request, 'management/report_pending.html', {
+        'artifact': artifact,
+        'title': reports.REPORTS[report_type].title,
+        'retry_url': f'{request.path}?{retry.urlencode()}',
+    })
 
 
 @login_required
@@ -257,13 +272,10 @@ def promotional_create(request):
 @login_required
 def dashboard_data(request):
     today = timezone.now().date()
-    last_7_days = [(today - timedelta(days=i)).isoformat() for i in range(6, -1, -1)]
-    
-    visit_data = []
-    revenue_data = []
-    for date_str in last_7_days:
-        visit_data.append(Visit.objects.filter(visit_date__date=date_str).count())
-        revenue_data.append(float(Payment.objects.filter(payment_date__date=date_str).aggregate(Sum('amount'))['amount__sum'] or 0))
+    days = rollups.daily_totals(today - timedelta(days=6), today)
+    last_7_days = [day['date'].isoformat() for day in days]
+    visit_data = [day['visits'] for day in days]
+    revenue_data = [float(day['revenue']) for day in days]
     
     return JsonResponse({
         'labels': last_7_days,
@@ -0,0 +1,111 @@
+"""
+Remote-lookup form fields for patients and visits.
+
+A plain ``ModelChoiceField`` renders every row of its queryset as an
+``<option>``. These fields render only the selected value; the browser
+fetches candidates from the autocomplete endpoints as the user types (see the
+``data-autocomplete-url`` handler in base.html). Validation is unchanged: the
+submitted pk is checked with a single-row lookup against the queryset.
+"""
+from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+AUTOCOMPLETE_LIMIT = 20
+
+
+def patient_label(patient):
+    return f"{patient.full_name} ({patient.patient_id})"
+
+
+def visit_label(visit):
+    return f"{visit.visit_number} ({timezone.localtime(visit.visit_date):%Y-%m-%d})"
+
+
+class AutocompleteWidget(forms.Widget):
+    """
+    Hidden input holding the pk plus a search box. ``forward`` names another
+    field whose value is sent along with each lookup (e.g. the patient when
+    searching visits); changing that field clears this one.
+    """
+
+    def __init__(self, url_name, placeholder='Type to search...', forward=None, attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.placeholder = placeholder
+        self.forward = forward
+        self.choices = []
+
+    def selected_label(self, value):
+        """Label of the selected object, looked up by pk (one row at most)."""
+        if value in (None, ''):
+            return ''
+        iterator = self.choices
+        field = getattr(iterator, 'field', None)
+        if field is None:
+            return ''
+        try:
+            obj = iterator.queryset.filter(**{field.to_field_name or 'pk': value}).first()
+        except (ValueError, TypeError, ValidationError):
+            return ''
+        return field.label_from_instance(obj) if obj else ''
+
+    def render(self, name, value, attrs=None, renderer=None):
+        attrs = self.build_attrs(self.attrs, attrs)
+        input_id = attrs.pop('id', f'id_{name}')
+        css_class = ' '.join(['form-control', 'autocomplete-input'] + [
+            c for c in attrs.pop('class', '').split() if c not in ('form-control', 'form-select')
+        ])
+        value = '' if value is None else value
+        return format_html(
+            '<div class="autocomplete position-relative" data-autocomplete-url="{}"{}>'
+            '<input type="hidden" name="{}" id="{}" value="{}">'
+            '<input type="text" class="{}" id="{}_search" value="{}" '
+            'placeholder="{}" autocomplete="off"{}>'
+            '<div class="dropdown-menu autocomplete-menu w-100"></div>'
+            '</div>',
+            reverse(self.url_name),
+            format_html(' data-forward="{}"', self.forward) if self.forward else '',
+            name, input_id, value,
+            css_class, input_id, self.selected_label(value),
+            self.placeholder,
+            mark_safe(' required') if self.is_required else '',
+        )
+
+
+class AutocompleteModelChoiceField(forms.ModelChoiceField):
+    url_name = None
+    placeholder = 'Type to search...'
+    forward = None
+
+    def __init__(self, queryset, **kwargs):
+        kwargs.setdefault('widget', AutocompleteWidget(self.url_name, self.placeholder, self.forward))
+        super().__init__(queryset, **kwargs)
+
+
+class PatientChoiceField(AutocompleteModelChoiceField):
+    url_name = 'patients:patient_autocomplete'
+    placeholder = 'Search by name, IC, phone or patient ID...'
+
+    def __init__(self, queryset=None, **kwargs):
+        from .models import Patient
+        super().__init__(Patient.objects.all() if queryset is None else queryset, **kwargs)
+
+    def label_from_instance(self, obj):
+        return patient_label(obj)
+
+
+class VisitChoiceField(AutocompleteModelChoiceField):
+    url_name = 'patients:visit_autocomplete'
+    placeholder = 'Search by visit number...'
+    forward = 'patient'
+
+    def __init__(self, queryset=None, **kwargs):
+        from .models import Visit
+        super().__init__(Visit.objects.all() if queryset is None else queryset, **kwargs)
+
+    def label_from_instance(self, obj):
+        return visit_label(obj)
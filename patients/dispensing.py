@@ -0,0 +1,124 @@
+"""
+Dispensing engine: stock decrements for prescriptions and OTC sales.
+
+Each batch runs in one transaction. The medicine rows involved are locked
+with ``SELECT ... FOR UPDATE`` (in pk order, so concurrent batches cannot
+deadlock), every line is checked against the stock that is actually left, and
+all decrements are then applied with a single ``UPDATE ... SET stock_quantity =
+stock_quantity - CASE ...`` statement. Lines that would take a medicine below
+zero are reported as ``insufficient_stock`` and not dispensed, instead of
+clamping the stock at zero. Stock in expired lots does not count as
+available. Each dispensed line is drawn from the medicine's lots
+first-expiry-first-out, and every decrement is recorded in the stock ledger
+(``setup_app.inventory``) in the same transaction.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from setup_app import inventory
+
+DISPENSED = 'dispensed'
+INSUFFICIENT_STOCK = 'insufficient_stock'
+UNKNOWN_MEDICINE = 'unknown_medicine'
+NOT_DISPENSED = 'not_dispensed'
+
+
+class DispenseResult:
+    def __init__(self, lines):
+        self.lines = lines
+
+    @property
+    def dispensed(self):
+        return [line for line in self.lines if line['status'] == DISPENSED]
+
+    @property
+    def shortages(self):
+        return [line for line in self.lines if line['status'] == INSUFFICIENT_STOCK]
+
+    @property
+    def ok(self):
+        return all(line['status'] == DISPENSED for line in self.lines)
+
+
+def _apply_stock(lines, all_or_nothing, kind, reference='', user=None):
+    """
+    Check ``lines`` (dicts with ``key``, ``medicine_id`` and ``quantity``)
+    against locked stock, decrement it and record ``kind`` movements.
+    Must run inside a transaction.
+    """
+    from setup_app.models import Medicine
+
+    medicine_ids = sorted({line['medicine_id'] for line in lines if line['medicine_id']})
+    medicines = {m.pk: m for m in Medicine.objects.select_for_update().filter(pk__in=medicine_ids).order_by('pk')}
+    lots = inventory.lock_lots(list(medicines))
+
+    taken = {}
+    for line in lines:
+        medicine = medicines.get(line['medicine_id'])
+        if medicine is None:
+            line.update(status=UNKNOWN_MEDICINE, medicine=None, available=0)
+            continue
+        unusable = inventory.expired_quantity(lots.get(medicine.pk, []))
+        available = medicine.stock_quantity - unusable - taken.get(medicine.pk, 0)
+        line.update(medicine=medicine, available=available)
+        if line['quantity'] > available:
+            line['status'] = INSUFFICIENT_STOCK
+        else:
+            line['status'] = DISPENSED
+            taken[medicine.pk] = taken.get(medicine.pk, 0) + line['quantity']
+
+    result = DispenseResult(lines)
+    if all_or_nothing and not result.ok:
+        for line in result.dispensed:
+            line['status'] = NOT_DISPENSED
+        return result
+
+    rows = []
+    for line in result.dispensed:
+        line['lots'] = inventory.allocate_fefo(lots.get(line['medicine'].pk, []), line['quantity'])
+        rows.extend((line['medicine'], lot, -quantity) for lot, quantity in line['lots'])
+    inventory.post_movements(kind, rows, reference, user)
+    return result
+
+
+def dispense_items(items, all_or_nothing=True, reference='', user=None):
+    """
+    Dispense ``(medicine_id, quantity)`` pairs (e.g. an OTC sale). By default
+    nothing is dispensed unless every line can be.
+    """
+    lines = [{'key': i, 'medicine_id': medicine_id, 'quantity': quantity} for i, (medicine_id, quantity) in enumerate(items)]
+    with transaction.atomic():
+        return _apply_stock(lines, all_or_nothing, inventory.OTC, reference, user)
+
+
+def dispense_prescriptions(consultation, prescription_ids, user):
+    """
+    Dispense the selected, not yet dispensed prescriptions of ``consultation``.
+    Prescriptions short on stock stay undispensed and are reported.
+    """
+    from .models import Prescription
+
+    with transaction.atomic():
+        prescriptions = list(
+            Prescription.objects.select_for_update().filter(
+                consultation=consultation, pk__in=prescription_ids, is_dispensed=False,
+            ).order_by('pk')
+        )
+        lines = [
+            {'key': rx, 'medicine_id': rx.medicine_id, 'quantity': rx.quantity}
+            for rx in prescriptions if rx.medicine_id
+        ]
+        result = _apply_stock(
+            lines, all_or_nothing=False, kind=inventory.DISPENSE,
+            reference=consultation.visit.visit_number, user=user,
+        )
+
+        short = {line['key'].pk for line in result.lines if line['status'] != DISPENSED}
+        now = timezone.now()
+        dispensed = [rx for rx in prescriptions if rx.pk not in short]
+        for rx in dispensed:
+            rx.is_dispensed = True
+            rx.dispensed_at = now
+            rx.dispensed_by = user
+        Prescription.objects.bulk_update(dispensed, ['is_dispensed', 'dispensed_at', 'dispensed_by'])
+    return result
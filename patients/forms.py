@@ -3,6 +3,7 @@ from django.core.exceptions import ValidationError
 from datetime import date, datetime
 import re
 from .models import Patient, Visit, Consultation, Prescription, Appointment, LabResult, Immunization, Triage
+from .autocomplete import PatientChoiceField, VisitChoiceField
 
 
 def validate_nric(value):
@@ -104,11 +105,12 @@ class PatientForm(forms.ModelForm):
 
 
 class VisitForm(forms.ModelForm):
+    patient = PatientChoiceField()
+
     class Meta:
         model = Visit
         fields = ['patient', 'doctor', 'visit_type', 'payer_type', 'visit_date', 'reason']
         widgets = {
-            'patient': forms.Select(attrs={'class': 'form-select'}),
             'doctor': forms.Select(attrs={'class': 'form-select'}),
             'visit_type': forms.Select(attrs={'class': 'form-select'}),
             'payer_type': forms.Select(attrs={'class': 'form-select'}),
@@ -194,11 +196,12 @@ class PrescriptionForm(forms.ModelForm):
 
 
 class AppointmentForm(forms.ModelForm):
+    patient = PatientChoiceField()
+
     class Meta:
         model = Appointment
         fields = ['patient', 'doctor', 'appointment_date', 'appointment_time', 'reason', 'notes']
         widgets = {
-            'patient': forms.Select(attrs={'class': 'form-select'}),
             'doctor': forms.Select(attrs={'class': 'form-select'}),
             'appointment_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
             'appointment_time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
@@ -208,13 +211,14 @@ class AppointmentForm(forms.ModelForm):
 
 
 class LabResultForm(forms.ModelForm):
+    patient = PatientChoiceField()
+    visit = VisitChoiceField(required=False)
+
     class Meta:
         model = LabResult
         fields = ['patient', 'visit', 'lab_test', 'result_value', 'result_unit',
                   'normal_range', 'is_abnormal', 'notes', 'result_file', 'test_date']
         widgets = {
-            'patient': forms.Select(attrs={'class': 'form-select'}),
-            'visit': forms.Select(attrs={'class': 'form-select'}),
             'lab_test': forms.Select(attrs={'class': 'form-select'}),
             'result_value': forms.TextInput(attrs={'class': 'form-control'}),
             'result_unit': forms.TextInput(attrs={'class': 'form-control'}),
@@ -226,12 +230,13 @@ class LabResultForm(forms.ModelForm):
 
 
 class ImmunizationForm(forms.ModelForm):
+    patient = PatientChoiceField()
+
     class Meta:
         model = Immunization
         fields = ['patient', 'vaccine_name', 'batch_number', 'dose_number',
                   'date_given', 'next_due_date', 'notes']
         widgets = {
-            'patient': forms.Select(attrs={'class': 'form-select'}),
             'vaccine_name': forms.TextInput(attrs={'class': 'form-control'}),
             'batch_number': forms.TextInput(attrs={'class': 'form-control'}),
             'dose_number': forms.NumberInput(attrs={'class': 'form-control'}),
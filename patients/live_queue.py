@@ -0,0 +1,161 @@
+"""
+Shared, in-process snapshot of today's queue for the TV queue displays.
+
+Every connected display reads the same snapshot. It is rebuilt with one query
+only when it may be stale: a Visit was saved or deleted in this process
+(``invalidate`` is wired to the Visit signals), the day rolled over, or a
+cheap fingerprint query run every ``RECHECK_INTERVAL`` seconds shows that
+another worker changed today's visits.
+
+``queue_events`` is the stream for ASGI servers. A WSGI worker would have to
+park a thread on every connected display, so under WSGI the view answers with
+``queue_poll_events`` instead: the ``retry`` hint and one snapshot, after which
+the response ends and the display's EventSource reconnects within
+``RETRY_MS``. Snapshots are served from memory, so each poll is cheap.
+"""
+import asyncio
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.utils import timezone
+
+ACTIVE_QUEUE_STATUSES = ['waiting_triage', 'waiting_doctor', 'in_consultation', 'to_pharmacy', 'to_lab']
+
+POLL_INTERVAL = 1.0
+RECHECK_INTERVAL = 5.0
+KEEPALIVE_INTERVAL = 15.0
+RETRY_MS = 2000
+
+
+def build_queue_items(today=None):
+    from .models import Visit
+
+    today = today or timezone.now().date()
+    active_visits = Visit.objects.filter(
+        visit_date__date=today,
+        status__in=ACTIVE_QUEUE_STATUSES
+    ).select_related('patient', 'doctor').order_by('queue_number')
+
+    queue_items = []
+    for visit in active_visits:
+        initials = ''
+        if visit.patient.first_name:
+            initials += visit.patient.first_name[0].upper()
+        if visit.patient.last_name:
+            initials += visit.patient.last_name[0].upper()
+
+        queue_items.append({
+            'key': visit.pk,
+            'queue_number': visit.queue_number,
+            'initials': initials or 'P',
+            'doctor': visit.doctor.get_full_name() if visit.doctor else 'Any',
+            'room': visit.room or '-',
+            'status': visit.get_status_display(),
+            'status_class': visit.status_display_class,
+        })
+    return queue_items
+
+
+def diff_queue_items(old_items, new_items):
+    old_by_key = {item['key']: item for item in old_items}
+    new_keys = {item['key'] for item in new_items}
+    return {
+        'upsert': [item for item in new_items if old_by_key.get(item['key']) != item],
+        'remove': [key for key in old_by_key if key not in new_keys],
+    }
+
+
+class QueueBroadcaster:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._built_version = -1
+        self._day = None
+        self._checked_at = 0.0
+        self._fingerprint = None
+        # (revision, items) is replaced as one tuple so readers never see a mismatched pair.
+        self.state = (0, [])
+
+    def invalidate(self):
+        self._version += 1
+
+    def needs_refresh(self):
+        return (
+            self._built_version != self._version
+            or self._day != timezone.now().date()
+            or time.monotonic() - self._checked_at >= RECHECK_INTERVAL
+        )
+
+    def _read_fingerprint(self, today):
+        from .models import Visit
+        stats = Visit.objects.filter(visit_date__date=today).aggregate(count=Count('id'), changed=Max('updated_at'))
+        return stats['count'], stats['changed']
+
+    def refresh(self):
+        with self._lock:
+            if not self.needs_refresh():
+                return self.state
+            version = self._version
+            today = timezone.now().date()
+            fingerprint = self._read_fingerprint(today)
+            if version != self._built_version or today != self._day or fingerprint != self._fingerprint:
+                revision, current_items = self.state
+                items = build_queue_items(today)
+                if items != current_items:
+                    self.state = (revision + 1, items)
+            self._built_version = version
+            self._day = today
+            self._fingerprint = fingerprint
+            self._checked_at = time.monotonic()
+            return self.state
+
+    def snapshot(self):
+        if self.needs_refresh():
+            return self.refresh()
+        return self.state
+
+
+queue_broadcaster = QueueBroadcaster()
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _delta(items, new_revision, new_items):
+    delta = diff_queue_items(items, new_items)
+    delta['revision'] = new_revision
+    return _sse('delta', delta)
+
+
+async def queue_events():
+    """Server-Sent Events stream: one ``snapshot`` event, then ``delta`` events on change."""
+    get_snapshot = sync_to_async(queue_broadcaster.snapshot)
+    revision, items = await get_snapshot()
+    yield f"retry: {RETRY_MS}\n\n"
+    yield _sse('snapshot', {'revision': revision, 'items': items})
+    last_sent = time.monotonic()
+
+    while True:
+        await asyncio.sleep(POLL_INTERVAL)
+        if queue_broadcaster.needs_refresh():
+            new_revision, new_items = await get_snapshot()
+        else:
+            new_revision, new_items = queue_broadcaster.state
+
+        if new_revision != revision:
+            yield _delta(items, new_revision, new_items)
+            revision, items = new_revision, new_items
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= KEEPALIVE_INTERVAL:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+
+
+def queue_poll_events():
+    """``queue_events`` for WSGI: the retry hint and a single snapshot, without holding the thread."""
+    revision, items = queue_broadcaster.snapshot()
+    return f"retry: {RETRY_MS}\n\n" + _sse('snapshot', {'revision': revision, 'items': items})
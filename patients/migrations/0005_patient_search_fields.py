@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:22
+
+import re
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+def populate_search_fields(apps, schema_editor):
+    Patient = apps.get_model('patients', 'Patient')
+    batch = []
+    for patient in Patient.objects.only('first_name', 'last_name', 'phone', 'id_number').iterator(chunk_size=2000):
+        patient.search_name = ' '.join(f"{patient.first_name} {patient.last_name}".lower().split())
+        patient.search_phone = re.sub(r'\D', '', patient.phone or '')
+        patient.search_id_number = re.sub(r'[^0-9A-Z]', '', (patient.id_number or '').upper())
+        batch.append(patient)
+        if len(batch) >= 2000:
+            Patient.objects.bulk_update(batch, ['search_name', 'search_phone', 'search_id_number'])
+            batch = []
+    if batch:
+        Patient.objects.bulk_update(batch, ['search_name', 'search_phone', 'search_id_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_visit_payer_type_visit_room_alter_visit_doctor_and_more'),
+        ('setup_app', '0002_panel_brn_panel_tin'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='patient',
+            name='search_id_number',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='search_name',
+            field=models.CharField(blank=True, editable=False, max_length=201),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='search_phone',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(populate_search_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='patient',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_name'], name='patient_search_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
 from setup_app.models import Medicine, LabTest, Allergy, Panel
 
 
@@ -33,15 +34,34 @@ class Patient(models.Model):
     panel = models.ForeignKey(Panel, on_delete=models.SET_NULL, null=True, blank=True)
     notes = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
+    search_name = models.CharField(max_length=201, blank=True, editable=False)
+    search_phone = models.CharField(max_length=20, blank=True, db_index=True, editable=False)
+    search_id_number = models.CharField(max_length=50, blank=True, db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    SEARCH_SOURCE_FIELDS = {'first_name', 'last_name', 'phone', 'id_number'}
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            GinIndex(fields=['search_name'], name='patient_search_name_trgm', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['created_at', 'id'], name='patient_created_seek'),
+        ]
 
     def __str__(self):
         return f"{self.patient_id} - {self.first_name} {self.last_name}"
 
+    def save(self, *args, **kwargs):
+        from .search import normalize_name, normalize_phone, normalize_id_number
+        self.search_name = normalize_name(self.first_name, self.last_name)
+        self.search_phone = normalize_phone(self.phone)
+        self.search_id_number = normalize_id_number(self.id_number)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.SEARCH_SOURCE_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'search_name', 'search_phone', 'search_id_number'}
+        super().save(*args, **kwargs)
+
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
@@ -97,6 +117,9 @@ class Visit(models.Model):
 
     class Meta:
         ordering = ['-visit_date']
+        indexes = [
+            models.Index(fields=['visit_date', 'id'], name='visit_date_seek'),
+        ]
 
     def __str__(self):
         return f"{self.visit_number} - {self.patient.full_name}"
@@ -230,6 +253,9 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ['appointment_date', 'appointment_time']
+        indexes = [
+            models.Index(fields=['appointment_date', 'appointment_time', 'id'], name='appointment_seek'),
+        ]
 
     def __str__(self):
         return f"{self.patient.full_name} - {self.appointment_date} {self.appointment_time}"
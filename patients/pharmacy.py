@@ -0,0 +1,76 @@
+"""
+Pharmacy worklist: today's visits waiting at the pharmacy.
+
+Built from one annotated visit query (patient, doctor and consultation joined,
+undispensed item count annotated) plus one prefetch of the undispensed
+prescriptions with their medicines, regardless of how many patients wait.
+"""
+from django.db.models import Count, Prefetch, Q
+from django.utils import timezone
+
+
+def pharmacy_worklist(day=None):
+    """
+    Return ``(prescription_items, otc_visits)`` for ``day``.
+
+    ``prescription_items`` is a list of ``{'visit', 'prescriptions', 'total_items'}``
+    for consultations with undispensed prescriptions; ``otc_visits`` lists the
+    over-the-counter visits, which have no consultation.
+    """
+    from .models import Prescription, Visit
+
+    day = day or timezone.now().date()
+    pending = Prescription.objects.filter(is_dispensed=False).select_related('medicine').order_by('pk')
+    visits = Visit.objects.filter(
+        visit_date__date=day,
+        status='to_pharmacy',
+    ).annotate(
+        pending_items=Count('consultation__prescriptions', filter=Q(consultation__prescriptions__is_dispensed=False)),
+    ).filter(
+        Q(visit_type='otc') | Q(pending_items__gt=0)
+    ).select_related('patient', 'doctor', 'consultation').prefetch_related(
+        Prefetch('consultation__prescriptions', queryset=pending, to_attr='pending_prescriptions'),
+    ).order_by('queue_number')
+
+    prescription_items = []
+    otc_visits = []
+    for visit in visits:
+        if visit.visit_type == 'otc':
+            otc_visits.append(visit)
+        else:
+            prescription_items.append({
+                'visit': visit,
+                'prescriptions': visit.consultation.pending_prescriptions,
+                'total_items': visit.pending_items,
+            })
+    return prescription_items, otc_visits
+
+
+def serialize_worklist(prescription_items, otc_visits):
+    return {
+        'prescriptions': [
+            {
+                'visit_id': item['visit'].pk,
+                'queue_number': item['visit'].queue_number,
+                'patient': item['visit'].patient.full_name,
+                'doctor': item['visit'].doctor.get_full_name() if item['visit'].doctor else None,
+                'total_items': item['total_items'],
+                'items': [
+                    {
+                        'medicine': rx.medicine.name if rx.medicine else None,
+                        'dosage': rx.dosage,
+                        'frequency': rx.frequency,
+                        'duration': rx.duration,
+                        'quantity': rx.quantity,
+                        'in_stock': rx.medicine.stock_quantity if rx.medicine else None,
+                    }
+                    for rx in item['prescriptions']
+                ],
+            }
+            for item in prescription_items
+        ],
+        'otc': [
+            {'visit_id': visit.pk, 'queue_number': visit.queue_number, 'patient': visit.patient.full_name}
+            for visit in otc_visits
+        ],
+    }
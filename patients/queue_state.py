@@ -0,0 +1,153 @@
+"""
+Per-day projection of the visit queue, kept in process memory.
+
+The projection holds, for one day, each visit's (status, doctor, queue number)
+plus running counts per status and doctor. It is rebuilt with a single query
+when missing or out of date and is then updated in place from the Visit
+signals, so dashboard tiles read counts without scanning today's visits.
+
+Each day has a version counter in ``DailySequence``, incremented atomically
+after every committed change, and each worker's projection records the version
+it reflects. Readers compare the two with one primary-key lookup and rebuild
+whenever they differ, so another worker's change is picked up on the next
+read. A change is applied in place only when the local projection is exactly
+one version behind, i.e. no other change is missing from it. A rebuild reads
+the version before it queries, so a visit committed after that query leaves
+the projection behind the counter and costs a rebuild, never a stale board.
+"""
+import threading
+
+from django.utils import timezone
+
+from management_app.models import DailySequence
+from management_app.sequences import next_daily_value
+
+VERSION_SEQUENCE = 'queue_state'
+MAX_DAYS = 3
+
+WAITING_STATUSES = ['waiting_triage', 'waiting_doctor']
+
+_lock = threading.Lock()
+# day -> (version, QueueState)
+_states = {}
+
+
+def _visit_day(visit):
+    return timezone.localdate(visit.visit_date)
+
+
+class QueueState:
+    def __init__(self, day, visits, counts=None):
+        self.day = day
+        # visit id -> (status, doctor_id, queue_number)
+        self.visits = visits
+        # status -> {doctor_id: count}
+        self.counts = counts
+        if counts is None:
+            self.counts = {}
+            for status, doctor_id, _ in visits.values():
+                self._add_count(status, doctor_id, 1)
+
+    def copy(self):
+        return QueueState(self.day, dict(self.visits), {status: dict(by_doctor) for status, by_doctor in self.counts.items()})
+
+    def _add_count(self, status, doctor_id, delta):
+        by_doctor = self.counts.setdefault(status, {})
+        by_doctor[doctor_id] = by_doctor.get(doctor_id, 0) + delta
+        if not by_doctor[doctor_id]:
+            del by_doctor[doctor_id]
+            if not by_doctor:
+                del self.counts[status]
+
+    def _matches_doctor(self, doctor_id, doctor, include_unassigned):
+        if doctor is None:
+            return True
+        return doctor_id == doctor or (include_unassigned and doctor_id is None)
+
+    def count(self, *statuses, doctor=None, include_unassigned=False):
+        total = 0
+        for status in statuses:
+            for doctor_id, n in self.counts.get(status, {}).items():
+                if self._matches_doctor(doctor_id, doctor, include_unassigned):
+                    total += n
+        return total
+
+    def visit_ids(self, *statuses, doctor=None, include_unassigned=False):
+        """Visit ids in the given stages, ordered by queue number."""
+        rows = [
+            (queue_number or 0, visit_id)
+            for visit_id, (status, doctor_id, queue_number) in self.visits.items()
+            if status in statuses and self._matches_doctor(doctor_id, doctor, include_unassigned)
+        ]
+        return [visit_id for _, visit_id in sorted(rows)]
+
+    def apply(self, visit_id, row):
+        self.remove(visit_id)
+        self.visits[visit_id] = row
+        self._add_count(row[0], row[1], 1)
+
+    def remove(self, visit_id):
+        old = self.visits.pop(visit_id, None)
+        if old is not None:
+            self._add_count(old[0], old[1], -1)
+
+
+def _read_version(day):
+    return DailySequence.objects.filter(name=VERSION_SEQUENCE, date=day).values_list('value', flat=True).first() or 0
+
+
+def _bump_version(day):
+    return next_daily_value(VERSION_SEQUENCE, day)
+
+
+def _store(day, version, state):
+    with _lock:
+        _states[day] = (version, state)
+        while len(_states) > MAX_DAYS:
+            del _states[min(_states)]
+
+
+def rebuild_queue_state(day=None, version=None):
+    from .models import Visit
+
+    day = day or timezone.localdate()
+    if version is None:
+        version = _read_version(day)
+    rows = Visit.objects.filter(visit_date__date=day).values_list('id', 'status', 'doctor_id', 'queue_number')
+    state = QueueState(day, {visit_id: (status, doctor_id, queue_number) for visit_id, status, doctor_id, queue_number in rows})
+    _store(day, version, state)
+    return state
+
+
+def get_queue_state(day=None):
+    day = day or timezone.localdate()
+    version = _read_version(day)
+    cached = _states.get(day)
+    if cached is None or cached[0] != version:
+        return rebuild_queue_state(day, version)
+    return cached[1]
+
+
+def _update(day, change):
+    version = _bump_version(day)
+    with _lock:
+        cached = _states.get(day)
+        if cached is None or cached[0] != version - 1:
+            return
+        # Readers may hold the current state; change a copy and swap it in.
+        state = cached[1].copy()
+        change(state)
+        _states[day] = (version, state)
+
+
+def clear():
+    with _lock:
+        _states.clear()
+
+
+def record_visit(visit):
+    _update(_visit_day(visit), lambda state: state.apply(visit.pk, (visit.status, visit.doctor_id, visit.queue_number)))
+
+
+def forget_visit(visit):
+    _update(_visit_day(visit), lambda state: state.remove(visit.pk))
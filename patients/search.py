@@ -0,0 +1,108 @@
+"""
+Patient search engine used by the reception typeahead and the patient list.
+
+Searches run against normalized columns maintained by ``Patient.save()``:
+
+- ``search_name``: lower-cased "first last", backed by a pg_trgm GIN index so
+  substring matches do not fall back to a sequential scan.
+- ``search_phone``: phone number reduced to its digits.
+- ``search_id_number``: NRIC/passport reduced to upper-case letters and digits.
+
+A small query planner picks the cheapest plan for the input: digit-only input
+goes straight to the phone/IC prefix indexes, everything else is treated as a
+name or patient ID. Results are ranked so exact identifier matches come before
+name prefix matches, which come before fuzzy (substring) name matches.
+"""
+import re
+
+from django.db.models import Case, When, Value, IntegerField, Q
+
+PLAN_DIGITS = 'digits'
+PLAN_TEXT = 'text'
+
+RANK_EXACT = 0
+RANK_PREFIX = 1
+RANK_FUZZY = 2
+
+MIN_QUERY_LENGTH = 2
+
+_DIGIT_INPUT_RE = re.compile(r'^[\d\s\-+()]+$')
+
+
+def normalize_name(first_name, last_name=''):
+    full_name = f"{first_name or ''} {last_name or ''}"
+    return ' '.join(full_name.lower().split())
+
+
+def normalize_phone(phone):
+    return re.sub(r'\D', '', phone or '')
+
+
+def normalize_id_number(id_number):
+    return re.sub(r'[^0-9A-Z]', '', (id_number or '').upper())
+
+
+def plan_query(query):
+    """Return the search plan for a raw query string."""
+    if _DIGIT_INPUT_RE.match(query) and normalize_phone(query):
+        return PLAN_DIGITS
+    return PLAN_TEXT
+
+
+def _digits_filter(query):
+    digits = normalize_phone(query)
+    matches = Q(search_phone__startswith=digits) | Q(search_id_number__startswith=digits)
+    rank = Case(
+        When(Q(search_phone=digits) | Q(search_id_number=digits), then=Value(RANK_EXACT)),
+        default=Value(RANK_PREFIX),
+        output_field=IntegerField(),
+    )
+    return matches, rank
+
+
+def _text_filter(query):
+    name = normalize_name(query)
+    compact_id = normalize_id_number(query)
+    patient_id = query.strip().upper()
+
+    name_matches = Q()
+    for token in name.split():
+        name_matches &= Q(search_name__contains=token)
+
+    matches = name_matches | Q(patient_id__startswith=patient_id)
+    exact = Q(patient_id=patient_id)
+    if compact_id:
+        matches |= Q(search_id_number=compact_id)
+        exact |= Q(search_id_number=compact_id)
+
+    rank = Case(
+        When(exact, then=Value(RANK_EXACT)),
+        When(Q(search_name__startswith=name) | Q(patient_id__startswith=patient_id), then=Value(RANK_PREFIX)),
+        default=Value(RANK_FUZZY),
+        output_field=IntegerField(),
+    )
+    return matches, rank
+
+
+def search_patients(query, queryset=None):
+    """
+    Return ``queryset`` filtered to patients matching ``query``, annotated with
+    ``search_rank`` and ordered best match first.
+
+    Queries shorter than ``MIN_QUERY_LENGTH`` return an empty queryset.
+    """
+    from .models import Patient
+
+    if queryset is None:
+        queryset = Patient.objects.all()
+
+    query = (query or '').strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return queryset.none()
+
+    if plan_query(query) == PLAN_DIGITS:
+        matches, rank = _digits_filter(query)
+    else:
+        matches, rank = _text_filter(query)
+
+    return queryset.filter(matches).annotate(search_rank=rank).order_by('search_rank', 'search_name', 'pk')
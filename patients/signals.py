@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .live_queue import queue_broadcaster
+from .models import Visit
+from .queue_state import record_visit, forget_visit
+
+
+@receiver(post_save, sender=Visit)
+def visit_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: record_visit(instance))
+    transaction.on_commit(queue_broadcaster.invalidate)
+
+
+@receiver(post_delete, sender=Visit)
+def visit_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: forget_visit(instance))
+    transaction.on_commit(queue_broadcaster.invalidate)
@@ -1,3 +1,307 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from setup_app import inventory
+from setup_app.models import Medicine, StockMovement
+
+from . import dispensing, live_queue, queue_state, search
+from .models import Consultation, Patient, Prescription, Visit
+from .pharmacy import pharmacy_worklist, serialize_worklist
+
+
+class QueueStreamTests(TestCase):
+    def test_wsgi_poll_sends_one_snapshot_and_asks_to_reconnect(self):
+        body = live_queue.queue_poll_events()
+        retry, snapshot = body.split('\n\n', 1)
+        self.assertEqual(retry, f'retry: {live_queue.RETRY_MS}')
+        self.assertTrue(snapshot.startswith('event: snapshot\n'))
+        self.assertEqual(snapshot.count('event:'), 1)
+
+    def test_wsgi_requests_are_not_held_open(self):
+        response = self.client.get(reverse('patients:queue_stream'))
+        self.assertFalse(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(response.content.startswith(f'retry: {live_queue.RETRY_MS}'.encode()))
+
+
+class QueueStateTests(TestCase):
+    def setUp(self):
+        queue_state.clear()
+        self.day = timezone.localdate()
+        self.patient = Patient.objects.create(
+            patient_id='P0001', first_name='Pat', last_name='One', date_of_birth=date(1990, 1, 1),
+            gender='M', phone='0100000000', address='-',
+        )
+
+    def add_visit(self, number, status='waiting_doctor'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Visit.objects.create(
+                patient=self.patient, visit_number=number, visit_date=timezone.now(), status=status,
+            )
+
+    def test_changes_apply_in_place(self):
+        queue_state.get_queue_state(self.day)
+        self.add_visit('V1')
+        with self.assertNumQueries(1):
+            self.assertEqual(queue_state.get_queue_state(self.day).count('waiting_doctor'), 1)
+
+    def test_projection_missing_a_change_is_rebuilt(self):
+        queue_state.get_queue_state(self.day)
+        # Another worker's change bumped the version but its write never landed
+        # (or a rebuild read the database before that change committed).
+        visit = self.add_visit('V1')
+        Visit.objects.filter(pk=visit.pk).update(status='in_consultation')
+        queue_state._bump_version(self.day)
+        self.add_visit('V2')
+        with self.assertNumQueries(2):
+            state = queue_state.get_queue_state(self.day)
+        self.assertEqual((state.count('waiting_doctor'), state.count('in_consultation')), (1, 1))
+        with self.assertNumQueries(1):
+            queue_state.get_queue_state(self.day)
+
+    def test_another_workers_change_is_seen_on_next_read(self):
+        queue_state.get_queue_state(self.day)
+        # The other worker's signal bumps the shared counter but not this process's projection.
+        with mock.patch('patients.signals.record_visit', side_effect=lambda visit: queue_state._bump_version(self.day)):
+            self.add_visit('V1')
+        self.assertEqual(queue_state.get_queue_state(self.day).count('waiting_doctor'), 1)
+
+
+class VisitListTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='reception', password='x', role='receptionist'))
+        self.patient = Patient.objects.create(
+            patient_id='P0001', first_name='Pat', last_name='One', date_of_birth=date(1990, 1, 1),
+            gender='M', phone='0100000000', address='-',
+        )
+        for number in ('V1', 'V2', 'V3'):
+            Visit.objects.create(patient=self.patient, visit_number=number, visit_date=timezone.now())
+
+    def test_queue_column_pages_past_visits_without_a_number(self):
+        url = reverse('patients:visit_list')
+        params = {'format': 'datatables', 'order[0][column]': '0', 'order[0][dir]': 'asc', 'length': '2'}
+        first = self.client.get(url, params).json()
+        self.assertIsNotNone(first['next_cursor'])
+        second = self.client.get(url, {**params, 'start': '2', 'cursor': first['next_cursor']})
+        self.assertEqual(second.status_code, 200)
+        numbers = [row['visit_number'] for row in first['data'] + second.json()['data']]
+        self.assertEqual(sorted(numbers), ['V1', 'V2', 'V3'])
+
+    def test_search_box_filters_the_page(self):
+        response = self.client.get(reverse('patients:visit_list'), {'q': 'V2'})
+        self.assertEqual([v.visit_number for v in response.context['visits']], ['V2'])
+
+
+class PatientSearchTests(TestCase):
+    def setUp(self):
+        def patient(patient_id, first, last, phone, id_number):
+            return Patient.objects.create(
+                patient_id=patient_id, first_name=first, last_name=last, date_of_birth=date(1990, 1, 1),
+                gender='F', phone=phone, address='-', id_number=id_number,
+            )
+
+        self.aminah = patient('P0001', 'Aminah', 'Binti Ali', '012-345 6789', '900101-14-5678')
+        self.ali = patient('P0002', 'Ali', 'Hassan', '013-111 2222', '850505-10-1234')
+        self.salina = patient('P0003', 'Salina', 'Alias', '019-888 7777', 'A1234567')
+
+    def results(self, query):
+        return list(search.search_patients(query))
+
+    def test_normalization(self):
+        self.assertEqual(search.normalize_name('  Nur  ', 'AISYAH binti Ahmad '), 'nur aisyah binti ahmad')
+        self.assertEqual(search.normalize_phone('+60 (12) 345-6789'), '60123456789')
+        self.assertEqual(search.normalize_id_number('900101-14-5678'), '900101145678')
+        self.assertEqual(self.aminah.search_phone, '0123456789')
+
+    def test_planner_sends_digits_to_the_identifier_indexes(self):
+        self.assertEqual(search.plan_query('012-345'), search.PLAN_DIGITS)
+        self.assertEqual(search.plan_query('(013) 111'), search.PLAN_DIGITS)
+        self.assertEqual(search.plan_query('ali'), search.PLAN_TEXT)
+        self.assertEqual(search.plan_query('P0001'), search.PLAN_TEXT)
+        self.assertEqual(search.plan_query('--'), search.PLAN_TEXT)
+
+    def test_phone_and_ic_prefixes(self):
+        self.assertEqual(self.results('012 345'), [self.aminah])
+        self.assertEqual(self.results('850505'), [self.ali])
+        self.assertEqual([p.search_rank for p in search.search_patients('900101-14-5678')], [search.RANK_EXACT])
+
+    def test_name_tokens_match_anywhere_in_the_name(self):
+        self.assertEqual(self.results('binti aminah'), [self.aminah])
+        self.assertEqual(self.results('zzz'), [])
+        self.assertEqual(self.results('a'), [])
+
+    def test_ranking_puts_exact_then_prefix_then_fuzzy(self):
+        ranked = search.search_patients('ali')
+        self.assertEqual(
+            [(p, p.search_rank) for p in ranked],
+            [(self.ali, search.RANK_PREFIX), (self.aminah, search.RANK_FUZZY), (self.salina, search.RANK_FUZZY)],
+        )
+        self.assertEqual(self.results('a1234567'), [self.salina])
+        self.assertEqual(search.search_patients('p0002').get().search_rank, search.RANK_EXACT)
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='reception', password='x', role='receptionist'))
+        self.ali = Patient.objects.create(
+            patient_id='P0001', first_name='Ali', last_name='Hassan', date_of_birth=date(1990, 1, 1),
+            gender='M', phone='0131112222', address='-',
+        )
+        self.other = Patient.objects.create(
+            patient_id='P0002', first_name='Alia', last_name='Inactive', date_of_birth=date(1990, 1, 1),
+            gender='F', phone='0132223333', address='-', is_active=False,
+        )
+        self.visit = Visit.objects.create(patient=self.ali, visit_number='V20250101-0001', visit_date=timezone.now())
+        Visit.objects.create(patient=self.other, visit_number='V20250101-0002', visit_date=timezone.now())
+
+    def test_patient_results_skip_inactive_patients(self):
+        response = self.client.get(reverse('patients:patient_autocomplete'), {'q': 'ali'})
+        self.assertEqual(response.json()['results'], [{'id': self.ali.pk, 'text': 'Ali Hassan (P0001)'}])
+
+    def test_visits_are_filtered_by_patient_or_number_prefix(self):
+        url = reverse('patients:visit_autocomplete')
+        by_patient = self.client.get(url, {'patient': self.ali.pk}).json()['results']
+        self.assertEqual([v['id'] for v in by_patient], [self.visit.pk])
+        by_number = self.client.get(url, {'q': 'v20250101'}).json()['results']
+        self.assertEqual(len(by_number), 2)
+        self.assertEqual(self.client.get(url, {'q': 'v'}).json()['results'], [])
+
+    def test_lookups_require_reception_or_higher(self):
+        self.client.force_login(User.objects.create_user(username='finance', password='x', role='finance'))
+        for name in ('patients:patient_autocomplete', 'patients:visit_autocomplete'):
+            response = self.client.get(reverse(name), {'q': 'ali'})
+            self.assertRedirects(response, reverse('management_app:dashboard'), fetch_redirect_response=False)
+        self.client.logout()
+        response = self.client.get(reverse('patients:patient_autocomplete'), {'q': 'ali'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('accounts:login'), response['Location'])
+
+
+class PharmacyWorklistTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doc', password='x', role='doctor', first_name='Dr', last_name='Lee')
+        self.medicine = Medicine.objects.create(
+            name='Paracetamol', sku='PCM500', selling_price=Decimal('0.50'), cost_price=Decimal('0.20'), stock_quantity=40,
+        )
+        self.today = timezone.localdate()
+
+    def visit(self, number, queue_number, status='to_pharmacy', visit_type='medical', dispensed=()):
+        patient = Patient.objects.create(
+            patient_id=f'P{number}', first_name='Pat', last_name=number, date_of_birth=date(1990, 1, 1),
+            gender='M', phone=f'01000000{queue_number:02d}', address='-',
+        )
+        visit = Visit.objects.create(
+            patient=patient, doctor=self.doctor, visit_number=number, visit_date=timezone.now(),
+            status=status, visit_type=visit_type, queue_number=queue_number,
+        )
+        if visit_type != 'otc':
+            consultation = Consultation.objects.create(visit=visit, doctor=self.doctor, chief_complaint='-', diagnosis='-')
+            for is_dispensed in dispensed:
+                Prescription.objects.create(
+                    consultation=consultation, medicine=self.medicine, dosage='1 tab', frequency='tds',
+                    duration='3 days', quantity=9, is_dispensed=is_dispensed,
+                )
+        return visit
+
+    def test_worklist_shape_and_query_count(self):
+        waiting = [self.visit(f'V{n}', n, dispensed=(False, True, False)) for n in (2, 1, 3)]
+        self.visit('V4', 4, dispensed=(True,))
+        self.visit('V5', 5, status='in_consultation', dispensed=(False,))
+        otc = self.visit('V6', 6, visit_type='otc')
+
+        with self.assertNumQueries(2):
+            prescription_items, otc_visits = pharmacy_worklist(self.today)
+            data = serialize_worklist(prescription_items, otc_visits)
+
+        self.assertEqual([item['visit'] for item in prescription_items], [waiting[1], waiting[0], waiting[2]])
+        self.assertEqual(otc_visits, [otc])
+        first = data['prescriptions'][0]
+        self.assertEqual((first['queue_number'], first['doctor'], first['total_items']), (1, 'Dr Lee', 2))
+        self.assertEqual(first['items'][0], {
+            'medicine': 'Paracetamol', 'dosage': '1 tab', 'frequency': 'tds', 'duration': '3 days',
+            'quantity': 9, 'in_stock': 40,
+        })
+        self.assertEqual(len(first['items']), 2)
+        self.assertEqual(data['otc'], [{'visit_id': otc.pk, 'queue_number': 6, 'patient': otc.patient.full_name}])
+
+
+class DispensingTests(TestCase):
+    def setUp(self):
+        self.pharmacist = User.objects.create_user(username='nurse', password='x', role='nurse')
+        self.paracetamol = self.medicine('Paracetamol', 'PCM500', 10)
+        self.amoxicillin = self.medicine('Amoxicillin', 'AMX250', 2)
+        patient = Patient.objects.create(
+            patient_id='P0001', first_name='Pat', last_name='One', date_of_birth=date(1990, 1, 1),
+            gender='M', phone='0100000000', address='-',
+        )
+        visit = Visit.objects.create(patient=patient, visit_number='V1', visit_date=timezone.now(), status='to_pharmacy')
+        self.consultation = Consultation.objects.create(visit=visit, chief_complaint='-', diagnosis='-')
+
+    def medicine(self, name, sku, stock, **lot):
+        medicine = Medicine.objects.create(
+            name=name, sku=sku, selling_price=Decimal('1.00'), cost_price=Decimal('0.50'), minimum_stock=3,
+        )
+        inventory.receive_stock([(medicine, stock, *lot.values())])
+        medicine.refresh_from_db()
+        return medicine
+
+    def prescribe(self, medicine, quantity):
+        return Prescription.objects.create(
+            consultation=self.consultation, medicine=medicine, dosage='1', frequency='tds', duration='3 days', quantity=quantity,
+        )
+
+    def stock(self, medicine):
+        medicine.refresh_from_db()
+        return medicine.stock_quantity
+
+    def test_each_line_is_checked_against_what_is_left(self):
+        first = self.prescribe(self.paracetamol, 6)
+        second = self.prescribe(self.paracetamol, 6)
+        third = self.prescribe(self.amoxicillin, 2)
+        result = dispensing.dispense_prescriptions(self.consultation, [first.pk, second.pk, third.pk], self.pharmacist)
+
+        self.assertEqual([line['status'] for line in result.lines], [dispensing.DISPENSED, dispensing.INSUFFICIENT_STOCK, dispensing.DISPENSED])
+        self.assertEqual(result.shortages[0]['available'], 4)
+        self.assertEqual((self.stock(self.paracetamol), self.stock(self.amoxicillin)), (4, 0))
+        self.assertTrue(self.amoxicillin.is_low_stock)
+        dispensed = set(Prescription.objects.filter(is_dispensed=True).values_list('pk', flat=True))
+        self.assertEqual(dispensed, {first.pk, third.pk})
+        movements = StockMovement.objects.filter(kind=inventory.DISPENSE)
+        self.assertEqual(sorted(movements.values_list('quantity', flat=True)), [-6, -2])
+        self.assertEqual(set(movements.values_list('reference', flat=True)), {'V1'})
+
+    def test_stock_is_decremented_with_one_locked_update(self):
+        lines = [self.prescribe(self.paracetamol, 3).pk, self.prescribe(self.amoxicillin, 1).pk]
+        with CaptureQueriesContext(connection) as queries:
+            dispensing.dispense_prescriptions(self.consultation, lines, self.pharmacist)
+        sql = [q['sql'] for q in queries]
+        updates = [s for s in sql if s.startswith('UPDATE "setup_app_medicine"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('CASE WHEN', updates[0])
+        if connection.features.has_select_for_update:
+            self.assertTrue(any(s.startswith('SELECT') and 'setup_app_medicine' in s and 'FOR UPDATE' in s for s in sql))
+        self.assertEqual((self.stock(self.paracetamol), self.stock(self.amoxicillin)), (7, 1))
+
+    def test_otc_sale_is_all_or_nothing(self):
+        result = dispensing.dispense_items([(self.paracetamol.pk, 5), (self.amoxicillin.pk, 3), (0, 1)])
+        self.assertFalse(result.ok)
+        self.assertEqual(
+            [line['status'] for line in result.lines],
+            [dispensing.NOT_DISPENSED, dispensing.INSUFFICIENT_STOCK, dispensing.UNKNOWN_MEDICINE],
+        )
+        self.assertEqual((self.stock(self.paracetamol), self.stock(self.amoxicillin)), (10, 2))
+        self.assertFalse(StockMovement.objects.filter(kind=inventory.OTC).exists())
 
-# Create your tests here.
+    def test_expired_lots_are_not_available(self):
+        expired = self.medicine('Ibuprofen', 'IBU200', 5, batch_number='B1', expiry_date=timezone.localdate() - timedelta(days=1))
+        result = dispensing.dispense_items([(expired.pk, 1)])
+        self.assertEqual(result.shortages[0]['available'], 0)
+        self.assertEqual(self.stock(expired), 5)
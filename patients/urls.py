@@ -39,6 +39,8 @@ urlpatterns = [
     # Reception Dashboard
     path('reception/', views.reception_dashboard, name='reception_dashboard'),
     path('reception/search/', views.patient_search_api, name='patient_search_api'),
+    path('autocomplete/patients/', views.patient_autocomplete, name='patient_autocomplete'),
+    path('autocomplete/visits/', views.visit_autocomplete, name='visit_autocomplete'),
     path('reception/check-in/<int:patient_id>/', views.patient_check_in, name='patient_check_in'),
     path('reception/walk-in/', views.walk_in_registration, name='walk_in_registration'),
     
@@ -53,9 +55,11 @@ urlpatterns = [
     
     # Pharmacy Dashboard
     path('pharmacy/', views.pharmacy_dashboard, name='pharmacy_dashboard'),
+    path('pharmacy/worklist/', views.pharmacy_worklist_api, name='pharmacy_worklist_api'),
     path('pharmacy/dispense/<int:visit_id>/', views.dispense_prescriptions, name='dispense_prescriptions'),
     path('pharmacy/otc/<int:visit_id>/', views.otc_dispense, name='otc_dispense'),
     
     # Queue Display
     path('queue/', views.queue_display, name='queue_display'),
+    path('queue/stream/', views.queue_stream, name='queue_stream'),
 ]
@@ -1,16 +1,33 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count, F
+from django.db import transaction
+from django.db.models import Q, Count
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from datetime import datetime, timedelta
 import uuid
 from .models import Patient, Visit, Consultation, Prescription, Appointment, LabResult, Immunization, Triage
 from .forms import PatientForm, VisitForm, ConsultationForm, PrescriptionForm, AppointmentForm, LabResultForm, ImmunizationForm, CheckInForm, TriageForm
+from .search import search_patients
+from .autocomplete import AUTOCOMPLETE_LIMIT, patient_label, visit_label
+from .pharmacy import pharmacy_worklist, serialize_worklist
+from . import dispensing
+from .live_queue import queue_broadcaster, queue_events, queue_poll_events
 from accounts.models import User
+from clinic_management import master_data
+from clinic_management.pagination import paginate, wants_datatables, datatables_response
 from accounts.decorators import doctor_required, clinical_staff_required, reception_or_higher, nurse_required, pharmacy_required, finance_access_required
 from setup_app.models import Panel, Medicine
+from setup_app import inventory, medicine_resolver
+from management_app.sequences import next_queue_number
+from management_app.dashboard_stats import reception_stats, nurse_stats, doctor_stats
+from management_app import numbering
+from management_app.numbering import next_document_number
 
 
 def generate_patient_id():
@@ -18,20 +35,26 @@ def generate_patient_id():
 
 
 def generate_visit_number():
-    return f"V{timezone.now().strftime('%Y%m%d%H%M%S')}"
+    return next_document_number(numbering.VISIT)
 
 
 @login_required
 def patient_list(request):
     query = request.GET.get('q', '')
     patients = Patient.objects.filter(is_active=True)
+    if wants_datatables(request):
+        return datatables_response(request, patients, [
+            ('patient_id', 'patient_id', lambda p: p.patient_id),
+            ('name', 'search_name', lambda p: p.full_name),
+            ('age', None, lambda p: p.age),
+            ('gender', None, lambda p: p.get_gender_display()),
+            ('phone', None, lambda p: p.phone),
+            ('url', None, lambda p: reverse('patients:patient_detail', args=[p.pk])),
+        ], ['-created_at'], search=lambda qs, term: search_patients(term, qs))
     if query:
-        patients = patients.filter(
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query) |
-            Q(patient_id__icontains=query) |
-            Q(phone__icontains=query)
-        )
+        patients = paginate(request, search_patients(query, patients), ['search_rank', 'search_name'])
+    else:
+        patients = paginate(request, patients, ['-created_at'])
     return render(request, 'patients/patient_list.html', {'patients': patients, 'query': query})
 
 
@@ -97,8 +120,28 @@ def patient_history(request, pk):
 @login_required
 def visit_list(request):
     date_filter = request.GET.get('date', timezone.now().date().isoformat())
-    visits = Visit.objects.filter(visit_date__date=date_filter).order_by('-visit_date')
-    return render(request, 'patients/visit_list.html', {'visits': visits, 'date_filter': date_filter})
+    query = request.GET.get('q', '').strip()
+    visits = Visit.objects.filter(visit_date__date=date_filter).select_related('patient', 'doctor')
+    if query:
+        visits = search_visits(visits, query)
+    if wants_datatables(request):
+        # queue_number is nullable and a cursor cannot seek past None, so sort on a non-null stand-in.
+        visits = visits.annotate(queue_position=Coalesce('queue_number', 0))
+        return datatables_response(request, visits, [
+            ('queue_number', 'queue_position', lambda v: v.queue_number),
+            ('visit_number', 'visit_number', lambda v: v.visit_number),
+            ('patient', None, lambda v: v.patient.full_name),
+            ('visit_type', None, lambda v: v.get_visit_type_display()),
+            ('doctor', None, lambda v: v.doctor.get_full_name() if v.doctor else '-'),
+            ('status', 'status', lambda v: v.get_status_display()),
+            ('url', None, lambda v: reverse('patients:visit_detail', args=[v.pk])),
+        ], ['-visit_date'], search=search_visits)
+    visits = paginate(request, visits, ['-visit_date'])
+    return render(request, 'patients/visit_list.html', {'visits': visits, 'date_filter': date_filter, 'query': query})
+
+
+def search_visits(visits, term):
+    return visits.filter(Q(visit_number__icontains=term) | Q(patient__search_name__contains=term.lower()))
 
 
 @login_required
@@ -112,19 +155,21 @@ def visit_create(request, patient_id=None):
     if request.method == 'POST':
         form = VisitForm(request.POST)
         form.fields['doctor'].queryset = User.objects.filter(role='doctor', is_active=True)
+        master_data.set_choices(form.fields['doctor'], 'doctors')
         if form.is_valid():
             visit = form.save(commit=False)
             visit.visit_number = generate_visit_number()
             visit.created_by = request.user
-            today_visits = Visit.objects.filter(visit_date__date=timezone.now().date()).count()
-            visit.queue_number = today_visits + 1
-            visit.save()
+            with transaction.atomic():
+                visit.queue_number = next_queue_number(timezone.localdate(visit.visit_date))
+                visit.save()
             messages.success(request, f'Visit registered. Queue number: {visit.queue_number}')
             return redirect('patients:visit_detail', pk=visit.pk)
     else:
         initial['visit_date'] = timezone.now()
         form = VisitForm(initial=initial)
         form.fields['doctor'].queryset = User.objects.filter(role='doctor', is_active=True)
+        master_data.set_choices(form.fields['doctor'], 'doctors')
     return render(request, 'patients/visit_form.html', {'form': form, 'title': 'Register Visit'})
 
 
@@ -241,7 +286,6 @@ def prescription_add(request, consultation_id):
 @login_required
 def add_prescriptions_bulk(request, consultation_id):
     import json
-    from setup_app.models import Medicine
     
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'POST required'}, status=400)
@@ -254,30 +298,28 @@ def add_prescriptions_bulk(request, consultation_id):
         if not prescriptions_data:
             return JsonResponse({'success': False, 'error': 'No prescriptions provided'}, status=400)
         
-        added_count = 0
-        for rx in prescriptions_data:
-            medicine = None
-            if rx.get('medicine_id'):
-                medicine = Medicine.objects.filter(id=rx['medicine_id']).first()
-            if not medicine:
-                medicine = Medicine.objects.filter(name__iexact=rx.get('medicine_name', '')).first()
-            if not medicine:
-                medicine = Medicine.objects.filter(name__icontains=rx.get('medicine_name', '')).first()
-            
-            if medicine:
-                Prescription.objects.create(
-                    consultation=consultation,
-                    medicine=medicine,
-                    dosage=rx.get('dosage', ''),
-                    frequency=rx.get('frequency', ''),
-                    duration=rx.get('duration', ''),
-                    quantity=rx.get('quantity', 1),
-                    instructions=rx.get('instructions', ''),
-                    is_dispensed=False,
-                )
-                added_count += 1
+        matches = medicine_resolver.resolve_many(prescriptions_data)
+        prescriptions = Prescription.objects.bulk_create([
+            Prescription(
+                consultation=consultation,
+                medicine_id=match.medicine_id,
+                dosage=rx.get('dosage', ''),
+                frequency=rx.get('frequency', ''),
+                duration=rx.get('duration', ''),
+                quantity=rx.get('quantity', 1),
+                instructions=rx.get('instructions', ''),
+                is_dispensed=False,
+            )
+            for rx, match in zip(prescriptions_data, matches) if match
+        ])
         
-        return JsonResponse({'success': True, 'added_count': added_count})
+        return JsonResponse({
+            'success': True,
+            'added_count': len(prescriptions),
+            'unresolved': [
+                rx.get('medicine_name', '') for rx, match in zip(prescriptions_data, matches) if not match
+            ],
+        })
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
     except Exception as e:
@@ -289,13 +331,26 @@ def appointment_list(request):
     date_filter = request.GET.get('date', '')
     doctor_filter = request.GET.get('doctor', '')
     
-    appointments = Appointment.objects.all().order_by('appointment_date', 'appointment_time')
+    appointments = Appointment.objects.select_related('patient', 'doctor')
     if date_filter:
         appointments = appointments.filter(appointment_date=date_filter)
     if doctor_filter:
         appointments = appointments.filter(doctor_id=doctor_filter)
     
-    doctors = User.objects.filter(role='doctor', is_active=True)
+    ordering = ['appointment_date', 'appointment_time']
+    if wants_datatables(request):
+        return datatables_response(request, appointments, [
+            ('date', 'appointment_date', lambda a: a.appointment_date.isoformat()),
+            ('time', 'appointment_time', lambda a: a.appointment_time.strftime('%H:%M')),
+            ('patient', None, lambda a: a.patient.full_name),
+            ('doctor', None, lambda a: a.doctor.get_full_name() if a.doctor else '-'),
+            ('reason', None, lambda a: a.reason),
+            ('status', 'status', lambda a: a.get_status_display()),
+            ('url', None, lambda a: reverse('patients:appointment_edit', args=[a.pk])),
+        ], ordering)
+    appointments = paginate(request, appointments, ordering)
+    
+    doctors = master_data.lazy('doctors')
     return render(request, 'patients/appointment_list.html', {
         'appointments': appointments,
         'date_filter': date_filter,
@@ -318,6 +373,7 @@ def appointment_create(request):
     else:
         form = AppointmentForm()
         form.fields['doctor'].queryset = User.objects.filter(role='doctor', is_active=True)
+        master_data.set_choices(form.fields['doctor'], 'doctors')
     return render(request, 'patients/appointment_form.html', {'form': form, 'title': 'Schedule Appointment'})
 
 
@@ -334,6 +390,7 @@ def appointment_edit(request, pk):
     else:
         form = AppointmentForm(instance=appointment)
         form.fields['doctor'].queryset = User.objects.filter(role='doctor', is_active=True)
+        master_data.set_choices(form.fields['doctor'], 'doctors')
     return render(request, 'patients/appointment_form.html', {'form': form, 'title': 'Edit Appointment'})
 
 
@@ -350,7 +407,7 @@ def appointment_status(request, pk, status):
 
 @login_required
 def calendar_view(request):
-    doctors = User.objects.filter(role='doctor', is_active=True)
+    doctors = master_data.lazy('doctors')
     return render(request, 'patients/calendar.html', {'doctors': doctors})
 
 
@@ -406,19 +463,13 @@ def reception_dashboard(request):
         visit_date__date=today
     ).select_related('patient', 'doctor').order_by('queue_number')
     
-    waiting_count = todays_visits.filter(status__in=['waiting_triage', 'waiting_doctor']).count()
-    in_progress_count = todays_visits.filter(status='in_consultation').count()
-    completed_count = todays_visits.filter(status='completed').count()
-    
-    doctors = User.objects.filter(role='doctor', is_active=True)
-    panels = Panel.objects.filter(is_active=True)
+    doctors = master_data.lazy('doctors')
+    panels = master_data.lazy('panels')
     
     context = {
+        **reception_stats(today),
         'todays_appointments': todays_appointments,
         'todays_visits': todays_visits,
-        'waiting_count': waiting_count,
-        'in_progress_count': in_progress_count,
-        'completed_count': completed_count,
         'doctors': doctors,
         'panels': panels,
         'today': today,
@@ -430,16 +481,12 @@ def reception_dashboard(request):
 @reception_or_higher
 def patient_search_api(request):
     query = request.GET.get('q', '').strip()
-    if len(query) < 2:
-        return JsonResponse({'results': []})
-    
-    patients = Patient.objects.filter(
-        Q(first_name__icontains=query) |
-        Q(last_name__icontains=query) |
-        Q(patient_id__icontains=query) |
-        Q(phone__icontains=query) |
-        Q(id_number__icontains=query)
-    ).filter(is_active=True)[:10]
+    patients = search_patients(
+        query,
+        Patient.objects.filter(is_active=True).select_related('panel').only(
+            'patient_id', 'first_name', 'last_name', 'phone', 'date_of_birth', 'gender', 'panel', 'panel__company_name'
+        )
+    )[:10]
     
     results = []
     for p in patients:
@@ -451,11 +498,37 @@ def patient_search_api(request):
             'dob': p.date_of_birth.strftime('%Y-%m-%d'),
             'age': p.age,
             'gender': p.gender,
-            'panel': p.panel.name if p.panel else None,
+            'panel': p.panel.company_name if p.panel else None,
         })
     return JsonResponse({'results': results})
 
 
+@login_required
+@reception_or_higher
+def patient_autocomplete(request):
+    patients = search_patients(
+        request.GET.get('q', ''),
+        Patient.objects.filter(is_active=True).only('patient_id', 'first_name', 'last_name')
+    )[:AUTOCOMPLETE_LIMIT]
+    return JsonResponse({'results': [{'id': p.pk, 'text': patient_label(p)} for p in patients]})
+
+
+@login_required
+@reception_or_higher
+def visit_autocomplete(request):
+    query = request.GET.get('q', '').strip().upper()
+    patient_id = request.GET.get('patient', '')
+    visits = Visit.objects.only('visit_number', 'visit_date')
+    if patient_id.isdigit():
+        visits = visits.filter(patient_id=patient_id)
+    elif len(query) < 2:
+        return JsonResponse({'results': []})
+    if query:
+        visits = visits.filter(visit_number__startswith=query)
+    visits = visits.order_by('-visit_date')[:AUTOCOMPLETE_LIMIT]
+    return JsonResponse({'results': [{'id': v.pk, 'text': visit_label(v)} for v in visits]})
+
+
 @login_required
 @reception_or_higher
 def patient_check_in(request, patient_id):
@@ -473,9 +546,9 @@ def patient_check_in(request, patient_id):
                 visit.status = 'to_pharmacy'
             else:
                 visit.status = 'waiting_triage'
-            today_visits = Visit.objects.filter(visit_date__date=timezone.now().date()).count()
-            visit.queue_number = today_visits + 1
-            visit.save()
+            with transaction.atomic():
+                visit.queue_number = next_queue_number()
+                visit.save()
             if visit.visit_type == 'otc':
                 messages.success(request, f'OTC patient checked in. Queue #{visit.queue_number} - Proceed to Pharmacy')
             else:
@@ -487,6 +560,7 @@ def patient_check_in(request, patient_id):
             initial['payer_type'] = 'corporate'
         form = CheckInForm(initial=initial)
         form.fields['doctor'].queryset = User.objects.filter(role='doctor', is_active=True)
+        master_data.set_choices(form.fields['doctor'], 'doctors')
     
     recent_visits = patient.visits.all()[:5]
     
@@ -535,6 +609,7 @@ def nurse_dashboard(request):
     ).select_related('patient', 'doctor', 'triage').order_by('-updated_at')[:10]
     
     context = {
+        **nurse_stats(today),
         'waiting_triage': waiting_triage,
         'in_triage': in_triage,
         'today': today,
@@ -609,26 +684,25 @@ def doctor_dashboard(request):
     visits = Visit.objects.filter(
         visit_date__date=today,
         status__in=['waiting_doctor', 'in_consultation']
-    ).select_related('patient', 'doctor', 'triage')
+    ).select_related('patient', 'doctor', 'triage', 'consultation').prefetch_related('patient__allergies')
     
+    count_filter = {}
     if doctor_filter:
         visits = visits.filter(doctor_id=doctor_filter)
+        count_filter = {'doctor': int(doctor_filter)}
     elif request.user.role == 'doctor':
         visits = visits.filter(Q(doctor=request.user) | Q(doctor__isnull=True))
+        count_filter = {'doctor': request.user.pk, 'include_unassigned': True}
     
     visits = visits.order_by('queue_number')
     
-    doctors = User.objects.filter(role='doctor', is_active=True)
-    
-    waiting_count = visits.filter(status='waiting_doctor').count()
-    in_consultation_count = visits.filter(status='in_consultation').count()
+    doctors = master_data.lazy('doctors')
     
     context = {
+        **doctor_stats(today, **count_filter),
         'visits': visits,
         'doctors': doctors,
         'doctor_filter': doctor_filter,
-        'waiting_count': waiting_count,
-        'in_consultation_count': in_consultation_count,
         'today': today,
     }
     return render(request, 'patients/doctor_dashboard.html', context)
@@ -683,29 +757,9 @@ def complete_consultation(request, consultation_id):
 def pharmacy_dashboard(request):
     today = timezone.now().date()
     
-    pending_visits = Visit.objects.filter(
-        visit_date__date=today,
-        status='to_pharmacy'
-    ).select_related('patient', 'doctor').order_by('queue_number')
+    pending_prescriptions, otc_visits = pharmacy_worklist(today)
     
-    pending_prescriptions = []
-    otc_visits = []
-    
-    for visit in pending_visits:
-        if visit.visit_type == 'otc':
-            otc_visits.append(visit)
-        elif hasattr(visit, 'consultation'):
-            prescriptions = visit.consultation.prescriptions.filter(is_dispensed=False)
-            if prescriptions.exists():
-                pending_prescriptions.append({
-                    'visit': visit,
-                    'prescriptions': prescriptions,
-                    'total_items': prescriptions.count(),
-                })
-    
-    low_stock_medicines = Medicine.objects.filter(
-        stock_quantity__lte=F('minimum_stock')
-    ).order_by('stock_quantity')[:10]
+    low_stock_medicines = inventory.low_stock_medicines()[:10]
     
     context = {
         'pending_prescriptions': pending_prescriptions,
@@ -716,6 +770,12 @@ def pharmacy_dashboard(request):
     return render(request, 'patients/pharmacy_dashboard.html', context)
 
 
+@login_required
+@pharmacy_required
+def pharmacy_worklist_api(request):
+    return JsonResponse(serialize_worklist(*pharmacy_worklist()))
+
+
 @login_required
 @pharmacy_required
 def dispense_prescriptions(request, visit_id):
@@ -728,20 +788,13 @@ def dispense_prescriptions(request, visit_id):
     prescriptions = visit.consultation.prescriptions.all()
     
     if request.method == 'POST':
-        dispensed_ids = request.POST.getlist('dispensed')
-        
-        for prescription in prescriptions:
-            if str(prescription.id) in dispensed_ids:
-                if not prescription.is_dispensed:
-                    prescription.is_dispensed = True
-                    prescription.dispensed_at = timezone.now()
-                    prescription.dispensed_by = request.user
-                    prescription.save()
-                    
-                    if prescription.medicine:
-                        medicine = prescription.medicine
-                        medicine.stock_quantity = max(0, medicine.stock_quantity - prescription.quantity)
-                        medicine.save()
+        dispensed_ids = [pk for pk in request.POST.getlist('dispensed') if pk.isdigit()]
+        result = dispensing.dispense_prescriptions(visit.consultation, dispensed_ids, request.user)
+        for line in result.shortages:
+            messages.warning(
+                request,
+                f"{line['medicine'].name}: {line['quantity']} requested but only {line['available']} in stock. Not dispensed."
+            )
         
         all_dispensed = not prescriptions.filter(is_dispensed=False).exists()
         if all_dispensed:
@@ -768,29 +821,34 @@ def otc_dispense(request, visit_id):
         messages.error(request, 'This is not an OTC visit.')
         return redirect('patients:pharmacy_dashboard')
     
+    # Stock levels change on every sale, so they are read live, not from master data.
     medicines = Medicine.objects.filter(is_active=True).order_by('name')
     
     if request.method == 'POST':
         medicine_ids = request.POST.getlist('medicine_id')
         quantities = request.POST.getlist('quantity')
         
-        items_added = 0
+        items = []
         for med_id, qty in zip(medicine_ids, quantities):
-            if med_id and qty:
-                try:
-                    medicine = Medicine.objects.get(pk=med_id)
-                    quantity = int(qty)
-                    if quantity > 0:
-                        medicine.stock_quantity = max(0, medicine.stock_quantity - quantity)
-                        medicine.save()
-                        items_added += 1
-                except (Medicine.DoesNotExist, ValueError):
-                    continue
+            if med_id.isdigit() and qty.isdigit() and int(qty) > 0:
+                items.append((int(med_id), int(qty)))
+        
+        result = dispensing.dispense_items(items, reference=visit.visit_number, user=request.user)
+        if not result.ok:
+            for line in result.shortages:
+                messages.error(
+                    request,
+                    f"{line['medicine'].name}: {line['quantity']} requested but only {line['available']} in stock."
+                )
+            if any(line['status'] == dispensing.UNKNOWN_MEDICINE for line in result.lines):
+                messages.error(request, 'One or more selected medicines no longer exist.')
+            messages.error(request, 'Nothing was dispensed. Please adjust the items and try again.')
+            return redirect('patients:otc_dispense', visit_id=visit.pk)
         
         visit.status = 'ready_for_payment'
         visit.save()
         
-        messages.success(request, f'OTC items dispensed ({items_added} items). Patient ready for payment.')
+        messages.success(request, f'OTC items dispensed ({len(result.dispensed)} items). Patient ready for payment.')
         return redirect('patients:pharmacy_dashboard')
     
     return render(request, 'patients/otc_dispense.html', {
@@ -803,31 +861,21 @@ def otc_dispense(request, visit_id):
 
 def queue_display(request):
     today = timezone.now().date()
-    
-    active_visits = Visit.objects.filter(
-        visit_date__date=today,
-        status__in=['waiting_triage', 'waiting_doctor', 'in_consultation', 'to_pharmacy', 'to_lab']
-    ).select_related('patient', 'doctor').order_by('queue_number')
-    
-    queue_items = []
-    for visit in active_visits:
-        initials = ''
-        if visit.patient.first_name:
-            initials += visit.patient.first_name[0].upper()
-        if visit.patient.last_name:
-            initials += visit.patient.last_name[0].upper()
-        
-        queue_items.append({
-            'queue_number': visit.queue_number,
-            'initials': initials or 'P',
-            'doctor': visit.doctor.get_full_name() if visit.doctor else 'Any',
-            'room': visit.room or '-',
-            'status': visit.get_status_display(),
-            'status_class': visit.status_display_class,
-        })
+    revision, queue_items = queue_broadcaster.snapshot()
     
     context = {
         'queue_items': queue_items,
+        'revision': revision,
         'today': today,
     }
     return render(request, 'patients/queue_display.html', context)
+
+
+async def queue_stream(request):
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(queue_events(), content_type='text/event-stream')
+    else:
+        response = HttpResponse(await sync_to_async(queue_poll_events)(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
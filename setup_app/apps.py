@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SetupAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'setup_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
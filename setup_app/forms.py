@@ -7,7 +7,7 @@ class MedicineForm(forms.ModelForm):
         model = Medicine
         fields = ['name', 'generic_name', 'strength', 'form', 'pack_size', 'sku',
                   'selling_price', 'cost_price', 'tax_rate', 'stock_quantity',
-                  'minimum_stock', 'expiry_date', 'batch_number', 'is_active']
+                  'minimum_stock', 'expiry_date', 'batch_number', 'preferred_supplier', 'is_active']
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control'}),
             'generic_name': forms.TextInput(attrs={'class': 'form-control'}),
@@ -22,6 +22,7 @@ class MedicineForm(forms.ModelForm):
             'minimum_stock': forms.NumberInput(attrs={'class': 'form-control'}),
             'expiry_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
             'batch_number': forms.TextInput(attrs={'class': 'form-control'}),
+            'preferred_supplier': forms.Select(attrs={'class': 'form-select'}),
             'is_active': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
@@ -0,0 +1,354 @@
+"""
+Stock ledger for medicines and disposables.
+
+Every change to ``stock_quantity`` goes through this module (or the dispensing
+engine in ``patients.dispensing``) and appends ``StockMovement`` rows in the
+same transaction. Stock itself is only ever changed with ``F()`` deltas, never
+written back from Python.
+
+Medicine stock is broken down into ``MedicineLot`` rows by batch and expiry.
+Issues draw from unexpired lots first-expiry-first-out (``allocate_fefo``),
+then from unlotted stock; expired lots are not dispensable and are cleared by
+``write_off_expired``.
+
+``StockSnapshot`` rows hold each item's closing balance per day (written by the
+``snapshot_stock`` command), so the balance on any date is one snapshot read
+plus one aggregate over the movements since, and daily consumption is a single
+GROUP BY over the ledger.
+"""
+from datetime import datetime, time, timedelta
+from math import ceil
+
+from django.db import transaction
+from django.db.models import BooleanField, Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.db.models.lookups import LessThanOrEqual
+from django.utils import timezone
+
+DISPENSE = 'dispense'
+OTC = 'otc'
+RECEIPT = 'receipt'
+ADJUSTMENT = 'adjustment'
+EXPIRY = 'expiry'
+
+ISSUE_KINDS = [DISPENSE, OTC]
+
+
+def _item_field(item):
+    from .models import Medicine
+    return 'medicine' if isinstance(item, Medicine) else 'disposable'
+
+
+def _day_end(day):
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _plus(field, deltas):
+    return F(field) + Case(
+        *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+        output_field=IntegerField(),
+    )
+
+
+def apply_deltas(model, deltas):
+    """Add ``{pk: delta}`` to ``model.stock_quantity`` in one UPDATE."""
+    if not deltas:
+        return
+    new_stock = _plus('stock_quantity', deltas)
+    updates = {'stock_quantity': new_stock}
+    fields = {f.name for f in model._meta.fields}
+    if 'is_low_stock' in fields:
+        updates['is_low_stock'] = Case(
+            When(LessThanOrEqual(new_stock, F('minimum_stock')), then=Value(True)),
+            default=Value(False), output_field=BooleanField(),
+        )
+    if 'updated_at' in fields:
+        updates['updated_at'] = timezone.now()
+    model.objects.filter(pk__in=deltas).update(**updates)
+    from management_app.dashboard_stats import invalidate_dashboard_stats
+    transaction.on_commit(invalidate_dashboard_stats)
+
+
+def record_movements(kind, rows, reference='', user=None):
+    """Append ledger rows for ``(item, lot, signed quantity)`` entries."""
+    from .models import StockMovement
+
+    now = timezone.now()
+    StockMovement.objects.bulk_create([
+        StockMovement(**{_item_field(item): item}, lot=lot, kind=kind, quantity=quantity,
+                      reference=reference, created_by=user, created_at=now)
+        for item, lot, quantity in rows if quantity
+    ])
+
+
+def post_movements(kind, rows, reference='', user=None):
+    """Apply ``(item, lot, signed quantity)`` rows to item and lot stock and record them."""
+    from .models import Disposable, Medicine, MedicineLot
+
+    with transaction.atomic():
+        for model in (Medicine, Disposable):
+            deltas = {}
+            for item, lot, quantity in rows:
+                if isinstance(item, model):
+                    deltas[item.pk] = deltas.get(item.pk, 0) + quantity
+            apply_deltas(model, deltas)
+        lot_deltas = {}
+        for item, lot, quantity in rows:
+            if lot is not None:
+                lot_deltas[lot.pk] = lot_deltas.get(lot.pk, 0) + quantity
+        if lot_deltas:
+            MedicineLot.objects.filter(pk__in=lot_deltas).update(quantity=_plus('quantity', lot_deltas))
+        record_movements(kind, rows, reference, user)
+
+
+def lock_lots(medicine_ids):
+    """
+    Lock the non-empty lots of ``medicine_ids`` and return them as
+    ``{medicine_id: [lot, ...]}`` in first-expiry-first-out order. Callers
+    lock the medicines first, in pk order, so lot locks never deadlock.
+    """
+    from .models import MedicineLot
+
+    lots = {}
+    for lot in MedicineLot.objects.select_for_update().filter(
+        medicine_id__in=medicine_ids, quantity__gt=0,
+    ).order_by('medicine_id', F('expiry_date').asc(nulls_last=True), 'pk'):
+        lots.setdefault(lot.medicine_id, []).append(lot)
+    return lots
+
+
+def expired_quantity(lots, day=None):
+    day = day or timezone.localdate()
+    return sum(lot.quantity for lot in lots if lot.expiry_date is not None and lot.expiry_date < day)
+
+
+def allocate_fefo(lots, quantity, include_expired=False, day=None):
+    """
+    Split ``quantity`` across ``lots`` (as returned by ``lock_lots``),
+    earliest expiry first. Whatever the lots cannot cover is taken from
+    unlotted stock (lot ``None``). Lot quantities are reduced in memory so
+    later allocations in the same batch see what is left.
+    Returns ``[(lot, quantity), ...]``.
+    """
+    day = day or timezone.localdate()
+    allocations = []
+    for lot in lots:
+        if quantity <= 0:
+            break
+        if not include_expired and lot.expiry_date is not None and lot.expiry_date < day:
+            continue
+        take = min(lot.quantity, quantity)
+        if take > 0:
+            lot.quantity -= take
+            quantity -= take
+            allocations.append((lot, take))
+    if quantity > 0:
+        allocations.append((None, quantity))
+    return allocations
+
+
+def _new_lot(medicine, batch_number='', expiry_date=None):
+    from .models import MedicineLot
+
+    if not batch_number and expiry_date is None:
+        return None
+    return MedicineLot.objects.create(medicine=medicine, batch_number=batch_number, expiry_date=expiry_date)
+
+
+def receive_stock(entries, reference='', user=None):
+    """
+    Receive ``(item, quantity[, batch_number, expiry_date])`` entries. Medicines
+    received with a batch number or expiry date go into a new lot.
+    """
+    from .models import Medicine
+
+    with transaction.atomic():
+        rows = []
+        for item, quantity, *lot_info in entries:
+            lot = _new_lot(item, *lot_info) if isinstance(item, Medicine) and lot_info else None
+            rows.append((item, lot, quantity))
+        post_movements(RECEIPT, rows, reference, user)
+
+
+def adjust_stock(item, delta, user=None, reason='', batch_number='', expiry_date=None):
+    """
+    Apply a stock correction. Medicine reductions come out of unlotted stock
+    first, then out of the lots in expiry order.
+    """
+    from .models import Medicine
+
+    with transaction.atomic():
+        if not isinstance(item, Medicine):
+            rows = [(item, None, delta)]
+        elif delta >= 0:
+            rows = [(item, _new_lot(item, batch_number, expiry_date) if delta else None, delta)]
+        else:
+            stock = Medicine.objects.select_for_update().values_list('stock_quantity', flat=True).get(pk=item.pk)
+            lots = lock_lots([item.pk]).get(item.pk, [])
+            unlotted = min(max(stock - sum(lot.quantity for lot in lots), 0), -delta)
+            allocations = allocate_fefo(lots, -delta - unlotted, include_expired=True)
+            if unlotted:
+                allocations.append((None, unlotted))
+            rows = [(item, lot, -quantity) for lot, quantity in allocations]
+        post_movements(ADJUSTMENT, rows, reason, user)
+
+
+def write_off_expired(day=None, user=None):
+    """Write off every lot that expired before ``day`` (default: today). Returns the lots written off."""
+    from .models import Medicine, MedicineLot
+
+    day = day or timezone.localdate()
+    with transaction.atomic():
+        expired = MedicineLot.objects.filter(quantity__gt=0, expiry_date__lt=day)
+        medicines = {m.pk: m for m in Medicine.objects.select_for_update().filter(
+            pk__in=expired.values('medicine_id'),
+        ).order_by('pk')}
+        lots = [lot for group in lock_lots(list(medicines)).values() for lot in group
+                if lot.expiry_date is not None and lot.expiry_date < day]
+        post_movements(EXPIRY, [(medicines[lot.medicine_id], lot, -lot.quantity) for lot in lots],
+                       f'Expired before {day}', user)
+    return len(lots)
+
+
+def near_expiry_lots(days=90, day=None):
+    """Non-empty lots expiring within ``days`` of ``day``, soonest first (already expired included)."""
+    from .models import MedicineLot
+
+    day = day or timezone.localdate()
+    return MedicineLot.objects.filter(
+        quantity__gt=0, expiry_date__lte=day + timedelta(days=days),
+    ).select_related('medicine').order_by('expiry_date', 'pk')
+
+
+def save_stock_form(form, user=None):
+    """
+    Save a Medicine or Disposable ModelForm. The edited ``stock_quantity`` is
+    treated as a stock count: the difference from the locked current balance
+    is applied as an adjustment, the other fields are saved as usual.
+    """
+    with transaction.atomic():
+        item = form.save(commit=False)
+        target = item.stock_quantity
+        model = type(item)
+        lot_info = {}
+        if item.pk is None:
+            item.stock_quantity = 0
+            item.save()
+            delta, reason = target, 'Opening stock'
+            if hasattr(item, 'lots'):
+                lot_info = {'batch_number': item.batch_number, 'expiry_date': item.expiry_date}
+        else:
+            current = model.objects.select_for_update().values_list('stock_quantity', flat=True).get(pk=item.pk)
+            item.save(update_fields=[
+                f.name for f in model._meta.concrete_fields
+                if not f.primary_key and f.name != 'stock_quantity'
+            ])
+            delta, reason = target - current, 'Stock count'
+        form.save_m2m()
+        adjust_stock(item, delta, user, reason, **lot_info)
+        item.stock_quantity = target
+    return item
+
+
+def low_stock_medicines():
+    """Active medicines at or below their minimum stock, lowest stock first (partial index)."""
+    from .models import Medicine
+
+    return Medicine.objects.filter(is_low_stock=True, is_active=True).order_by('stock_quantity', 'pk')
+
+
+def reorder_queue(cover_days=30, history_days=30):
+    """
+    Suggested purchase quantities for the low-stock watchlist, grouped by
+    preferred supplier (medicines without one come last, under ``None``).
+
+    Each medicine is topped up to its minimum plus ``cover_days`` of its
+    average daily issues over the last ``history_days`` (and to at least twice
+    its minimum).
+    """
+    from .models import StockMovement
+
+    medicines = list(low_stock_medicines().select_related('preferred_supplier'))
+    since = timezone.now() - timedelta(days=history_days)
+    issued = dict(
+        StockMovement.objects.filter(
+            medicine__in=medicines, kind__in=ISSUE_KINDS, created_at__gte=since,
+        ).values_list('medicine').annotate(total=-Sum('quantity')).order_by()
+    )
+
+    groups = {}
+    for medicine in medicines:
+        daily = issued.get(medicine.pk, 0) / history_days
+        target = max(medicine.minimum_stock * 2, medicine.minimum_stock + ceil(daily * cover_days))
+        quantity = target - medicine.stock_quantity
+        if quantity <= 0:
+            continue
+        group = groups.setdefault(medicine.preferred_supplier_id, {
+            'supplier': medicine.preferred_supplier, 'items': [], 'total_cost': 0,
+        })
+        group['items'].append({
+            'medicine': medicine,
+            'daily_usage': round(daily, 2),
+            'quantity': quantity,
+            'cost': medicine.cost_price * quantity,
+        })
+        group['total_cost'] += medicine.cost_price * quantity
+    return sorted(groups.values(), key=lambda g: (g['supplier'] is None, g['supplier'].name if g['supplier'] else ''))
+
+
+def stock_on(item, day):
+    """Closing balance of ``item`` at the end of ``day``."""
+    from .models import StockMovement, StockSnapshot
+
+    field = _item_field(item)
+    snapshot = StockSnapshot.objects.filter(**{field: item}, date__lte=day).order_by('-date').first()
+    movements = StockMovement.objects.filter(**{field: item})
+    if snapshot is not None:
+        delta = movements.filter(
+            created_at__gte=_day_end(snapshot.date), created_at__lt=_day_end(day),
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        return snapshot.quantity + delta
+
+    # No snapshot yet: walk back from the live balance.
+    current = type(item).objects.filter(pk=item.pk).values_list('stock_quantity', flat=True).get()
+    later = movements.filter(created_at__gte=_day_end(day)).aggregate(total=Sum('quantity'))['total'] or 0
+    return current - later
+
+
+def consumption_by_day(start, end, medicine=None):
+    """Units issued per medicine per day between ``start`` and ``end`` (inclusive)."""
+    from .models import StockMovement
+
+    movements = StockMovement.objects.filter(
+        kind__in=ISSUE_KINDS, medicine__isnull=False,
+        created_at__gte=_day_end(start - timedelta(days=1)), created_at__lt=_day_end(end),
+    )
+    if medicine is not None:
+        movements = movements.filter(medicine=medicine)
+    return movements.annotate(
+        day=TruncDate('created_at'),
+    ).values('medicine', 'day').annotate(quantity=-Sum('quantity')).order_by('day', 'medicine')
+
+
+def take_snapshots(day=None):
+    """Write every item's closing balance for ``day`` (default: yesterday). Returns the row count."""
+    from .models import Disposable, Medicine, StockMovement, StockSnapshot
+
+    day = day or timezone.localdate() - timedelta(days=1)
+    cutoff = _day_end(day)
+    count = 0
+    for model, field in ((Medicine, 'medicine'), (Disposable, 'disposable')):
+        later = dict(
+            StockMovement.objects.filter(**{f'{field}__isnull': False}, created_at__gte=cutoff)
+            .values_list(field).annotate(total=Sum('quantity')).order_by()
+        )
+        snapshots = [
+            StockSnapshot(**{f'{field}_id': pk}, date=day, quantity=stock - later.get(pk, 0))
+            for pk, stock in model.objects.values_list('pk', 'stock_quantity').iterator()
+        ]
+        StockSnapshot.objects.bulk_create(
+            snapshots, batch_size=1000,
+            update_conflicts=True, unique_fields=[field, 'date'], update_fields=['quantity'],
+        )
+        count += len(snapshots)
+    return count
@@ -0,0 +1,24 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from setup_app.inventory import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Record each medicine's and disposable's closing stock balance for a day (default: yesterday)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to snapshot (YYYY-MM-DD).')
+        parser.add_argument('--days', type=int, default=1, help='Number of days ending at --date to (re)write.')
+
+    def handle(self, *args, **options):
+        try:
+            end = date.fromisoformat(options['date']) if options['date'] else timezone.localdate() - timedelta(days=1)
+        except ValueError:
+            raise CommandError('--date must be YYYY-MM-DD.')
+        for offset in range(options['days'] - 1, -1, -1):
+            day = end - timedelta(days=offset)
+            count = take_snapshots(day)
+            self.stdout.write(f'{day}: {count} snapshots written.')
@@ -0,0 +1,186 @@
+"""
+Medicine name resolver.
+
+Maps free-text drug names (typically from AI suggestions) to active medicines
+without a query per name. Each process keeps a normalized index of the active
+medicines (name, generic name, strength, SKU) with a trigram inverted index.
+The index is versioned through the cache: saves and deletes of ``Medicine``
+bump the version (see ``setup_app.signals``) and every process rebuilds its
+copy, with one query, on its next lookup. ``INDEX_MAX_AGE`` bounds staleness
+for processes that do not share a cache.
+
+Candidates are scored by trigram similarity and token overlap against the
+name, the name with strength and the generic name; a matching strength in the
+query lifts a candidate and a conflicting one sinks it. A medicine's own name
+outranks another medicine's generic name, both for exact keys and, through
+``GENERIC_WEIGHT``, for equally close fuzzy matches.
+"""
+import re
+import threading
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'medicine_resolver:version'
+INDEX_MAX_AGE = 300
+MIN_SCORE = 0.45
+GENERIC_WEIGHT = 0.95
+
+_STRENGTH_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml|iu|%)\b')
+_PUNCT_RE = re.compile(r'[^\w%.]+')
+
+
+def normalize(text):
+    text = (text or '').lower()
+    text = _STRENGTH_RE.sub(r'\1\2', text)
+    return ' '.join(_PUNCT_RE.sub(' ', text).split())
+
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _strengths(text):
+    return {f'{number}{unit}' for number, unit in _STRENGTH_RE.findall(text)}
+
+
+class Match:
+    def __init__(self, medicine_id, name, score):
+        self.medicine_id = medicine_id
+        self.name = name
+        self.score = score
+
+    def __repr__(self):
+        return f'Match({self.medicine_id}, {self.name!r}, {self.score:.2f})'
+
+
+class _Entry:
+    def __init__(self, pk, name, generic_name, strength, sku):
+        self.pk = pk
+        self.name = name
+        self.sku = (sku or '').lower()
+        self.strengths = _strengths(normalize(strength))
+        self.name_keys = {normalize(name), normalize(f'{name} {strength}')} - {''}
+        self.generic_key = normalize(generic_name)
+        keys = [(key, 1.0) for key in self.name_keys]
+        if self.generic_key and self.generic_key not in self.name_keys:
+            keys.append((self.generic_key, GENERIC_WEIGHT))
+        self.keys = [(key, set(key.split()), _trigrams(key), weight) for key, weight in keys]
+
+
+class MedicineIndex:
+    def __init__(self, rows, version):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.entries = [_Entry(*row) for row in rows]
+        self.by_pk = {entry.pk: entry for entry in self.entries}
+        self.by_sku = {entry.sku: entry for entry in self.entries if entry.sku}
+        self.by_key = {}
+        self.by_trigram = {}
+        # A medicine's own name wins an exact lookup over another medicine's generic name.
+        for entry in self.entries:
+            for key in entry.name_keys:
+                self.by_key.setdefault(key, entry)
+        for entry in self.entries:
+            if entry.generic_key:
+                self.by_key.setdefault(entry.generic_key, entry)
+            for _key, _tokens, grams, _weight in entry.keys:
+                for gram in grams:
+                    self.by_trigram.setdefault(gram, set()).add(entry)
+
+    def _score(self, entry, tokens, grams, strengths):
+        best = 0.0
+        for key, key_tokens, key_grams, weight in entry.keys:
+            trigram = len(grams & key_grams) / len(grams | key_grams)
+            overlap = len(tokens & key_tokens) / len(tokens)
+            best = max(best, weight * (0.6 * trigram + 0.4 * overlap))
+        if strengths and entry.strengths:
+            best += 0.1 if strengths & entry.strengths else -0.2
+        return best
+
+    def resolve(self, name, medicine_id=None, min_score=MIN_SCORE):
+        """Best active medicine for ``name`` (or ``medicine_id``, if it is active), or ``None``."""
+        try:
+            entry = self.by_pk.get(int(medicine_id)) if medicine_id else None
+        except (TypeError, ValueError):
+            entry = None
+        if entry is not None:
+            return Match(entry.pk, entry.name, 1.0)
+
+        query = normalize(name)
+        if not query:
+            return None
+        entry = self.by_key.get(query) or self.by_sku.get((name or '').strip().lower())
+        if entry is not None:
+            return Match(entry.pk, entry.name, 1.0)
+
+        tokens = set(query.split())
+        grams = _trigrams(query)
+        strengths = _strengths(query)
+        candidates = set()
+        for gram in grams:
+            candidates |= self.by_trigram.get(gram, set())
+        best, best_score = None, min_score
+        for entry in candidates:
+            score = self._score(entry, tokens, grams, strengths)
+            if score > best_score or (score == best_score and best is not None and entry.pk < best.pk):
+                best, best_score = entry, score
+        return Match(best.pk, best.name, round(min(best_score, 1.0), 3)) if best else None
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def get_index():
+    global _index
+    version = _current_version()
+    index = _index
+    if index is not None and index.version == version and time.monotonic() - index.built_at < INDEX_MAX_AGE:
+        return index
+    with _lock:
+        index = _index
+        if index is None or index.version != version or time.monotonic() - index.built_at >= INDEX_MAX_AGE:
+            from .models import Medicine
+            rows = Medicine.objects.filter(is_active=True).order_by('pk').values_list(
+                'pk', 'name', 'generic_name', 'strength', 'sku',
+            )
+            index = _index = MedicineIndex(list(rows), version)
+    return index
+
+
+def invalidate():
+    """Make every process rebuild its index on its next lookup."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+def resolve(name, medicine_id=None, min_score=MIN_SCORE):
+    return get_index().resolve(name, medicine_id, min_score)
+
+
+def resolve_many(items, min_score=MIN_SCORE):
+    """
+    Resolve a list of ``{'medicine_name', 'medicine_id'}`` dicts (or plain
+    names) against one index snapshot. Returns a list of ``Match`` or ``None``
+    in the same order.
+    """
+    index = get_index()
+    results = []
+    for item in items:
+        if isinstance(item, dict):
+            results.append(index.resolve(item.get('medicine_name', ''), item.get('medicine_id'), min_score))
+        else:
+            results.append(index.resolve(item, min_score=min_score))
+    return results
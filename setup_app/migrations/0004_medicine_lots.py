@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_lots(apps, schema_editor):
+    """Turn each medicine's single batch/expiry into a lot holding its current stock."""
+    Medicine = apps.get_model('setup_app', 'Medicine')
+    MedicineLot = apps.get_model('setup_app', 'MedicineLot')
+    medicines = Medicine.objects.filter(stock_quantity__gt=0).exclude(batch_number='', expiry_date__isnull=True)
+    MedicineLot.objects.bulk_create([
+        MedicineLot(medicine=m, batch_number=m.batch_number, expiry_date=m.expiry_date, quantity=m.stock_quantity)
+        for m in medicines.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('setup_app', '0003_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicineLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_number', models.CharField(blank=True, max_length=50)),
+                ('expiry_date', models.DateField(blank=True, null=True)),
+                ('quantity', models.IntegerField(default=0)),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='setup_app.medicine')),
+            ],
+            options={
+                'ordering': ['expiry_date', 'pk'],
+            },
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='lot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='setup_app.medicinelot'),
+        ),
+        migrations.AddIndex(
+            model_name='medicinelot',
+            index=models.Index(fields=['medicine', 'expiry_date'], name='lot_fefo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicinelot',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['expiry_date'], name='lot_near_expiry_idx'),
+        ),
+        migrations.RunPython(seed_lots, migrations.RunPython.noop),
+    ]
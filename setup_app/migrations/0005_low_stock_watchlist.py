@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def flag_low_stock(apps, schema_editor):
+    Medicine = apps.get_model('setup_app', 'Medicine')
+    Medicine.objects.filter(stock_quantity__lte=models.F('minimum_stock')).update(is_low_stock=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0004_stock_order_item_lot'),
+        ('setup_app', '0004_medicine_lots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='is_low_stock',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='medicine',
+            name='preferred_supplier',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='preferred_medicines', to='finance.supplier'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_low_stock', True)), fields=['stock_quantity'], name='medicine_low_stock_idx'),
+        ),
+        migrations.RunPython(flag_low_stock, migrations.RunPython.noop),
+    ]
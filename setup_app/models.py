@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 
 class Medicine(models.Model):
@@ -27,19 +28,60 @@ class Medicine(models.Model):
     minimum_stock = models.IntegerField(default=10)
     expiry_date = models.DateField(null=True, blank=True)
     batch_number = models.CharField(max_length=50, blank=True)
+    preferred_supplier = models.ForeignKey(
+        'finance.Supplier', on_delete=models.SET_NULL, null=True, blank=True, related_name='preferred_medicines',
+    )
+    # Maintained on save and by every stock update in setup_app.inventory.
+    is_low_stock = models.BooleanField(default=False, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(
+                fields=['stock_quantity'], name='medicine_low_stock_idx',
+                condition=models.Q(is_low_stock=True, is_active=True),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.strength})" if self.strength else self.name
 
+    def save(self, *args, **kwargs):
+        self.is_low_stock = self.stock_quantity <= self.minimum_stock
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'is_low_stock' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'is_low_stock']
+        super().save(*args, **kwargs)
+
+
+class MedicineLot(models.Model):
+    """
+    A received batch of a medicine. ``Medicine.stock_quantity`` stays the total
+    on hand; lots break it down by batch and expiry, and any remainder not
+    covered by a lot is unlotted stock.
+    """
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='lots')
+    batch_number = models.CharField(max_length=50, blank=True)
+    expiry_date = models.DateField(null=True, blank=True)
+    quantity = models.IntegerField(default=0)
+    received_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['expiry_date', 'pk']
+        indexes = [
+            models.Index(fields=['medicine', 'expiry_date'], name='lot_fefo_idx'),
+            models.Index(fields=['expiry_date'], name='lot_near_expiry_idx', condition=models.Q(quantity__gt=0)),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine} lot {self.batch_number or self.pk} (exp {self.expiry_date or '-'})"
+
     @property
-    def is_low_stock(self):
-        return self.stock_quantity <= self.minimum_stock
+    def is_expired(self):
+        return self.expiry_date is not None and self.expiry_date < timezone.localdate()
 
 
 class LabTest(models.Model):
@@ -147,3 +189,56 @@ class Panel(models.Model):
 
     def __str__(self):
         return f"{self.company_name} ({self.panel_code})"
+
+
+class StockMovement(models.Model):
+    """Append-only stock ledger. ``quantity`` is signed: receipts are positive, issues negative."""
+    KIND_CHOICES = [
+        ('dispense', 'Prescription Dispense'),
+        ('otc', 'OTC Sale'),
+        ('receipt', 'Purchase Order Receipt'),
+        ('adjustment', 'Adjustment'),
+        ('expiry', 'Expiry Write-off'),
+    ]
+
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, null=True, blank=True, related_name='stock_movements')
+    disposable = models.ForeignKey(Disposable, on_delete=models.CASCADE, null=True, blank=True, related_name='stock_movements')
+    lot = models.ForeignKey(MedicineLot, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField()
+    reference = models.CharField(max_length=100, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['medicine', 'created_at'], name='stock_move_medicine_idx'),
+            models.Index(fields=['disposable', 'created_at'], name='stock_move_disposable_idx'),
+            models.Index(fields=['kind', 'created_at'], name='stock_move_kind_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.quantity:+d} {self.medicine or self.disposable}"
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError('Stock movements are append-only.')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Stock movements are append-only.')
+
+
+class StockSnapshot(models.Model):
+    """Closing balance of one item at the end of ``date`` (local time)."""
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, null=True, blank=True, related_name='stock_snapshots')
+    disposable = models.ForeignKey(Disposable, on_delete=models.CASCADE, null=True, blank=True, related_name='stock_snapshots')
+    date = models.DateField()
+    quantity = models.IntegerField()
+
+    class Meta:
+        unique_together = [['medicine', 'date'], ['disposable', 'date']]
+
+    def __str__(self):
+        return f"{self.medicine or self.disposable} on {self.date}: {self.quantity}"
@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import medicine_resolver
+from .models import Medicine
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+def medicine_changed(sender, instance, **kwargs):
+    transaction.on_commit(medicine_resolver.invalidate)
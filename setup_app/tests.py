@@ -1,3 +1,147 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from clinic_management import master_data
+from finance.models import Supplier
+
+from . import inventory
+from .medicine_resolver import MIN_SCORE, MedicineIndex, normalize
+from .models import Medicine, MedicineLot, StockMovement
+
+
+class MedicineIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = MedicineIndex([
+            (1, 'Panadol', 'Paracetamol', '500 mg', 'MED-001'),
+            (2, 'Paracetamol', 'Paracetamol', '500mg', 'MED-002'),
+            (3, 'Amoxicillin', 'Amoxicillin', '250 mg', 'MED-003'),
+            (4, 'Amoxicillin', 'Amoxicillin', '500 mg', 'MED-004'),
+        ], version=1)
+
+    def test_normalize_folds_case_punctuation_and_strength_spacing(self):
+        self.assertEqual(normalize('  Amoxicillin, 500 MG caps '), 'amoxicillin 500mg caps')
+
+    def test_exact_name_beats_another_medicines_generic_name(self):
+        self.assertEqual(self.index.resolve('paracetamol').medicine_id, 2)
+        self.assertEqual(self.index.resolve('Panadol').medicine_id, 1)
+
+    def test_exact_and_sku_matches_score_one(self):
+        self.assertEqual(self.index.resolve('Amoxicillin 500mg').score, 1.0)
+        match = self.index.resolve('med-003')
+        self.assertEqual((match.medicine_id, match.score), (3, 1.0))
+
+    def test_active_medicine_id_wins_over_the_name(self):
+        self.assertEqual(self.index.resolve('Panadol', medicine_id='3').medicine_id, 3)
+        self.assertEqual(self.index.resolve('Panadol', medicine_id='99').medicine_id, 1)
+
+    def test_matching_strength_lifts_and_conflicting_strength_sinks(self):
+        self.assertEqual(self.index.resolve('amoxicillin caps 500 mg').medicine_id, 4)
+        self.assertEqual(self.index.resolve('amoxicillin caps 250 mg').medicine_id, 3)
+        self.assertIsNone(self.index.resolve('panadol 650mg'))
+
+    def test_fuzzy_match_prefers_the_name_over_a_generic_name(self):
+        self.assertEqual(self.index.resolve('paracetamol tabs').medicine_id, 2)
+        self.assertEqual(self.index.resolve('panadol tablet').medicine_id, 1)
+
+    def test_thresholds(self):
+        self.assertIsNone(self.index.resolve('ibuprofen'))
+        fuzzy = self.index.resolve('panadol tablet')
+        self.assertGreater(fuzzy.score, MIN_SCORE)
+        self.assertLess(fuzzy.score, 1.0)
+        self.assertIsNone(self.index.resolve('panadol tablet', min_score=fuzzy.score))
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+
+    def medicine(self, name='Paracetamol', minimum_stock=5, **fields):
+        return Medicine.objects.create(
+            name=name, sku=name.upper(), selling_price=Decimal('1.00'), cost_price=Decimal('0.40'),
+            minimum_stock=minimum_stock, **fields,
+        )
+
+    def refreshed(self, obj):
+        obj.refresh_from_db()
+        return obj
+
+    def test_every_change_is_in_the_ledger(self):
+        medicine = self.medicine()
+        inventory.receive_stock([(medicine, 20, 'B1', self.today + timedelta(days=30))], reference='PO1')
+        inventory.adjust_stock(medicine, -3, reason='Broken')
+        self.assertEqual(self.refreshed(medicine).stock_quantity, 17)
+        self.assertEqual(
+            list(StockMovement.objects.order_by('pk').values_list('kind', 'quantity', 'reference')),
+            [(inventory.RECEIPT, 20, 'PO1'), (inventory.ADJUSTMENT, -3, 'Broken')],
+        )
+        self.assertEqual(inventory.stock_on(medicine, self.today), 17)
+        self.assertEqual(inventory.stock_on(medicine, self.today - timedelta(days=1)), 0)
+
+    def test_snapshots_hold_the_closing_balance(self):
+        medicine = self.medicine()
+        yesterday = self.today - timedelta(days=1)
+        inventory.receive_stock([(medicine, 8)])
+        StockMovement.objects.update(created_at=timezone.now() - timedelta(days=2))
+        inventory.adjust_stock(medicine, 2)
+        self.assertEqual(inventory.take_snapshots(), 1)
+        self.assertEqual(medicine.stock_snapshots.get(date=yesterday).quantity, 8)
+        self.assertEqual(inventory.stock_on(medicine, yesterday), 8)
+        self.assertEqual(inventory.stock_on(medicine, self.today), 10)
+
+    def test_issues_draw_from_the_earliest_unexpired_lot(self):
+        medicine = self.medicine()
+        inventory.receive_stock([
+            (medicine, 5, 'LATE', self.today + timedelta(days=90)),
+            (medicine, 5, 'SOON', self.today + timedelta(days=10)),
+            (medicine, 5, 'GONE', self.today - timedelta(days=1)),
+        ])
+        lots = inventory.lock_lots([medicine.pk])[medicine.pk]
+        self.assertEqual([lot.batch_number for lot in lots], ['GONE', 'SOON', 'LATE'])
+        allocation = inventory.allocate_fefo(lots, 12)
+        self.assertEqual([(lot and lot.batch_number, quantity) for lot, quantity in allocation], [('SOON', 5), ('LATE', 5), (None, 2)])
+        self.assertEqual([lot.quantity for lot in lots], [5, 0, 0])
+
+    def test_expired_lots_are_written_off(self):
+        medicine = self.medicine()
+        inventory.receive_stock([
+            (medicine, 4, 'GONE', self.today - timedelta(days=1)),
+            (medicine, 6, 'GOOD', self.today + timedelta(days=30)),
+        ])
+        self.assertEqual(inventory.write_off_expired(), 1)
+        self.assertEqual(self.refreshed(medicine).stock_quantity, 6)
+        self.assertEqual(MedicineLot.objects.get(batch_number='GONE').quantity, 0)
+        self.assertEqual(StockMovement.objects.get(kind=inventory.EXPIRY).quantity, -4)
+
+    def test_low_stock_flag_follows_the_balance(self):
+        medicine = self.medicine(minimum_stock=5)
+        inventory.receive_stock([(medicine, 6)])
+        self.assertFalse(self.refreshed(medicine).is_low_stock)
+        inventory.adjust_stock(medicine, -1)
+        self.assertTrue(self.refreshed(medicine).is_low_stock)
+        self.assertEqual(list(inventory.low_stock_medicines()), [medicine])
+        inventory.adjust_stock(medicine, 1)
+        self.assertFalse(self.refreshed(medicine).is_low_stock)
+
+    def test_reorder_queue_groups_by_supplier(self):
+        supplier = Supplier.objects.create(name='Pharmaniaga', phone='03')
+        supplied = self.medicine('Amoxicillin', minimum_stock=10, preferred_supplier=supplier)
+        unsupplied = self.medicine('Cetirizine', minimum_stock=4)
+        self.medicine('Loratadine', minimum_stock=1, stock_quantity=0, is_active=False)
+        inventory.receive_stock([(supplied, 4), (unsupplied, 1)])
+
+        groups = inventory.reorder_queue()
+        self.assertEqual([group['supplier'] for group in groups], [supplier, None])
+        self.assertEqual([(item['medicine'], item['quantity']) for item in groups[0]['items']], [(supplied, 16)])
+        self.assertEqual(groups[0]['total_cost'], Decimal('6.40'))
+        self.assertEqual([(item['medicine'], item['quantity']) for item in groups[1]['items']], [(unsupplied, 7)])
+
+    def test_stock_movements_leave_the_catalogue_cache_alone(self):
+        medicine = self.medicine()
+        with mock.patch.object(master_data, 'bump') as bump, self.captureOnCommitCallbacks(execute=True):
+            inventory.receive_stock([(medicine, 5)])
+            inventory.adjust_stock(medicine, -1)
+        bump.assert_not_called()
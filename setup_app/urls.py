@@ -7,6 +7,8 @@ urlpatterns = [
     path('medicines/', views.medicine_list, name='medicine_list'),
     path('medicines/create/', views.medicine_create, name='medicine_create'),
     path('medicines/<int:pk>/edit/', views.medicine_edit, name='medicine_edit'),
+    path('medicines/expiring/', views.medicine_expiring, name='medicine_expiring'),
+    path('medicines/expiring/write-off/', views.medicine_write_off_expired, name='medicine_write_off_expired'),
     
     path('lab-tests/', views.lab_test_list, name='lab_test_list'),
     path('lab-tests/create/', views.lab_test_create, name='lab_test_create'),
@@ -1,11 +1,16 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, F
+from django.urls import reverse
+from django.utils import timezone
+from django.db.models import Q
 from .models import Medicine, LabTest, Allergy, Disposable, Room, Fee, Panel
 from .forms import MedicineForm, LabTestForm, AllergyForm, DisposableForm, RoomForm, FeeForm, PanelForm
+from . import inventory
 from accounts.models import AuditLog
 from accounts.decorators import admin_or_hq_required, admin_required
+from clinic_management import master_data
+from clinic_management.pagination import paginate, wants_datatables, datatables_response
 
 
 @login_required
@@ -22,18 +27,62 @@ def medicine_list(request):
         )
     
     if show_low_stock:
-        medicines = medicines.filter(stock_quantity__lte=F('minimum_stock'))
+        medicines = medicines.filter(is_low_stock=True)
     
+    if wants_datatables(request):
+        return datatables_response(request, medicines, [
+            ('sku', 'sku', lambda m: m.sku),
+            ('name', 'name', lambda m: m.name),
+            ('generic_name', None, lambda m: m.generic_name),
+            ('form', 'form', lambda m: m.get_form_display()),
+            ('selling_price', 'selling_price', lambda m: str(m.selling_price)),
+            ('stock_quantity', 'stock_quantity', lambda m: m.stock_quantity),
+            ('low_stock', None, lambda m: m.is_low_stock),
+            ('url', None, lambda m: reverse('setup_app:medicine_edit', args=[m.pk])),
+        ], ['name'], search=lambda qs, term: qs.filter(
+            Q(name__icontains=term) | Q(generic_name__icontains=term) | Q(sku__icontains=term)
+        ))
+    medicines = paginate(request, medicines, ['name'])
     return render(request, 'setup/medicine_list.html', {'medicines': medicines, 'query': query})
 
 
+@login_required
+def medicine_expiring(request):
+    try:
+        days = max(int(request.GET.get('days', 90)), 0)
+    except ValueError:
+        days = 90
+    lots = inventory.near_expiry_lots(days)
+    if wants_datatables(request):
+        return datatables_response(request, lots, [
+            ('medicine', None, lambda lot: str(lot.medicine)),
+            ('batch_number', None, lambda lot: lot.batch_number),
+            ('expiry_date', 'expiry_date', lambda lot: lot.expiry_date.isoformat()),
+            ('quantity', None, lambda lot: lot.quantity),
+            ('expired', None, lambda lot: lot.is_expired),
+        ], ['expiry_date'])
+    lots = paginate(request, lots, ['expiry_date'])
+    return render(request, 'setup/medicine_expiring.html', {
+        'lots': lots, 'days': days, 'today': timezone.localdate(),
+    })
+
+
+@login_required
+@admin_or_hq_required
+def medicine_write_off_expired(request):
+    if request.method == 'POST':
+        count = inventory.write_off_expired(user=request.user)
+        messages.success(request, f'{count} expired lot(s) written off.')
+    return redirect('setup_app:medicine_expiring')
+
+
 @login_required
 @admin_or_hq_required
 def medicine_create(request):
     if request.method == 'POST':
         form = MedicineForm(request.POST)
         if form.is_valid():
-            medicine = form.save()
+            medicine = inventory.save_stock_form(form, request.user)
             AuditLog.objects.create(
                 user=request.user,
                 action='create',
@@ -55,7 +104,7 @@ def medicine_edit(request, pk):
     if request.method == 'POST':
         form = MedicineForm(request.POST, instance=medicine)
         if form.is_valid():
-            form.save()
+            inventory.save_stock_form(form, request.user)
             AuditLog.objects.create(
                 user=request.user,
                 action='update',
@@ -72,7 +121,7 @@ def medicine_edit(request, pk):
 
 @login_required
 def lab_test_list(request):
-    lab_tests = LabTest.objects.filter(is_active=True)
+    lab_tests = master_data.lazy('lab_tests')
     return render(request, 'setup/lab_test_list.html', {'lab_tests': lab_tests})
 
 
@@ -107,7 +156,7 @@ def lab_test_edit(request, pk):
 
 @login_required
 def allergy_list(request):
-    allergies = Allergy.objects.filter(is_active=True)
+    allergies = master_data.lazy('allergies')
     return render(request, 'setup/allergy_list.html', {'allergies': allergies})
 
 
@@ -137,7 +186,7 @@ def disposable_create(request):
     if request.method == 'POST':
         form = DisposableForm(request.POST)
         if form.is_valid():
-            form.save()
+            inventory.save_stock_form(form, request.user)
             messages.success(request, 'Disposable item added successfully.')
             return redirect('setup_app:disposable_list')
     else:
@@ -152,7 +201,7 @@ def disposable_edit(request, pk):
     if request.method == 'POST':
         form = DisposableForm(request.POST, instance=disposable)
         if form.is_valid():
-            form.save()
+            inventory.save_stock_form(form, request.user)
             messages.success(request, 'Disposable item updated successfully.')
             return redirect('setup_app:disposable_list')
     else:
@@ -182,7 +231,7 @@ def room_create(request):
 
 @login_required
 def fee_list(request):
-    fees = Fee.objects.filter(is_active=True)
+    fees = master_data.lazy('fees')
     return render(request, 'setup/fee_list.html', {'fees': fees})
 
 
@@ -217,7 +266,7 @@ def fee_edit(request, pk):
 
 @login_required
 def panel_list(request):
-    panels = Panel.objects.filter(is_active=True)
+    panels = master_data.lazy('panels')
     return render(request, 'setup/panel_list.html', {'panels': panels})
 
 
@@ -253,5 +302,16 @@ def panel_edit(request, pk):
 @login_required
 @admin_required
 def audit_log_list(request):
-    logs = AuditLog.objects.all()[:100]
-    return render(request, 'setup/audit_log_list.html', {'logs': logs})
+    logs = AuditLog.objects.select_related('user')
+    if wants_datatables(request):
+        return datatables_response(request, logs, [
+            ('timestamp', 'timestamp', lambda log: timezone.localtime(log.timestamp).strftime('%b %d, %Y %H:%M')),
+            ('user', None, lambda log: (log.user.get_full_name() or log.user.username) if log.user else ''),
+            ('action', 'action', lambda log: log.get_action_display()),
+            ('model_name', 'model_name', lambda log: log.model_name),
+            ('object_id', None, lambda log: log.object_id),
+            ('details', None, lambda log: log.details),
+        ], ['-timestamp'], search=lambda qs, term: qs.filter(
+            Q(model_name__icontains=term) | Q(object_id=term) | Q(user__username__icontains=term)
+        ))
+    return render(request, 'setup/audit_log_list.html')
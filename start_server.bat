@@ -40,6 +40,7 @@ python manage.py migrate --noinput
 if errorlevel 1 (
     echo WARNING: Migration issues detected (continuing anyway)
 )
+python manage.py createcachetable
 echo       Migrations complete!
 echo.
 
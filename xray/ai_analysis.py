@@ -0,0 +1,138 @@
+"""
+AI analysis of X-ray studies.
+
+Runs in an AI worker as the ``xray_analysis`` job (see ``ai.jobs``). The
+``ai_analyze`` view only queues it, so the request returns before the images
+are read or the model is called.
+"""
+import json
+import logging
+
+from django.utils import timezone
+
+from .models import XrayAIAnalysis, XrayStudy
+
+logger = logging.getLogger(__name__)
+
+AI_ANALYSIS_MODEL = 'gemini-2.0-flash'
+JOB_KIND = 'xray_analysis'
+
+SYSTEM_PROMPT = """You are an AI radiology assistant integrated into a clinic information system.
+Your purpose is to support doctors and radiographers in reviewing and interpreting X-ray studies.
+
+IMPORTANT: You do NOT replace a radiologist or doctor. You provide decision support only, never a final diagnosis.
+Always remind the user that your output is preliminary and must be confirmed by a qualified healthcare professional.
+
+For each X-ray case, provide analysis in this exact JSON format:
+{
+    "case_summary": "Brief case summary with patient info and study type",
+    "technical_assessment": "Evaluate image quality - positioning, exposure, coverage, artifacts",
+    "findings": "Detailed systematic review by anatomical region with normal and abnormal findings",
+    "impression": "1-3 most likely diagnoses or main concerns",
+    "recommendations": "Non-prescriptive follow-up suggestions",
+    "red_flags": ["List of any urgent/red-flag findings"],
+    "confidence_level": "high/medium/low"
+}
+
+Be systematic, thorough, and always err on the side of caution."""
+
+
+def job_reference(study):
+    return f'xray_study:{study.pk}'
+
+
+def _case_info(study):
+    patient = study.patient
+    return f"""
+Patient Information:
+- Age: {patient.age if hasattr(patient, 'age') else 'Unknown'}
+- Sex: {patient.gender if hasattr(patient, 'gender') else 'Unknown'}
+
+Study Information:
+- Body Region: {study.get_body_region_display()}
+- View Type: {study.get_view_type_display()}
+- Side: {study.get_side_display()}
+- Priority: {study.get_priority_display()}
+
+Clinical Indication: {study.clinical_indication}
+Clinical History: {study.clinical_history or 'Not provided'}
+
+Please analyze the attached X-ray image(s) and provide your assessment.
+"""
+
+
+def _image_parts(study):
+    from google.genai import types
+
+    parts = []
+    for img in study.images.all():
+        ext = img.image.name.split('.')[-1].lower()
+        mime_type = {'png': 'image/png', 'gif': 'image/gif'}.get(ext, 'image/jpeg')
+        try:
+            with img.image.open('rb') as f:
+                parts.append(types.Part.from_bytes(data=f.read(), mime_type=mime_type))
+        except Exception as e:
+            logger.warning('Could not load X-ray image %s: %s', img.pk, e)
+    return parts
+
+
+def _parse(response_text):
+    try:
+        if '```json' in response_text:
+            response_text = response_text.split('```json')[1].split('```')[0].strip()
+        elif '```' in response_text:
+            response_text = response_text.split('```')[1].split('```')[0].strip()
+        return json.loads(response_text)
+    except json.JSONDecodeError:
+        return {
+            'case_summary': '',
+            'technical_assessment': '',
+            'findings': response_text,
+            'impression': '',
+            'recommendations': '',
+            'red_flags': [],
+            'confidence_level': 'medium'
+        }
+
+
+def analyze_study(payload, user=None):
+    """Job handler: analyse the study's images and store an ``XrayAIAnalysis``."""
+    from google.genai import types
+    from ai import clients
+
+    client = clients.for_model(AI_ANALYSIS_MODEL)
+    if client is None:
+        raise RuntimeError('AI analysis is not configured (GEMINI_API_KEY is not set).')
+
+    study = XrayStudy.objects.select_related('patient').get(pk=payload['study_id'])
+    images = _image_parts(study)
+    if not images:
+        raise RuntimeError('None of the uploaded X-ray images could be read.')
+
+    response = client.generate_content(
+        [_case_info(study)] + images,
+        config=types.GenerateContentConfig(
+            system_instruction=SYSTEM_PROMPT,
+            temperature=0.3,
+            max_output_tokens=2000,
+        )
+    )
+    analysis_data = _parse(response.text)
+
+    ai_analysis, created = XrayAIAnalysis.objects.update_or_create(
+        study=study,
+        defaults={
+            'case_summary': analysis_data.get('case_summary', ''),
+            'technical_assessment': analysis_data.get('technical_assessment', ''),
+            'findings': analysis_data.get('findings', ''),
+            'impression': analysis_data.get('impression', ''),
+            'recommendations': analysis_data.get('recommendations', ''),
+            'red_flags': analysis_data.get('red_flags', []),
+            'confidence_level': analysis_data.get('confidence_level', 'medium'),
+            'raw_response': response.text,
+        }
+    )
+    XrayStudy.objects.filter(pk=study.pk, status__in=['pending', 'in_progress']).update(
+        status='ai_analyzed', updated_at=timezone.now(),
+    )
+    return {'success': True, 'analysis_id': ai_analysis.pk}
@@ -1,6 +1,7 @@
 from django import forms
 from .models import XrayStudy, XrayImage, XrayDocument, XrayReport
 from patients.models import Patient
+from patients.autocomplete import PatientChoiceField
 
 
 class XrayStudyForm(forms.ModelForm):
@@ -13,12 +14,13 @@ class XrayStudyForm(forms.ModelForm):
         })
     )
     
+    patient = PatientChoiceField()
+
     class Meta:
         model = XrayStudy
         fields = ['patient', 'body_region', 'view_type', 'side', 'clinical_indication', 
                   'clinical_history', 'priority', 'notes']
         widgets = {
-            'patient': forms.Select(attrs={'class': 'form-select'}),
             'body_region': forms.Select(attrs={'class': 'form-select'}),
             'view_type': forms.Select(attrs={'class': 'form-select'}),
             'side': forms.Select(attrs={'class': 'form-select'}),